@@ -0,0 +1,95 @@
+"""
+المحلل النصي المشترك بين بناء الفهرس والبحث.
+
+نفس الخطوات تُطبق على فقرات الكتاب وعلى الاستعلامات:
+  إزالة التشكيل، توحيد الألف والياء، حذف التطويل وعلامات الترقيم،
+  تحويل الحروف اللاتينية للصغيرة، التقطيع، وتجذيع خفيف اختياري.
+
+كل فهرس يسجل إصدار المحلل الذي بناه (meta.json)، ويستخدم البحث نفس الإصدار؛
+فهرس بإصدار لا يعرفه هذا الكود يُرفض عند التحميل بدلاً من أن تسوء النتائج بصمت.
+"""
+import re
+from functools import lru_cache
+
+ANALYZER_VERSION = 1
+LEGACY_VERSION = 0  # normalize_arabic القديمة + نمط TfidfVectorizer (فهارس ما قبل هذا المحلل)
+SUPPORTED_VERSIONS = (LEGACY_VERSION, ANALYZER_VERSION)
+QUERY_CACHE_SIZE = 4096
+
+
+class AnalyzerMismatchError(RuntimeError):
+    pass
+
+
+_DIACRITICS_LEGACY = re.compile(r'[\u064B-\u065F]')
+_DIACRITICS = re.compile(r'[\u064B-\u065F\u0670]')
+_ALEF_LEGACY = re.compile(r'[إأآ]')
+_ALEF = re.compile(r'[إأآ\u0671]')
+_YAA = re.compile(r'ى')
+_TATWEEL = re.compile(r'\u0640')
+_PUNCT = re.compile(r'[^\w\s]|_')
+_TOKEN = re.compile(r"(?u)\b\w\w+\b")
+
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_SUFFIXES = ("ها", "ان", "ات", "ون", "ين", "يه", "ية", "ه", "ة", "ي")
+
+
+def normalize_arabic(text):
+    """التطبيع الأصلي للفهارس القديمة (الإصدار 0)."""
+    text = _DIACRITICS_LEGACY.sub('', text)
+    text = _ALEF_LEGACY.sub('ا', text)
+    text = _YAA.sub('ي', text)
+    return text
+
+
+def normalize(text, version=ANALYZER_VERSION):
+    if version == LEGACY_VERSION: return normalize_arabic(text)
+    text = _DIACRITICS.sub('', text)
+    text = _TATWEEL.sub('', text)
+    text = _ALEF.sub('ا', text)
+    text = _YAA.sub('ي', text)
+    return _PUNCT.sub(' ', text)
+
+
+def light_stem(token):
+    """تجذيع خفيف (على نمط Light10): حذف و/أل التعريف في البداية وبعض اللواحق الشائعة."""
+    if token.startswith("و") and len(token) > 3: token = token[1:]
+    for p in _PREFIXES:
+        if token.startswith(p) and len(token) - len(p) >= 2:
+            token = token[len(p):]
+            break
+    for s in _SUFFIXES:
+        if token.endswith(s) and len(token) - len(s) >= 2:
+            token = token[:-len(s)]
+    return token
+
+
+def tokenize(text, version=ANALYZER_VERSION, stem=False):
+    tokens = _TOKEN.findall(normalize(str(text), version).lower())
+    if stem and version != LEGACY_VERSION:
+        tokens = [t for t in (light_stem(t) for t in tokens) if len(t) > 1]
+    return tokens
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def analyze_query(query, version=ANALYZER_VERSION, stem=False):
+    """مصطلحات الاستعلام بعد التحليل (مع ذاكرة LRU لأن أسماء المفاهيم تتكرر كثيراً)."""
+    return tuple(tokenize(query, version, stem))
+
+
+def config(stem=False):
+    """إعدادات المحلل كما تُسجل في meta.json للفهرس."""
+    return {"version": ANALYZER_VERSION, "stem": bool(stem)}
+
+
+def check_config(cfg, source=""):
+    cfg = cfg or {"version": LEGACY_VERSION, "stem": False}
+    if cfg.get("version") not in SUPPORTED_VERSIONS:
+        raise AnalyzerMismatchError(
+            f"{source}: built with analyzer v{cfg.get('version')}, this code supports "
+            f"{SUPPORTED_VERSIONS}; rebuild the index with build_index.py --full"
+        )
+    if cfg.get("version") != ANALYZER_VERSION:
+        print(f"⚠️ {source}: built with analyzer v{cfg.get('version')} "
+              f"(current v{ANALYZER_VERSION}); rebuild with build_index.py --full for better matching")
+    return cfg
@@ -0,0 +1,464 @@
+"""
+سجل المحاولات (SQLite بوضع WAL في reports/) بدلاً من ملفات CSV تُقرأ وتُعاد كتابتها كاملة.
+
+الجداول:
+  attempts         محاولة لكل صف (كأعمدة attempts.csv) مع attempt_id
+  concept_history  نتيجة كل سؤال حسب المفهوم (كأعمدة concept_history.csv)
+  answers          الإجابات الخام لإعادة التصحيح (كأعمدة answers_log.csv)
+  summary          ملخص الطالب يُحدّث تزايدياً: عدد المحاولات، أعلى نتيجة، أول وآخر نتيجة، مجموع الزمن
+  concept_stats            عدد الإجابات والصحيح منها لكل (مفهوم، فصل)، يُحدّث مع كل تسليم
+  student_concept_stats    نفس التجميع لكل طالب
+  chapter_summary  ملخص الطالب لكل فصل (بمعرفي أول وآخر محاولة) لعرض السجلات مفلترة بالفصول
+  student_names / student_grams   فهرس أسماء الطلاب: الاسم بعد التطبيع ومقاطعه الثنائية والثلاثية،
+                                  للبحث بجزء من الاسم دون مسح جدول الملخص كله
+
+كل تسليم معاملة واحدة (المحاولة وصفوف المفاهيم والإجابات والملخص معاً)، فلا يضيع
+صف أو يتلف الملخص عند تسليم طالبين في نفس اللحظة. كل كتابة ترفع رقم الإصدار
+(version) فتعرف الذاكرات المؤقتة أن البيانات تغيرت.
+
+ترحيل ملفات reports/*.csv القديمة يتم تلقائياً عند أول فتح لقاعدة فارغة، أو يدوياً:
+  python attempt_store.py --migrate     |     python attempt_store.py --export (للتدقيق بصيغة CSV)
+  python attempt_store.py --rebuild-stats   (إعادة حساب الملخصات وإحصاءات المفاهيم من السجل الخام)
+"""
+import os
+import time
+import uuid
+import argparse
+
+import pandas as pd
+
+import storage
+from analyzer import normalize
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORTS_DIR = os.path.join(BASE_DIR, "reports")
+STORE_PATH = os.path.join(REPORTS_DIR, "attempts.sqlite")
+
+ATTEMPT_COLUMNS = ["student", "chapter", "attempt", "total", "correct", "accuracy", "weak_concepts",
+                   "time_sec", "attempt_id"]
+CONCEPT_COLUMNS = ["student", "chapter", "attempt", "concept", "correct", "total", "accuracy", "attempt_id"]
+ANSWER_COLUMNS = ["attempt_id", "student", "chapter", "attempt", "question_id", "concept", "answer", "is_correct"]
+SUMMARY_COLUMNS = ["student", "best_accuracy", "last_accuracy", "improvement_pct", "avg_time_sec"]
+RECORD_COLUMNS = ["student", "n_attempts"] + SUMMARY_COLUMNS[1:]
+MIGRATE_CHUNK_ROWS = 200_000
+CSV_FILES = {"attempts": "attempts.csv", "concept_history": "concept_history.csv",
+             "answers": "answers_log.csv", "summary": "students_summary.csv"}
+
+# chapter بنوع NUMERIC حتى يبقى رقماً كما في ملفات CSV الأصلية ("1" تُخزن 1)
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS attempts (
+        id INTEGER PRIMARY KEY, attempt_id TEXT UNIQUE, student TEXT NOT NULL, chapter NUMERIC,
+        attempt INTEGER, total INTEGER, correct INTEGER, accuracy REAL, weak_concepts TEXT,
+        time_sec REAL, created REAL)""",
+    "CREATE INDEX IF NOT EXISTS attempts_student ON attempts(student)",
+    """CREATE TABLE IF NOT EXISTS concept_history (
+        id INTEGER PRIMARY KEY, attempt_id TEXT, student TEXT NOT NULL, chapter NUMERIC, attempt INTEGER,
+        concept TEXT, correct INTEGER, total INTEGER, accuracy REAL)""",
+    "CREATE INDEX IF NOT EXISTS concept_history_attempt ON concept_history(attempt_id)",
+    """CREATE TABLE IF NOT EXISTS answers (
+        id INTEGER PRIMARY KEY, attempt_id TEXT NOT NULL, student TEXT NOT NULL, chapter NUMERIC,
+        attempt INTEGER, question_id TEXT, concept TEXT, answer TEXT, is_correct INTEGER)""",
+    "CREATE INDEX IF NOT EXISTS answers_attempt ON answers(attempt_id)",
+    """CREATE TABLE IF NOT EXISTS summary (
+        student TEXT PRIMARY KEY, n_attempts INTEGER NOT NULL, best_accuracy REAL, first_accuracy REAL,
+        last_accuracy REAL, total_time_sec REAL)""",
+    """CREATE TABLE IF NOT EXISTS concept_stats (
+        concept TEXT NOT NULL, chapter NUMERIC NOT NULL, attempts INTEGER NOT NULL, correct INTEGER NOT NULL,
+        PRIMARY KEY (concept, chapter)) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS student_concept_stats (
+        student TEXT NOT NULL, concept TEXT NOT NULL, chapter NUMERIC NOT NULL, attempts INTEGER NOT NULL,
+        correct INTEGER NOT NULL, PRIMARY KEY (student, concept, chapter)) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS chapter_summary (
+        student TEXT NOT NULL, chapter NUMERIC NOT NULL, n_attempts INTEGER NOT NULL, best_accuracy REAL,
+        first_id INTEGER, first_accuracy REAL, last_id INTEGER, last_accuracy REAL, total_time_sec REAL,
+        PRIMARY KEY (student, chapter)) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS chapter_summary_chapter ON chapter_summary(chapter)",
+    "CREATE TABLE IF NOT EXISTS student_names (student TEXT PRIMARY KEY, name_norm TEXT NOT NULL) WITHOUT ROWID",
+    """CREATE TABLE IF NOT EXISTS student_grams (
+        gram TEXT NOT NULL, student TEXT NOT NULL, PRIMARY KEY (gram, student)) WITHOUT ROWID""",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+_UPSERT_SUMMARY = """
+    INSERT INTO summary (student, n_attempts, best_accuracy, first_accuracy, last_accuracy, total_time_sec)
+    VALUES (?, 1, ?, ?, ?, ?)
+    ON CONFLICT(student) DO UPDATE SET
+        n_attempts = n_attempts + 1,
+        best_accuracy = MAX(best_accuracy, excluded.best_accuracy),
+        last_accuracy = excluded.last_accuracy,
+        total_time_sec = total_time_sec + excluded.total_time_sec"""
+
+_UPSERT_CONCEPT = """
+    INSERT INTO concept_stats (concept, chapter, attempts, correct) VALUES (?, ?, ?, ?)
+    ON CONFLICT(concept, chapter) DO UPDATE SET
+        attempts = attempts + excluded.attempts, correct = correct + excluded.correct"""
+
+_UPSERT_STUDENT_CONCEPT = """
+    INSERT INTO student_concept_stats (student, concept, chapter, attempts, correct) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(student, concept, chapter) DO UPDATE SET
+        attempts = attempts + excluded.attempts, correct = correct + excluded.correct"""
+
+_UPSERT_CHAPTER_SUMMARY = """
+    INSERT INTO chapter_summary (student, chapter, n_attempts, best_accuracy, first_id, first_accuracy,
+                                 last_id, last_accuracy, total_time_sec)
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(student, chapter) DO UPDATE SET
+        n_attempts = n_attempts + 1,
+        best_accuracy = MAX(best_accuracy, excluded.best_accuracy),
+        last_id = excluded.last_id, last_accuracy = excluded.last_accuracy,
+        total_time_sec = total_time_sec + excluded.total_time_sec"""
+
+_BUMP_VERSION = """
+    INSERT INTO meta (key, value) VALUES ('version', '1')
+    ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"""
+
+SORTABLE = set(RECORD_COLUMNS)
+
+
+def normalize_name(name):
+    """صيغة البحث للاسم: تطبيع المحلل (تشكيل، ألف، ياء، تطويل) وحروف صغيرة ومسافات مفردة."""
+    return " ".join(normalize(str(name)).lower().split())
+
+
+def name_grams(text):
+    """المقاطع الثنائية والثلاثية للنص (بعد التطبيع)."""
+    return {text[i:i + n] for n in (2, 3) for i in range(len(text) - n + 1)}
+
+
+def _query_grams(text):
+    """مقاطع الاستعلام التي يجب أن يحويها الاسم كلها: الثلاثية، أو الاستعلام نفسه إن كان حرفين."""
+    if len(text) >= 3: return {text[i:i + 3] for i in range(len(text) - 2)}
+    return {text} if len(text) == 2 else set()
+
+
+def _insert(conn, table, df, columns):
+    if df is None or df.empty: return
+    df = df.reindex(columns=columns)
+    df = df.astype(object).where(df.notna(), None)
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                     df.itertuples(index=False, name=None))
+
+
+class AttemptStore:
+    def __init__(self, path=STORE_PATH, migrate_from=REPORTS_DIR):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = storage.connect(path)
+        for stmt in SCHEMA: conn.execute(stmt)
+        if migrate_from and not self._migrated():
+            self.migrate_csv(migrate_from)
+        if not conn.execute("SELECT 1 FROM meta WHERE key = 'concept_stats'").fetchone():
+            self.rebuild_stats()  # قاعدة أنشئت قبل إضافة جداول الإحصاء
+        if not conn.execute("SELECT 1 FROM meta WHERE key = 'records_index'").fetchone():
+            self.rebuild_records_index()  # قاعدة أنشئت قبل إضافة فهرس السجلات
+
+    def _migrated(self):
+        return storage.connect(self.path).execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone() is not None
+
+    # ----------------------------- الكتابة ----------------------------- #
+
+    def record_attempt(self, student, chapter, attempt, summary, time_sec):
+        """يسجل تسليماً كاملاً في معاملة واحدة ويعيد attempt_id."""
+        attempt_id = uuid.uuid4().hex[:12]
+        acc = float(summary['accuracy'])
+        details = summary['details']
+        conn = storage.connect(self.path)
+        with storage.transaction(conn):
+            row_id = conn.execute("""
+                INSERT INTO attempts (attempt_id, student, chapter, attempt, total, correct, accuracy,
+                                      weak_concepts, time_sec, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (attempt_id, student, chapter, attempt, int(summary['total']), int(summary['correct']), acc,
+                 ";".join(map(str, summary['weak_concepts'])), float(time_sec), time.time())).lastrowid
+            conn.executemany("""
+                INSERT INTO concept_history (attempt_id, student, chapter, attempt, concept, correct, total, accuracy)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?)""",
+                [(attempt_id, student, chapter, attempt, str(d['concept']), int(bool(d['is_correct'])),
+                  100 if d['is_correct'] else 0) for d in details])
+            conn.executemany("""
+                INSERT INTO answers (attempt_id, student, chapter, attempt, question_id, concept, answer, is_correct)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(attempt_id, student, chapter, attempt, None if d.get('question_id') is None else str(d['question_id']),
+                  str(d['concept']), str(d['user_ans']), int(bool(d['is_correct']))) for d in details])
+            conn.execute(_UPSERT_SUMMARY, (student, acc, acc, acc, float(time_sec)))
+            conn.execute(_UPSERT_CHAPTER_SUMMARY, (student, chapter, acc, row_id, acc, row_id, acc, float(time_sec)))
+            self._index_names(conn, [student])
+            counts = {}
+            for d in details:
+                c = counts.setdefault(str(d['concept']), [0, 0])
+                c[0] += 1
+                c[1] += int(bool(d['is_correct']))
+            conn.executemany(_UPSERT_CONCEPT, [(c, chapter, n, k) for c, (n, k) in counts.items()])
+            conn.executemany(_UPSERT_STUDENT_CONCEPT, [(student, c, chapter, n, k) for c, (n, k) in counts.items()])
+            conn.execute(_BUMP_VERSION)
+        return attempt_id
+
+    def rebuild_summary(self, student=None, conn=None):
+        """يعيد حساب الملخص من جدول المحاولات (لطالب واحد أو للجميع)، مثلاً بعد إعادة التصحيح."""
+        where, params = ("WHERE student = ?", (student,)) if student else ("", ())
+        sql_delete = f"DELETE FROM summary {where}"
+        sql_insert = f"""
+            INSERT INTO summary (student, n_attempts, best_accuracy, first_accuracy, last_accuracy, total_time_sec)
+            SELECT student, COUNT(*), MAX(accuracy),
+                   (SELECT a2.accuracy FROM attempts a2 WHERE a2.student = a.student ORDER BY a2.id LIMIT 1),
+                   (SELECT a2.accuracy FROM attempts a2 WHERE a2.student = a.student ORDER BY a2.id DESC LIMIT 1),
+                   SUM(time_sec)
+            FROM attempts a {where} GROUP BY student"""
+        def run(conn):
+            conn.execute(sql_delete, params)
+            conn.execute(sql_insert, params)
+            self._rebuild_chapter_summary(conn, where, params)
+            conn.execute(_BUMP_VERSION)
+
+        if conn is not None: return run(conn)
+        conn = storage.connect(self.path)
+        with storage.transaction(conn): run(conn)
+
+    def _rebuild_chapter_summary(self, conn, where="", params=()):
+        conn.execute(f"DELETE FROM chapter_summary {where}", params)
+        conn.execute(f"""
+            WITH g AS (SELECT student, chapter, COUNT(*) AS n, MAX(accuracy) AS best, MIN(id) AS fid,
+                              MAX(id) AS lid, SUM(time_sec) AS tt
+                       FROM attempts {where} GROUP BY student, chapter)
+            INSERT INTO chapter_summary (student, chapter, n_attempts, best_accuracy, first_id, first_accuracy,
+                                         last_id, last_accuracy, total_time_sec)
+            SELECT g.student, COALESCE(g.chapter, ''), g.n, g.best, g.fid, f.accuracy, g.lid, l.accuracy, g.tt
+            FROM g JOIN attempts f ON f.id = g.fid JOIN attempts l ON l.id = g.lid""", params)
+
+    def _index_names(self, conn, students):
+        """يضيف الطلاب الجدد إلى فهرس الأسماء (الموجودون يُتجاوزون بتكلفة بحث واحد في المفتاح)."""
+        for student in students:
+            name = normalize_name(student)
+            if conn.execute("INSERT OR IGNORE INTO student_names (student, name_norm) VALUES (?, ?)",
+                            (student, name)).rowcount:
+                conn.executemany("INSERT OR IGNORE INTO student_grams (gram, student) VALUES (?, ?)",
+                                 [(g, student) for g in name_grams(name)])
+
+    def rebuild_records_index(self, conn=None):
+        """يعيد بناء ملخص الفصول وفهرس الأسماء من جدولي المحاولات والملخص."""
+        def run(conn):
+            self._rebuild_chapter_summary(conn)
+            conn.execute("DELETE FROM student_names")
+            conn.execute("DELETE FROM student_grams")
+            self._index_names(conn, [r[0] for r in conn.execute("SELECT student FROM summary")])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('records_index', ?)", (str(time.time()),))
+            conn.execute(_BUMP_VERSION)
+
+        if conn is not None: return run(conn)
+        conn = storage.connect(self.path)
+        with storage.transaction(conn): run(conn)
+
+    def rebuild_stats(self, conn=None):
+        """يعيد حساب جداول إحصاء المفاهيم من concept_history الخام."""
+        def run(conn):
+            conn.execute("DELETE FROM concept_stats")
+            conn.execute("DELETE FROM student_concept_stats")
+            conn.execute("""
+                INSERT INTO concept_stats (concept, chapter, attempts, correct)
+                SELECT concept, COALESCE(chapter, ''), COUNT(correct), COALESCE(SUM(correct), 0)
+                FROM concept_history WHERE concept IS NOT NULL GROUP BY concept, COALESCE(chapter, '')""")
+            conn.execute("""
+                INSERT INTO student_concept_stats (student, concept, chapter, attempts, correct)
+                SELECT student, concept, COALESCE(chapter, ''), COUNT(correct), COALESCE(SUM(correct), 0)
+                FROM concept_history WHERE concept IS NOT NULL GROUP BY student, concept, COALESCE(chapter, '')""")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('concept_stats', ?)", (str(time.time()),))
+            conn.execute(_BUMP_VERSION)
+
+        if conn is not None: return run(conn)
+        conn = storage.connect(self.path)
+        with storage.transaction(conn): run(conn)
+
+    def apply_regrade(self, answers, per_attempt):
+        """
+        يكتب نتيجة إعادة التصحيح في معاملة واحدة: is_correct للإجابات، وأعمدة المحاولات
+        (total, correct, accuracy, weak_concepts) من per_attempt (فهرسه attempt_id)،
+        وصفوف المفاهيم لتلك المحاولات، ثم الملخص كاملاً.
+        """
+        conn = storage.connect(self.path)
+        ids = list(per_attempt.index)
+        with storage.transaction(conn):
+            conn.executemany("UPDATE answers SET is_correct = ? WHERE id = ?",
+                             zip(answers['is_correct'].astype(int).tolist(), answers['id'].astype(int).tolist()))
+            conn.executemany("UPDATE attempts SET total = ?, correct = ?, accuracy = ?, weak_concepts = ? "
+                             "WHERE attempt_id = ?",
+                             [(int(r.total), int(r.correct), float(r.accuracy), r.weak_concepts, aid)
+                              for aid, r in zip(ids, per_attempt.itertuples())])
+            conn.executemany("DELETE FROM concept_history WHERE attempt_id = ?", [(i,) for i in ids])
+            rows = answers[answers['attempt_id'].isin(ids)]
+            conn.executemany("""
+                INSERT INTO concept_history (attempt_id, student, chapter, attempt, concept, correct, total, accuracy)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?)""",
+                [(r.attempt_id, r.student, r.chapter, int(r.attempt), r.concept, int(r.is_correct),
+                  100 * int(r.is_correct)) for r in rows.itertuples()])
+            self.rebuild_summary(conn=conn)
+            self.rebuild_stats(conn=conn)
+
+    # ----------------------------- القراءة ----------------------------- #
+
+    def version(self):
+        """رقم يزيد مع كل كتابة (تسليم، إعادة تصحيح، إعادة حساب)؛ مفتاح للذاكرات المؤقتة."""
+        row = storage.connect(self.path).execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _query(self, sql, params=(), columns=None):
+        df = pd.read_sql_query(sql, storage.connect(self.path), params=params)
+        return df if columns is None else df[columns]
+
+    def attempts(self, student=None):
+        where, params = ("WHERE student = ?", (student,)) if student else ("", ())
+        return self._query(f"SELECT {', '.join(ATTEMPT_COLUMNS)} FROM attempts {where} ORDER BY id", params)
+
+    def concept_history(self):
+        return self._query(f"SELECT {', '.join(CONCEPT_COLUMNS)} FROM concept_history ORDER BY id")
+
+    def answers(self, with_row_id=False):
+        cols = (["id"] if with_row_id else []) + ANSWER_COLUMNS
+        return self._query(f"SELECT {', '.join(cols)} FROM answers ORDER BY id")
+
+    def summary(self):
+        return self._query("""
+            SELECT student, best_accuracy, last_accuracy, last_accuracy - first_accuracy AS improvement_pct,
+                   total_time_sec / n_attempts AS avg_time_sec
+            FROM summary ORDER BY rowid""")
+
+    def concept_stats(self, chapters=None, student=None):
+        """
+        (concept, total_attempts, correct, success_rate %) مجمّعة من جداول الإحصاء،
+        لفصول محددة و/أو لطالب واحد. حجم الاستعلام بعدد المفاهيم لا بطول السجل.
+        """
+        table, where, params = "concept_stats", [], []
+        if student is not None:
+            table = "student_concept_stats"
+            where.append("student = ?")
+            params.append(student)
+        if chapters is not None:
+            chapters = list(chapters)
+            if not chapters: return pd.DataFrame(columns=["concept", "total_attempts", "correct", "success_rate"])
+            where.append(f"chapter IN ({', '.join('?' * len(chapters))})")
+            params.extend(chapters)
+        df = self._query(f"""
+            SELECT concept, SUM(attempts) AS total_attempts, SUM(correct) AS correct
+            FROM {table} {"WHERE " + " AND ".join(where) if where else ""}
+            GROUP BY concept ORDER BY concept""", params)
+        df['success_rate'] = df['correct'] * 100.0 / df['total_attempts'].where(df['total_attempts'] > 0)
+        return df
+
+    def student_records(self, search="", chapters=None, sort_by="last_accuracy", ascending=False,
+                        offset=0, limit=25):
+        """
+        صفحة من سجلات الطلاب (RECORD_COLUMNS) وعدد الطلاب المطابقين كله: (DataFrame، العدد).
+
+        search: جزء من الاسم في أي موضع (بعد التطبيع)، يُضيّق بفهرس المقاطع ثم يُتحقق منه.
+        chapters: عند تحديدها تُحسب الأعمدة من محاولات هذه الفصول فقط (آخر درجة = آخر محاولة فيها).
+        الترتيب والتقطيع في SQLite، فلا يُنقل إلى بايثون إلا صفوف الصفحة.
+        """
+        if sort_by not in SORTABLE: raise ValueError(f"Unknown sort column: {sort_by}")
+        if chapters is not None:
+            chapters = list(chapters)
+            if not chapters: return pd.DataFrame(columns=RECORD_COLUMNS), 0
+
+        # فلتر الاسم يُطبق داخل المصدر حتى لا يُجمّع إلا الطلاب المطابقون
+        name_filter, name_params = "1", []
+        text = normalize_name(search or "")
+        if text:
+            grams = sorted(_query_grams(text))
+            gram_filter = f"""AND n.student IN (
+                SELECT student FROM student_grams WHERE gram IN ({', '.join('?' * len(grams))})
+                GROUP BY student HAVING COUNT(*) = ?)""" if grams else ""
+            name_filter = f"""student IN (
+                SELECT n.student FROM student_names n WHERE instr(n.name_norm, ?) > 0 {gram_filter})"""
+            name_params = [text, *grams, *([len(grams)] if grams else [])]
+
+        if chapters is None:
+            source, params = f"""
+                SELECT student, n_attempts, best_accuracy, last_accuracy,
+                       last_accuracy - first_accuracy AS improvement_pct, total_time_sec / n_attempts AS avg_time_sec
+                FROM summary WHERE {name_filter}""", name_params
+        else:
+            source = f"""
+                WITH c AS (SELECT * FROM chapter_summary
+                           WHERE chapter IN ({', '.join('?' * len(chapters))}) AND {name_filter}),
+                     g AS (SELECT student, SUM(n_attempts) AS n, MAX(best_accuracy) AS best, MIN(first_id) AS fid,
+                                  MAX(last_id) AS lid, SUM(total_time_sec) AS tt FROM c GROUP BY student)
+                SELECT g.student, g.n AS n_attempts, g.best AS best_accuracy, l.last_accuracy,
+                       l.last_accuracy - f.first_accuracy AS improvement_pct, g.tt / g.n AS avg_time_sec
+                FROM g JOIN c f ON f.student = g.student AND f.first_id = g.fid
+                       JOIN c l ON l.student = g.student AND l.last_id = g.lid"""
+            params = [*chapters, *name_params]
+
+        conn = storage.connect(self.path)
+        total = conn.execute(f"SELECT COUNT(*) FROM ({source}) r", params).fetchone()[0]
+        page = self._query(f"""
+            SELECT * FROM ({source}) r
+            ORDER BY r.{sort_by} IS NULL, r.{sort_by} {"ASC" if ascending else "DESC"}, r.student
+            LIMIT ? OFFSET ?""", [*params, int(limit), int(offset)], RECORD_COLUMNS)
+        return page, total
+
+    # ----------------------------- الترحيل والتصدير ----------------------------- #
+
+    def migrate_csv(self, reports_dir=REPORTS_DIR):
+        """يستورد reports/*.csv إلى قاعدة فارغة (مرة واحدة) ويعيد عدد الصفوف لكل جدول."""
+        def read(name, chunksize=None):
+            path = os.path.join(reports_dir, CSV_FILES[name])
+            if not (os.path.exists(path) and os.path.getsize(path)): return [] if chunksize else pd.DataFrame()
+            return pd.read_csv(path, dtype={"attempt_id": str, "question_id": str, "answer": str}, chunksize=chunksize)
+
+        conn = storage.connect(self.path)
+        counts = {}
+        with storage.transaction(conn):
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone(): return counts
+            # السجلات تُقرأ وتُدرج دفعة دفعة حتى لا يُحمّل سجل سنوات كاملاً في الذاكرة
+            for name, columns in (("attempts", ATTEMPT_COLUMNS), ("concept_history", CONCEPT_COLUMNS),
+                                  ("answers", ANSWER_COLUMNS)):
+                counts[name] = 0
+                for chunk in read(name, MIGRATE_CHUNK_ROWS):
+                    _insert(conn, name, chunk, columns)
+                    counts[name] += len(chunk)
+            self.rebuild_summary(conn=conn)
+            self.rebuild_stats(conn=conn)
+            # طلاب في ملف الملخص بلا محاولات مسجلة يُنقلون كما هم
+            summary = read("summary")
+            if not summary.empty:
+                known = {r[0] for r in conn.execute("SELECT student FROM summary")}
+                extra = summary[~summary['student'].isin(known)]
+                conn.executemany(
+                    "INSERT INTO summary (student, n_attempts, best_accuracy, first_accuracy, last_accuracy, "
+                    "total_time_sec) VALUES (?, 1, ?, ?, ?, ?)",
+                    [(r.student, r.best_accuracy, r.last_accuracy - r.improvement_pct, r.last_accuracy, r.avg_time_sec)
+                     for r in extra.itertuples()])
+            self.rebuild_records_index(conn=conn)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (str(time.time()),))
+        if any(counts.values()): print(f"Attempt store: imported {counts} from {reports_dir}")
+        return counts
+
+    def export_csv(self, reports_dir=REPORTS_DIR):
+        """يكتب الجداول بصيغة ملفات CSV الأصلية (للتدقيق والتصدير)."""
+        os.makedirs(reports_dir, exist_ok=True)
+        self.attempts().to_csv(os.path.join(reports_dir, CSV_FILES["attempts"]), index=False)
+        self.concept_history().to_csv(os.path.join(reports_dir, CSV_FILES["concept_history"]), index=False)
+        self.answers().to_csv(os.path.join(reports_dir, CSV_FILES["answers"]), index=False)
+        self.summary().to_csv(os.path.join(reports_dir, CSV_FILES["summary"]), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attempt store maintenance")
+    parser.add_argument("--migrate", action="store_true", help="import reports/*.csv into an empty store")
+    parser.add_argument("--export", action="store_true", help="write the store back to reports/*.csv")
+    parser.add_argument("--rebuild-stats", action="store_true",
+                        help="recompute student summaries and concept statistics from the raw history")
+    parser.add_argument("--path", default=STORE_PATH)
+    args = parser.parse_args()
+
+    store = AttemptStore(args.path, migrate_from=REPORTS_DIR if args.migrate else None)
+    if args.rebuild_stats:
+        t0 = time.perf_counter()
+        store.rebuild_summary()
+        store.rebuild_stats()
+        store.rebuild_records_index()
+        print(f"Rebuilt summaries and concept statistics in {time.perf_counter() - t0:.2f}s")
+    if args.export: store.export_csv()
+    print(store.summary().describe().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""أدوات قياس أداء EduRAG. تُشغّل كوحدات: python -m benchmarks.<name>"""
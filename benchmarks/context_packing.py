@@ -0,0 +1,73 @@
+"""
+تعبئة السياق بميزانية رموز (rag_core.pack_context) مقابل القص القديم لأول 800 حرف.
+
+لكل مفهوم في بنك الأسئلة (أو --concepts) تُسترجع الفقرات كما في الشرح، ثم يُقاس للطريقتين:
+  prompt_tokens     رموز برومبت الشرح (تقدير llm_gateway) — التكلفة وزمن الاستجابة
+  term_coverage     نسبة كلمات المفهوم (بعد التحليل) الموجودة في السياق المرسل
+  best_sentence     هل الجملة الأعلى تشابهاً مع المفهوم في الفقرات كلها ضمن السياق المرسل
+
+التشغيل: python -m benchmarks.context_packing [--budget 200] [--top-k 2] [--out results.json]
+         (EDURAG_RAG_DIR لتجربة فهرس آخر)
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.stats import bank_concepts, write_json
+import analyzer
+import rag_core
+from llm_gateway import estimate_tokens
+
+LEGACY_CHARS = 800
+
+
+def _tokens(text):
+    return estimate_tokens([{"content": text}], max_tokens=0)
+
+
+def _coverage(concept, text):
+    terms = set(analyzer.tokenize(concept))
+    return len(terms & set(analyzer.tokenize(text))) / len(terms) if terms else None
+
+
+def _best_sentence(concept, context_list):
+    items = [(c, s) for c in context_list for s in rag_core._sentences(c['text'])]
+    if not items: return None
+    scores, _ = rag_core._sentence_scores(concept, [s for _, s in items], items[0][0].get('doc_id'))
+    return items[int(np.argmax(scores))][1] if scores.max() > 0 else None
+
+
+def run(concepts, budget=rag_core.CONTEXT_TOKEN_BUDGET, top_k=2):
+    contexts = rag_core.search_concepts_in_book(concepts, top_k)
+    rows = {"legacy": {"prompt_tokens": [], "term_coverage": [], "best_sentence": []},
+            "packed": {"prompt_tokens": [], "term_coverage": [], "best_sentence": []}}
+    for concept, context_list in zip(concepts, contexts):
+        if not context_list: continue
+        full = "\n".join(c['text'] for c in context_list)
+        best = _best_sentence(concept, context_list)
+        for name, text in (("legacy", full[:LEGACY_CHARS]), ("packed", rag_core.pack_context(concept, context_list, budget))):
+            rows[name]["prompt_tokens"].append(_tokens(rag_core._explanation_prompt(concept, text)))
+            cov = _coverage(concept, text)
+            if cov is not None: rows[name]["term_coverage"].append(cov)
+            # المقارنة بعد دمج المسافات لأن القص القديم يحتفظ بأسطر PDF المكسورة
+            if best is not None: rows[name]["best_sentence"].append(best in " ".join(text.split()))
+    summary = {name: {k: float(np.mean(v)) if v else None for k, v in metrics.items()} for name, metrics in rows.items()}
+    return {"n_concepts": len(concepts), "n_with_context": len(rows["packed"]["prompt_tokens"]),
+            "budget": budget, "top_k": top_k, **summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token-budgeted context packing vs fixed truncation")
+    parser.add_argument("--budget", type=int, default=rag_core.CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--concepts", nargs="*", help="concepts to test (default: all concepts in the bank)")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    results = run(args.concepts or [str(c) for c in bank_concepts()], args.budget, args.top_k)
+    for name in ("legacy", "packed"):
+        print(f"{name:7s} " + "  ".join(f"{k}={v:.3f}" if v is not None else f"{k}=-" for k, v in results[name].items()))
+    write_json(args.out, results)
+
+
+if __name__ == "__main__":
+    main()
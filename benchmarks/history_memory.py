@@ -0,0 +1,145 @@
+"""
+ذروة الذاكرة (RSS) لتحميل سجل محاولات تاريخي كبير: القراءة الكاملة مقابل القراءة على دفعات.
+
+يُولّد سجلاً صناعياً (concept_history بعدد --rows صف و attempts بخُمسه) بنفس أعمدة reports/،
+ثم يشغل كل وضع في عملية مستقلة ويقيس ذروة RSS:
+  idle        المفسّر مع pandas فقط (خط الأساس)
+  eager       pd.read_csv بالأنواع الافتراضية ثم التجميع (الطريقة القديمة)
+  stream      history_loader.fold_history(from_csv=True) (دفعات بأنواع مضغوطة)
+  export      history_loader.export_columnar(from_csv=True) إلى Parquet
+  columnar    تحميل concept_history.parquet بالأنواع المضغوطة ثم التجميع
+
+التشغيل: python -m benchmarks.history_memory [--rows 10000000] [--dir /tmp/history] [--out results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.stats import ROOT_DIR, write_json
+
+MODES = ["idle", "eager", "stream", "export", "columnar"]
+GEN_CHUNK = 1_000_000
+
+
+def generate(out_dir, rows, n_students=50_000, n_concepts=300, seed=0):
+    """يكتب attempts.csv و concept_history.csv صناعيين (5 أسئلة لكل محاولة) على دفعات."""
+    from history_loader import CSV_FILES
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    students = np.array([f"طالب_{i:06d}" for i in range(n_students)], dtype=object)
+    concepts = np.array([f"Concept_{i:03d}_Arabic_Topic" for i in range(n_concepts)], dtype=object)
+    att_path = os.path.join(out_dir, CSV_FILES["attempts"])
+    con_path = os.path.join(out_dir, CSV_FILES["concept_history"])
+    n_attempts = rows // 5
+    for start in range(0, n_attempts, GEN_CHUNK // 5):
+        n = min(GEN_CHUNK // 5, n_attempts - start)
+        ids = np.char.add("a", np.arange(start, start + n).astype(str))
+        stu = students[rng.integers(0, n_students, n)]
+        chapter = rng.integers(1, 6, n)
+        attempt = rng.integers(1, 3, n)
+        q_concepts = concepts[rng.integers(0, n_concepts, (n, 5))]
+        correct = rng.random((n, 5)) < 0.65
+        weak = [";".join(c[~k]) for c, k in zip(q_concepts, correct)]
+        header = start == 0
+        pd.DataFrame({
+            "student": stu, "chapter": chapter, "attempt": attempt, "total": 5, "correct": correct.sum(axis=1),
+            "accuracy": correct.sum(axis=1) * 20.0, "weak_concepts": weak,
+            "time_sec": rng.gamma(4.0, 30.0, n).round(2), "attempt_id": ids,
+        }).to_csv(att_path, mode="w" if header else "a", header=header, index=False)
+        pd.DataFrame({
+            "student": np.repeat(stu, 5), "chapter": np.repeat(chapter, 5), "attempt": np.repeat(attempt, 5),
+            "concept": q_concepts.ravel(), "correct": correct.ravel().astype(int), "total": 1,
+            "accuracy": correct.ravel() * 100, "attempt_id": np.repeat(ids, 5),
+        }).to_csv(con_path, mode="w" if header else "a", header=header, index=False)
+    return {"attempts": n_attempts, "concept_history": n_attempts * 5,
+            "csv_mb": round((os.path.getsize(att_path) + os.path.getsize(con_path)) / 1e6, 1)}
+
+
+def run_mode(mode, data_dir):
+    """ينفذ وضعاً واحداً داخل العملية الحالية ويعيد (الزمن، ملخص صغير للنتيجة)."""
+    import history_loader
+    t0 = time.perf_counter()
+    if mode == "idle":
+        out = {}
+    elif mode == "eager":
+        att = pd.read_csv(os.path.join(data_dir, "attempts.csv"))
+        con = pd.read_csv(os.path.join(data_dir, "concept_history.csv"))
+        g = att.groupby("student")
+        summary = pd.DataFrame({"best": g['accuracy'].max(), "last": g['accuracy'].last()})
+        stats = con.groupby("concept")['correct'].agg(["count", "sum"])
+        out = {"students": len(summary), "concepts": len(stats)}
+    elif mode == "stream":
+        r = history_loader.fold_history(data_dir, from_csv=True)
+        out = {"students": len(r["summary"]), "concepts": len(r["concept_stats"])}
+    elif mode == "export":
+        written = history_loader.export_columnar(data_dir, os.path.join(data_dir, "columnar"), "parquet",
+                                                 from_csv=True)
+        out = {name: round(os.path.getsize(p) / 1e6, 1) for name, p in written.items()}
+    elif mode == "columnar":
+        con = history_loader.load_columnar(os.path.join(data_dir, "columnar", "concept_history.parquet"),
+                                           columns=["concept", "chapter", "correct"])
+        stats = con.groupby("concept", observed=True)['correct'].agg(["count", "sum"])
+        out = {"concepts": len(stats), "frame_mb": round(con.memory_usage(deep=True).sum() / 1e6, 1)}
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    return time.perf_counter() - t0, out
+
+
+def peak_rss_mb():
+    """ذروة RSS لهذه العملية. VmHWM تبدأ من الصفر مع exec، أما ru_maxrss فترث ذروة العملية الأم في لينكس."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"): return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, data_dir):
+    seconds, out = run_mode(mode, data_dir)
+    peak_mb = peak_rss_mb()
+    print(json.dumps({"mode": mode, "seconds": round(seconds, 2), "peak_rss_mb": round(peak_mb, 1), **out}))
+
+
+def run(rows=10_000_000, data_dir=None, modes=MODES, regenerate=False):
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), f"edurag_history_{rows}")
+    results = {"rows": rows, "data_dir": data_dir, "modes": {}}
+    if regenerate or not os.path.exists(os.path.join(data_dir, "concept_history.csv")):
+        t0 = time.perf_counter()
+        results["generated"] = generate(data_dir, rows)
+        print(f"Generated {results['generated']} in {time.perf_counter() - t0:.1f}s")
+    for mode in modes:
+        proc = subprocess.run([sys.executable, "-m", "benchmarks.history_memory", "--child", mode, "--dir", data_dir],
+                              cwd=ROOT_DIR, capture_output=True, text=True)
+        if proc.returncode != 0:
+            results["modes"][mode] = {"error": proc.stderr.strip().splitlines()[-1:]}
+            continue
+        results["modes"][mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(results["modes"][mode])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of eager vs chunked history loading")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="concept_history rows to generate")
+    parser.add_argument("--dir", default=None, help="where to write the synthetic history (reused if present)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child: return child(args.child, args.dir)
+    write_json(args.out, run(args.rows, args.dir, args.modes, args.regenerate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+خادم محلي يحاكي واجهة OpenAI (/v1/chat/completions) لقياس الأداء بلا تكلفة أو حدود معدل حقيقية.
+
+- زمن استجابة قابل للضبط مع تذبذب عشوائي، ومعدل أخطاء (429 مع Retry-After أو 500).
+- يدعم البث (stream=True) بأحداث SSE مثل الواجهة الأصلية.
+- إن طلبت الرسائل JSON يعيد مصفوفة أسئلة اختيار من متعدد بعدد المطلوب، وإلا نص شرح.
+
+التشغيل:
+  python -m benchmarks.openai_stub --port 8765 --latency 0.8 --error-rate 0.05
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run student_app.py
+"""
+import re
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXPLANATION = ("هذا شرح تجريبي للمفهوم من خادم المحاكاة. نبدأ بالتعريف ثم مثال محلول "
+               "خطوة بخطوة، وأخيراً ملاحظة عن الخطأ الشائع عند حل مثل هذه المسائل.")
+
+
+class StubConfig:
+    latency = 0.5        # ثوانٍ حتى أول رمز (أو الرد كاملاً بلا بث)
+    jitter = 0.2         # تذبذب نسبي في الزمن
+    error_rate = 0.0
+    stream_chunks = 20
+    chunk_interval = 0.02
+
+    _ids = itertools.count(1)
+    _lock = threading.Lock()
+    requests = 0
+    errors = 0
+
+
+def _questions(prompt, n):
+    concepts = re.search(r"(?:Focus on|Target Concepts):\s*(.+)", prompt)
+    concepts = [c.strip(" .") for c in concepts.group(1).split(",")] if concepts else ["مفهوم عام"]
+    return [{
+        "question": f"سؤال تجريبي رقم {i + 1}؟",
+        "option_a": "1", "option_b": "2", "option_c": "3", "option_d": "4",
+        "correct_option": random.choice(["option_a", "option_b", "option_c", "option_d"]),
+        "concept": concepts[i % len(concepts)],
+    } for i in range(n)]
+
+
+def reply_for(messages):
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    if "JSON" not in text: return EXPLANATION
+    n = re.search(r"Create (?:a mixed math quiz of )?(\d+)", text)
+    return json.dumps(_questions(text, int(n.group(1)) if n else 5), ensure_ascii=False)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive حتى يظهر أثر مجمع الاتصالات
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _sleep(self, seconds):
+        time.sleep(max(0.0, seconds * (1 + random.uniform(-StubConfig.jitter, StubConfig.jitter))))
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with StubConfig._lock:
+            StubConfig.requests += 1
+            call_id = next(StubConfig._ids)
+        if not self.path.endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        if random.random() < StubConfig.error_rate:
+            with StubConfig._lock: StubConfig.errors += 1
+            self._sleep(StubConfig.latency / 4)
+            if random.random() < 0.5:
+                return self._json(429, {"error": {"message": "stub rate limit", "type": "rate_limit_error"}},
+                                  {"Retry-After": "0.2"})
+            return self._json(500, {"error": {"message": "stub server error", "type": "server_error"}})
+
+        content = reply_for(body.get("messages", []))
+        model = body.get("model", "stub")
+        self._sleep(StubConfig.latency)
+        if not body.get("stream"):
+            return self._json(200, {
+                "id": f"chatcmpl-stub-{call_id}", "object": "chat.completion", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(content) // 3,
+                          "total_tokens": 100 + len(content) // 3},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        step = max(1, len(content) // StubConfig.stream_chunks)
+        for i in range(0, len(content), step):
+            if i: time.sleep(StubConfig.chunk_interval)
+            event(json.dumps({
+                "id": f"chatcmpl-stub-{call_id}", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}],
+            }, ensure_ascii=False))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(port=8765, host="127.0.0.1"):
+    """يشغل الخادم في خيط خلفي ويعيده (server.shutdown() للإيقاف)."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI chat-completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=StubConfig.latency, help="seconds to first token")
+    parser.add_argument("--jitter", type=float, default=StubConfig.jitter)
+    parser.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    parser.add_argument("--chunk-interval", type=float, default=StubConfig.chunk_interval)
+    args = parser.parse_args()
+
+    StubConfig.latency, StubConfig.jitter = args.latency, args.jitter
+    StubConfig.error_rate, StubConfig.chunk_interval = args.error_rate, args.chunk_interval
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"OpenAI stub on http://{args.host}:{args.port}/v1 (latency {args.latency}s, errors {args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
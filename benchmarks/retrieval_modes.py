@@ -0,0 +1,126 @@
+"""
+مقارنة أوضاع البحث (tfidf / dense / hybrid) على أسماء المفاهيم في بنك الأسئلة.
+
+لكل وضع:
+  coverage      نسبة المفاهيم التي وُجدت لها فقرة فوق حد التطابق
+  recall@k      تطابق نتائج الفهرس مع بحث شامل دقيق لنفس الوضع
+                (TF-IDF: ضرب المصفوفة كاملة، dense: متجهات float16 بلا HNSW/تكميم)
+  uncached      زمن استعلام واحد بعد إفراغ ذاكرة الاسترجاع (rag_core._retrieval_cache) قبل كل استدعاء
+  cached        زمن الاستعلام نفسه مباشرة بعد تخزينه (إصابة في الذاكرة)
+  cache_ok      نتائج الاستدعاء البارد والدافئ متطابقة، وتغيير إصدار المكتبة يفرغ الذاكرة
+                ويعيد النتائج نفسها من الفهرس
+الاستدعاءات المقيسة تمرر doc_ids فلا يُستعمل جدول المفاهيم المحسوب مسبقاً (concept_table.py).
+
+التشغيل: python -m benchmarks.retrieval_modes [--top-k 3] [--repeat 5] [--out results.json]
+"""
+import time
+import argparse
+
+import numpy as np
+
+from benchmarks.stats import latency_summary, bank_concepts, write_json
+import rag_core
+
+
+def exact_tfidf(library, queries, top_k):
+    parts = []
+    for doc_id, index in library.shards.items():
+        sims = (index.vectorizer.transform(queries) @ index.matrix.T).tocsr()
+        s, i = rag_core._top_k_rows(sims, top_k)
+        parts.append((s, np.where(i >= 0, i + library.offsets[doc_id], -1)))
+    return rag_core._merge_top_k(parts, top_k)
+
+
+def exact_dense(library, queries, top_k):
+    dense = rag_core.load_dense_library()
+    parts = []
+    for doc_id, d in dense.items():
+        s, i = d.search_exact(d.encode(queries), top_k)
+        parts.append((s, np.where(i >= 0, i + library.offsets[doc_id], -1)))
+    return rag_core._merge_top_k(parts, top_k)
+
+
+def recall_at_k(got, ref, scores_ref, min_score):
+    hits, total = 0, 0
+    for g, r, sr in zip(got, ref, scores_ref):
+        relevant = {i for i, s in zip(r, sr) if i >= 0 and s > min_score}
+        total += len(relevant)
+        hits += len(relevant & set(g.tolist()))
+    return hits / total if total else None
+
+
+def _same(a, b):
+    return np.array_equal(a[1], b[1]) and np.allclose(a[0], b[0], atol=1e-6)
+
+
+def check_cache(library, concepts, top_k, doc_ids, mode, cold):
+    """الدافئ (من الذاكرة) = البارد، وبعد تغيير إصدار المكتبة تُفرغ الذاكرة وتُعاد النتائج نفسها."""
+    cache = rag_core._retrieval_cache
+    if cache.max_entries <= 0: return None
+    hits = cache.hits
+    warm = rag_core.search_concepts_batch(concepts, top_k, doc_ids, mode=mode)
+    ok = _same(cold, warm) and cache.hits - hits == len(concepts)
+    version, invalidations = library.version, cache.invalidations
+    library.version = f"{version}-bench"
+    try:
+        hits = cache.hits
+        bumped = rag_core.search_concepts_batch(concepts, top_k, doc_ids, mode=mode)
+        ok = ok and _same(cold, bumped) and cache.hits == hits and cache.invalidations == invalidations + 1
+    finally:
+        library.version = version
+    return ok
+
+
+def run(top_k=3, repeat=5):
+    library = rag_core.load_rag_library()
+    concepts = bank_concepts()
+    cleaned = [str(c) for c in concepts]
+    modes = ["tfidf"] + (["dense", "hybrid"] if rag_core.load_dense_library() else [])
+    references = {"tfidf": exact_tfidf(library, cleaned, top_k)}
+    if "dense" in modes: references["dense"] = exact_dense(library, cleaned, top_k)
+
+    results = {"n_concepts": len(concepts), "top_k": top_k, "modes": {}}
+    cache = rag_core._retrieval_cache
+    doc_ids = list(library.doc_ids)
+    for mode in modes:
+        rag_core.search_concepts_batch(concepts[:1], top_k, doc_ids, mode=mode)  # تسخين (تحميل النموذج والصفحات)
+        uncached, cached = [], []
+        for _ in range(repeat):
+            for concept in concepts:
+                cache.clear()
+                t = time.perf_counter()
+                rag_core.search_concepts_batch([concept], top_k, doc_ids, mode=mode)
+                uncached.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                rag_core.search_concepts_batch([concept], top_k, doc_ids, mode=mode)
+                cached.append(time.perf_counter() - t)
+
+        cache.clear()
+        scores, indices = rag_core.search_concepts_batch(concepts, top_k, doc_ids, mode=mode)
+        found = (scores > rag_core.MIN_SCORES[mode]) & (indices >= 0)
+        entry = {"coverage": float(found.any(axis=1).mean()) if len(concepts) else None,
+                 "latency": {"uncached": latency_summary(uncached), "cached": latency_summary(cached)},
+                 "cache_ok": check_cache(library, concepts, top_k, doc_ids, mode, (scores, indices))}
+        if mode in references:
+            ref_s, ref_i = references[mode]
+            entry["recall_at_k"] = recall_at_k(indices, ref_i, ref_s, rag_core.MIN_SCORES[mode])
+        results["modes"][mode] = entry
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="حفظ النتائج بصيغة JSON")
+    args = parser.parse_args()
+
+    results = run(args.top_k, args.repeat)
+    print(f"{'mode':<8} {'coverage':>9} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'hit p50':>8} {'hit p99':>8} {'cache':>6}")
+    for mode, r in results["modes"].items():
+        recall = r.get("recall_at_k")
+        cold, warm = r["latency"]["uncached"], r["latency"]["cached"]
+        status = {True: "ok", False: "FAIL", None: "off"}[r["cache_ok"]]
+        print(f"{mode:<8} {r['coverage'] or 0:>9.2%} {'-' if recall is None else f'{recall:.2%}':>9} "
+              f"{cold['p50_ms']:>8.2f} {cold['p99_ms']:>8.2f} {warm['p50_ms']:>8.2f} {warm['p99_ms']:>8.2f} {status:>6}")
+    write_json(args.out, results)
@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path: sys.path.insert(0, ROOT_DIR)
+
+
+def latency_summary(seconds):
+    """ملخص زمن الاستجابة بالمللي ثانية (p50/p95/p99)."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if len(ms) == 0: return {"count": 0}
+    return {
+        "count": int(len(ms)),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def bank_concepts():
+    """أسماء المفاهيم في بنك الأسئلة (EDURAG_DATA_DIR أو data/) بدون تكرار."""
+    import rag_core
+    return rag_core.load_question_bank().concepts()
+
+
+def write_json(path, results):
+    if not path: return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"📄 {path}")
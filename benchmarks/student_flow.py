@@ -0,0 +1,235 @@
+"""
+مولّد حمل لمسار الطالب كاملاً في rag_core، لتقدير العتاد اللازم أيام الاختبارات.
+
+1. يبني بيئة صناعية في مجلد مستقل: بنك أسئلة (data/questions_ch*.csv و answers_ch*.csv)،
+   فقرات كتاب تذكر المفاهيم مفهرسة بنفس صيغة build_index.py، ومجلد reports/ فارغ.
+2. يوجّه rag_core إليها (EDURAG_DATA_DIR / EDURAG_REPORTS_DIR / EDURAG_RAG_DIR) ويشغّل
+   خادم المحاكاة openai_stub مكان واجهة OpenAI بزمن ومعدل أخطاء قابلين للضبط.
+3. يشغّل جلسات طلاب متزامنة (خيوط في عملية واحدة كما في Streamlit)، كل جلسة بمراحل
+   student_app.py نفسها:
+     questions  sample_chapter_questions
+     grade      grade_attempt
+     save       save_attempt_data
+     retrieve   search_concepts_in_book للمفاهيم الضعيفة داخل فصل الاختبار (مع إحصاءات ذاكرة الاسترجاع)
+     explain    get_explanations_streaming
+     remedial   prepare_second_attempt_quiz (ثم تصحيح المحاولة الثانية وحفظها)
+4. يكتب الإنتاجية و p50/p95/p99 لكل مرحلة في JSON مع رقم الـ commit للمقارنة بين الإصدارات.
+
+التشغيل:
+  python -m benchmarks.student_flow --students 200 --concurrency 20 --latency 0.8 --error-rate 0.05 \\
+      --out flow.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.stats import ROOT_DIR, latency_summary, write_json
+
+STAGES = ["questions", "grade", "save", "retrieve", "explain", "remedial", "session"]
+OPTIONS = ["option_a", "option_b", "option_c", "option_d"]
+LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+FILLER = ("في هذا الدرس نتعلم كيف نحل المسائل خطوة بخطوة ونراجع الأمثلة المحلولة ثم نطبق "
+          "القاعدة على تمارين متنوعة مع ملاحظة الأخطاء الشائعة عند الطلاب").split()
+
+
+# ----------------------------- البيئة الصناعية ----------------------------- #
+
+def _word(rng, n=5):
+    return "".join(rng.choice(LETTERS) for _ in range(n))
+
+
+def build_fixture(root, chapters=5, concepts_per_chapter=8, questions_per_concept=10, chunks_per_concept=20,
+                  seed=0):
+    """يكتب data/ و rag_data/ (فهرس جاهز) و reports/ تحت root ويعيد وصف الحجم."""
+    from build_index import count_rows, doc_freq, tfidf_from_counts
+    from index_store import write_index, SHARDS_DIRNAME
+    from book_chapters import chapter_rows
+    import analyzer
+
+    rng = random.Random(seed)
+    data_dir, rag_dir = os.path.join(root, "data"), os.path.join(root, "rag_data")
+    for d in (data_dir, rag_dir, os.path.join(root, "reports")): os.makedirs(d, exist_ok=True)
+
+    chunks = []
+    for ch in range(1, chapters + 1):
+        questions, answers = [], []
+        for k in range(concepts_per_chapter):
+            concept = f"{_word(rng)} {_word(rng)}"
+            for q in range(questions_per_concept):
+                qid = f"{ch}{k:02d}{q:03d}"
+                options = [str(rng.randint(1, 999)) for _ in OPTIONS]
+                questions.append({"question_id": qid, "question": f"سؤال {qid} عن {concept}؟",
+                                  **dict(zip(OPTIONS, options)), "concept": concept})
+                answers.append({"question_id": qid, "correct_option": rng.choice(OPTIONS)})
+            for _ in range(chunks_per_concept):
+                words = rng.sample(FILLER, 12) + concept.split()
+                rng.shuffle(words)
+                chunks.append({"text": " ".join(words), "page": ch * 100 + rng.randint(1, 99)})
+        pd.DataFrame(questions).to_csv(os.path.join(data_dir, f"questions_ch{ch}.csv"), index=False)
+        pd.DataFrame(answers).to_csv(os.path.join(data_dir, f"answers_ch{ch}.csv"), index=False)
+
+    chunks.sort(key=lambda c: c["page"])  # كما في build_index.py: كل فصل شريحة متصلة
+    terms = []
+    counts = count_rows([analyzer.tokenize(c["text"]) for c in chunks], terms, {})
+    vocabulary, idf, matrix = tfidf_from_counts(counts, doc_freq(counts, len(terms)), terms)
+    chapter_pages = {ch: (ch * 100, ch * 100 + 99) for ch in range(1, chapters + 1)}
+    write_index(os.path.join(rag_dir, SHARDS_DIRNAME, "synthetic"), vocabulary, idf, matrix, chunks,
+                doc_id="synthetic", analyzer_config=analyzer.config(),
+                chapters=chapter_rows([c["page"] for c in chunks], chapter_pages))
+    return {"chapters": chapters, "concepts": chapters * concepts_per_chapter,
+            "questions": chapters * concepts_per_chapter * questions_per_concept, "chunks": len(chunks)}
+
+
+# ----------------------------- جلسة الطالب ----------------------------- #
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {s: [] for s in STAGES}
+        self.errors = {s: 0 for s in STAGES}
+        self._lock = threading.Lock()
+
+    def run(self, stage, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception:
+            with self._lock: self.errors[stage] += 1
+            raise
+        finally:
+            with self._lock: self.samples[stage].append(time.perf_counter() - t0)
+
+
+def _answers(rng, questions, skill):
+    """إجابات طالب مهارته skill: الصحيحة باحتمال skill وإلا خيار عشوائي (نص الخيار كما في الواجهة)."""
+    out = {}
+    for _, row in questions.iterrows():
+        key = row['correct_option'] if rng.random() < skill else rng.choice(OPTIONS)
+        out[row['question_id']] = str(row.get(key, key))
+    return out
+
+
+def student_session(rag_core, timer, api_key, student, seed, n_chapters):
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    chapter = rng.randint(1, n_chapters)
+    skill = rng.uniform(0.3, 0.95)
+
+    questions = timer.run("questions", rag_core.sample_chapter_questions, chapter, 5)
+    summary = timer.run("grade", rag_core.grade_attempt, questions, _answers(rng, questions, skill))
+    timer.run("save", rag_core.save_attempt_data, student, chapter, 1, summary, rng.uniform(60, 600))
+
+    weak = summary['weak_concepts']
+    if weak:
+        contexts = timer.run("retrieve", lambda: dict(zip(weak, rag_core.search_concepts_in_book(
+            weak, chapter=chapter, widen_below=rag_core.CHAPTER_WIDEN_SCORE))))
+        timer.run("explain", rag_core.get_explanations_streaming, api_key, weak, contexts)
+        quiz = timer.run("remedial", rag_core.prepare_second_attempt_quiz, api_key, chapter, list(weak), 5, student)
+        if not quiz.empty and 'correct_option' in quiz.columns:
+            second = timer.run("grade", rag_core.grade_attempt, quiz, _answers(rng, quiz, min(1.0, skill + 0.2)))
+            timer.run("save", rag_core.save_attempt_data, student, chapter, 2, second, rng.uniform(60, 600))
+    timer.samples["session"].append(time.perf_counter() - t0)
+
+
+# ----------------------------- التشغيل ----------------------------- #
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(students=100, concurrency=10, root=None, chapters=5, concepts_per_chapter=8, questions_per_concept=10,
+        chunks_per_concept=20, latency=0.5, jitter=0.2, error_rate=0.0, port=0, seed=0):
+    root = root or tempfile.mkdtemp(prefix="edurag_flow_")
+    fixture = build_fixture(root, chapters, concepts_per_chapter, questions_per_concept, chunks_per_concept, seed)
+
+    from benchmarks.openai_stub import serve, StubConfig
+    StubConfig.latency, StubConfig.jitter, StubConfig.error_rate = latency, jitter, error_rate
+    server = serve(port)
+    os.environ.update({
+        "EDURAG_DATA_DIR": os.path.join(root, "data"),
+        "EDURAG_REPORTS_DIR": os.path.join(root, "reports"),
+        "EDURAG_RAG_DIR": os.path.join(root, "rag_data"),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}/v1",
+    })
+    if "rag_core" in sys.modules: raise RuntimeError("rag_core must be imported after the environment is set")
+    import rag_core
+
+    # تحميل الموارد المشتركة قبل القياس (كما يحدث عند أول زيارة للتطبيق)
+    rag_core.load_rag_library()
+    rag_core.load_question_bank().refresh(force=True)
+    rag_core.load_attempt_store()
+    rag_core.load_question_pool()
+
+    api_key = "sk-stub"
+    timer = StageTimer()
+    failures = []
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(student_session, rag_core, timer, api_key, f"طالب {i:05d}", seed * 100003 + i,
+                               chapters) for i in range(students)]
+        for f in futures:
+            try: f.result()
+            except Exception as e: failures.append(repr(e))
+    wall = time.perf_counter() - t0
+    server.shutdown()
+
+    results = {
+        "commit": _commit(),
+        "config": {"students": students, "concurrency": concurrency, "latency": latency, "jitter": jitter,
+                   "error_rate": error_rate, "seed": seed, "root": root, **fixture},
+        "wall_sec": wall,
+        "throughput": {"sessions_per_sec": students / wall if wall else None,
+                       "llm_requests": StubConfig.requests, "llm_errors_injected": StubConfig.errors,
+                       "failed_sessions": len(failures)},
+        "stages": {stage: {**latency_summary(samples), "errors": timer.errors[stage],
+                           "ops_per_sec": len(samples) / wall if wall else None}
+                   for stage, samples in timer.samples.items()},
+        "retrieval_cache": rag_core.retrieval_cache_stats(),
+    }
+    if failures: results["failures"] = failures[:10]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end student flow load generator")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--dir", default=None, help="fixture directory (default: a new temp dir)")
+    parser.add_argument("--chapters", type=int, default=5)
+    parser.add_argument("--concepts", type=int, default=8, help="concepts per chapter")
+    parser.add_argument("--questions", type=int, default=10, help="questions per concept")
+    parser.add_argument("--chunks", type=int, default=20, help="book chunks per concept")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub seconds to first token")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=0, help="stub port (0 = any free port)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    results = run(args.students, args.concurrency, args.dir, args.chapters, args.concepts, args.questions,
+                  args.chunks, args.latency, args.jitter, args.error_rate, args.port, args.seed)
+    print(f"{results['throughput']['sessions_per_sec']:.2f} sessions/s over {results['wall_sec']:.1f}s "
+          f"({results['throughput']['failed_sessions']} failed)")
+    for stage, s in results["stages"].items():
+        if s["count"]:
+            print(f"  {stage:10s} n={s['count']:5d}  p50={s['p50_ms']:8.1f}ms  p95={s['p95_ms']:8.1f}ms  "
+                  f"p99={s['p99_ms']:8.1f}ms  errors={s['errors']}")
+    write_json(args.out, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+نطاقات صفحات فصول الكتاب، مشتركة بين توليد الأسئلة (generate_questions) والفهرس (build_index).
+
+build_index.py يرتب الفقرات حسب الصفحة، فيصبح كل فصل شريحة متصلة من صفوف المصفوفة،
+ويحفظ {الفصل: [أول صف، آخر صف + 1]} في meta.json للكتاب. البحث في فصل
+(rag_core.search_concept_in_book(..., chapter=...)) يقتصر على هذه الشريحة.
+"""
+import numpy as np
+
+# الأرقام مثال فقط، عدّلها حسب فهرس كتابك (أرقام الصفحات شاملة)
+CHAPTER_PAGE_RANGES = {
+    1: (12, 59),   # الفصل 1 من الصفحة 12 إلى 59 (شاملة)
+    2: (62, 101),  # الفصل 2
+    3: (104, 147),  # الفصل 3
+    4: (150, 175),  # الفصل 4
+    5: (177, 223), # الفصل 5
+}
+
+# نطاقات الفصول لكل كتاب في المكتبة (doc_id)؛ الكتب غير المذكورة يُبحث فيها كاملة
+BOOK_CHAPTERS = {"math": CHAPTER_PAGE_RANGES}
+
+
+def chapter_rows(pages, page_ranges):
+    """
+    {الفصل (نص): (أول صف، آخر صف + 1)} من أرقام صفحات الفقرات مرتبة تصاعدياً.
+    يعيد {} إن لم تكن الصفحات مرتبة (فقرات فهرس قديم بترتيب آخر) أو لا توجد نطاقات.
+    """
+    pages = np.asarray(pages)
+    if not page_ranges or len(pages) == 0 or np.any(np.diff(pages) < 0): return {}
+    rows = {}
+    for chapter, (first, last) in page_ranges.items():
+        start = int(np.searchsorted(pages, first, side="left"))
+        end = int(np.searchsorted(pages, last, side="right"))
+        if end > start: rows[str(chapter)] = (start, end)
+    return rows
+
+
+def neighbours(chapter, chapters):
+    """الفصل مع الفصلين المجاورين له في ترتيب الفصول المعروفة."""
+    ordered = sorted({str(c) for c in chapters}, key=lambda c: (len(c), c))
+    chapter = str(chapter)
+    if chapter not in ordered: return [chapter]
+    i = ordered.index(chapter)
+    return ordered[max(i - 1, 0):i + 2]
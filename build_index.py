@@ -1,52 +1,260 @@
 import os
-import pickle
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import fitz  # PyMuPDF
-import re
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy.sparse import csr_matrix, vstack
+
+import analyzer
+from index_store import write_index, SHARDS_DIRNAME
+from book_chapters import BOOK_CHAPTERS, chapter_rows
+from dense_index import build_dense_index, chunks_fingerprint
 
 BASE_DIR = os.path.dirname(__file__)
 PDF_PATH = os.path.join(BASE_DIR, "math.pdf")
+BOOKS_DIR = os.path.join(BASE_DIR, "books")  # مكتبة الكتب: كل PDF فيه يصبح جزءاً مستقلاً
 RAG_DIR = os.path.join(BASE_DIR, "rag_data")
+SHARDS_DIR = os.path.join(RAG_DIR, SHARDS_DIRNAME)
+CACHE_DIR = os.path.join(RAG_DIR, "cache")  # بصمات الصفحات وصفوف العدّ من آخر بناء (مجلد لكل كتاب)
 os.makedirs(RAG_DIR, exist_ok=True)
 
-def normalize_arabic(text):
-    text = re.sub(r'[\u064B-\u065F]', '', text)
-    text = re.sub(r'[إأآ]', 'ا', text)
-    text = re.sub(r'ى', 'ي', text)
-    return text
+MAX_WORKERS = os.cpu_count() or 1
+
+# ----------------------------- 1. الاستخراج (متوازٍ) ----------------------------- #
+
+def extract_page_range(pdf_path, start, end, known_hashes):
+    """
+    يعمل داخل مجمع العمليات: يعيد [(رقم الصفحة, البصمة, النص)] للصفحات [start, end).
+    البصمة محسوبة من محتوى الصفحة الخام، والنص None إن طابقت البصمة المخزنة.
+    """
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for i in range(start, end):
+            page = doc[i]
+            page_hash = hashlib.sha1(page.read_contents()).hexdigest()
+            text = None if known_hashes.get(i + 1) == page_hash else page.get_text()
+            pages.append((i + 1, page_hash, text))
+    return pages
+
+def extract_pages(pdf_path, known_hashes, workers=MAX_WORKERS):
+    with fitz.open(pdf_path) as doc: n_pages = len(doc)
+    step = max(1, -(-n_pages // (workers * 4)))  # عدة نطاقات لكل عامل لتوزيع الحمل
+    ranges = [(s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+    if workers <= 1 or len(ranges) == 1:
+        results = [extract_page_range(pdf_path, s, e, known_hashes) for s, e in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            futures = [pool.submit(extract_page_range, pdf_path, s, e, known_hashes) for s, e in ranges]
+            results = [f.result() for f in futures]
+    return [p for chunk in results for p in chunk]
+
+# ----------------------------- 2. التقسيم والتطبيع ----------------------------- #
+
+def split_chunks(text):
+    if len(text) <= 50: return []
+    return [c.strip() for c in text.split('\n\n') if len(c.strip()) > 30]
+
+def count_rows(tokenized_chunks, terms, term_ids):
+    """صفوف عدّ المصطلحات (CSR) بأرقام مصطلحات الذاكرة المؤقتة؛ المصطلحات الجديدة تُلحق بـ terms."""
+    data, indices, indptr = [], [], [0]
+    for tokens in tokenized_chunks:
+        counts = {}
+        for token in tokens:
+            t = term_ids.get(token)
+            if t is None:
+                t = term_ids[token] = len(terms)
+                terms.append(token)
+            counts[t] = counts.get(t, 0) + 1
+        for t in sorted(counts):
+            indices.append(t); data.append(counts[t])
+        indptr.append(len(indices))
+    return csr_matrix((np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr)),
+                      shape=(len(tokenized_chunks), len(terms)))
+
+def doc_freq(rows, n_terms):
+    return np.bincount(rows.indices, minlength=n_terms).astype(np.int64)
+
+def _resize(rows, n_terms):
+    return csr_matrix((rows.data, rows.indices, rows.indptr), shape=(rows.shape[0], n_terms))
+
+# ----------------------------- 3. الذاكرة المؤقتة للبناء التزايدي ----------------------------- #
+
+def doc_id_for(pdf_path):
+    return os.path.splitext(os.path.basename(pdf_path))[0]
+
+def load_build_cache(pdf_path, cache_dir, analyzer_config):
+    try:
+        with open(os.path.join(cache_dir, "manifest.json"), encoding="utf-8") as f: manifest = json.load(f)
+        if manifest.get("pdf") != os.path.abspath(pdf_path): return None
+        if manifest.get("analyzer") != analyzer_config: return None  # صفوف العدّ المخزنة من محلل مختلف
+        with open(os.path.join(cache_dir, "terms.json"), encoding="utf-8") as f: terms = json.load(f)
+        with np.load(os.path.join(cache_dir, "counts.npz")) as z:
+            counts = csr_matrix((z['data'], z['indices'], z['indptr']), shape=(int(z['n_rows']), len(terms)))
+        df = np.load(os.path.join(cache_dir, "df.npy"))
+        return manifest, terms, counts, df
+    except Exception:
+        return None
+
+def save_build_cache(pdf_path, cache_dir, analyzer_config, pages, terms, counts, df):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"pdf": os.path.abspath(pdf_path), "analyzer": analyzer_config, "pages": pages},
+                  f, ensure_ascii=False)
+    with open(os.path.join(cache_dir, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False)
+    np.savez(os.path.join(cache_dir, "counts.npz"), data=counts.data, indices=counts.indices,
+             indptr=counts.indptr, n_rows=np.int64(counts.shape[0]))
+    np.save(os.path.join(cache_dir, "df.npy"), df)
+
+# ----------------------------- 4. أوزان TF-IDF ----------------------------- #
 
-def build_index():
-    if not os.path.exists(PDF_PATH):
-        print(f"❌ الملف غير موجود: {PDF_PATH}")
+def tfidf_from_counts(counts, df, terms):
+    """
+    نفس حساب TfidfVectorizer الافتراضي (smooth_idf, norm='l2') من صفوف العدّ و df.
+    المفردات الناتجة مرتبة أبجدياً والمصطلحات التي df لها صفر تُحذف.
+    """
+    n_rows = counts.shape[0]
+    kept = np.flatnonzero(df > 0)
+    kept = kept[np.argsort(np.array(terms, dtype=object)[kept], kind='stable')]
+    new_id = np.full(len(terms), -1, dtype=np.int64)
+    new_id[kept] = np.arange(len(kept))
+    idf = np.log((1 + n_rows) / (1 + df[kept])) + 1
+
+    indices = new_id[counts.indices]
+    data = counts.data.astype(np.float64) * idf[indices]
+    row_of = np.repeat(np.arange(n_rows), np.diff(counts.indptr))
+    norms = np.sqrt(np.bincount(row_of, weights=data ** 2, minlength=n_rows))
+    data = data / np.where(norms > 0, norms, 1)[row_of]
+
+    matrix = csr_matrix((data, indices.astype(np.int32), counts.indptr.copy()), shape=(n_rows, len(kept)))
+    matrix.sort_indices()
+    return [terms[i] for i in kept], idf, matrix
+
+# ----------------------------- 5. البناء ----------------------------- #
+
+def build_index(pdf_path=PDF_PATH, incremental=True, workers=MAX_WORKERS, doc_id=None, dense=False, stem=False):
+    """
+    بناء جزء الكتاب pdf_path في rag_data/shards/<doc_id> (doc_id افتراضياً اسم الملف).
+    dense=True يبني أيضاً الفهرس الدلالي (sentence-transformers + FAISS)،
+    و stem=True يفعّل التجذيع الخفيف في المحلل (ويُسجل في الفهرس ليطبق على الاستعلامات).
+    """
+    if not os.path.exists(pdf_path):
+        print(f"❌ الملف غير موجود: {pdf_path}")
         return
 
-    print("🔄 جاري قراءة ملف PDF...")
-    doc = fitz.open(PDF_PATH)
-    chunks = []
-    
-    for i, page in enumerate(doc):
-        text = page.get_text()
-        if len(text) > 50:
-            raw_chunks = text.split('\n\n') 
-            for chunk in raw_chunks:
-                if len(chunk.strip()) > 30:
-                    chunks.append({
-                        "text": chunk.strip(),
-                        "normalized": normalize_arabic(chunk),
-                        "page": i + 1
-                    })
-    
-    print(f"✅ تم استخراج {len(chunks)} فقرة.")
+    doc_id = doc_id or doc_id_for(pdf_path)
+    cache_dir = os.path.join(CACHE_DIR, doc_id)
+    print(f"📘 الكتاب: {doc_id}")
+    timings = {}
+    analyzer_config = analyzer.config(stem)
+    cache = load_build_cache(pdf_path, cache_dir, analyzer_config) if incremental else None
+    if cache:
+        manifest, terms, old_counts, df = cache
+        old_pages, row = {}, 0
+        for p in manifest["pages"]:
+            old_pages[p["page"]] = (p, row, row + len(p["chunks"]))
+            row += len(p["chunks"])
+        print(f"♻️ بناء تزايدي: {len(old_pages)} صفحة في الذاكرة المؤقتة.")
+    else:
+        terms, old_counts, df, old_pages = [], None, np.zeros(0, dtype=np.int64), {}
+
+    t = time.perf_counter()
+    print(f"🔄 جاري قراءة ملف PDF ({workers} عمليات)...")
+    known_hashes = {page: entry["hash"] for page, (entry, _, _) in old_pages.items()}
+    extracted = sorted(extract_pages(pdf_path, known_hashes, workers))  # الفقرات بترتيب الصفحات: كل فصل شريحة متصلة
+    changed = [(page, text) for page, _, text in extracted if text is not None]
+    timings["extract"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    changed_chunks = {page: split_chunks(text) for page, text in changed}
+    changed_tokens = {page: [analyzer.tokenize(c, stem=stem) for c in chunks] for page, chunks in changed_chunks.items()}
+    timings["normalize"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    term_ids = {term: i for i, term in enumerate(terms)}
+    new_rows = {page: count_rows(tokens, terms, term_ids) for page, tokens in changed_tokens.items()}
+    n_terms = len(terms)
+    df = np.concatenate([df, np.zeros(n_terms - len(df), dtype=np.int64)])
+
+    pages, blocks = [], []
+    seen = set()
+    for page, page_hash, text in extracted:
+        seen.add(page)
+        if text is None:
+            entry, start, end = old_pages[page]
+            rows, chunks = old_counts[start:end], entry["chunks"]
+        else:
+            rows, chunks = new_rows[page], changed_chunks[page]
+            df += doc_freq(_resize(rows, n_terms), n_terms)
+            if page in old_pages:
+                _, start, end = old_pages[page]
+                df -= doc_freq(_resize(old_counts[start:end], n_terms), n_terms)
+        pages.append({"page": page, "hash": page_hash, "chunks": chunks})
+        if rows.shape[0]: blocks.append(_resize(rows, n_terms))
+    for page, (_, start, end) in old_pages.items():
+        if page not in seen:  # صفحات حُذفت من الملف
+            df -= doc_freq(_resize(old_counts[start:end], n_terms), n_terms)
+
+    counts = vstack(blocks, format='csr') if blocks else csr_matrix((0, n_terms), dtype=np.float32)
+    chunks = [{"text": text, "page": p["page"]} for p in pages for text in p["chunks"]]
+    print(f"✅ تم استخراج {len(chunks)} فقرة ({len(changed)} صفحة جديدة أو معدلة من {len(extracted)}).")
     print("🧠 بناء مصفوفة البحث...")
-    vectorizer = TfidfVectorizer()
-    corpus = [c['normalized'] for c in chunks]
-    matrix = vectorizer.fit_transform(corpus)
-    
-    with open(os.path.join(RAG_DIR, "vectorizer.pkl"), "wb") as f: pickle.dump(vectorizer, f)
-    with open(os.path.join(RAG_DIR, "tfidf_matrix.pkl"), "wb") as f: pickle.dump(matrix, f)
-    with open(os.path.join(RAG_DIR, "chunks.pkl"), "wb") as f: pickle.dump(chunks, f)
-        
+    vocabulary, idf, matrix = tfidf_from_counts(counts, df, terms)
+    timings["vectorize"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    print("💾 كتابة الفهرس الثنائي (CSR + مفردات + فقرات + فهرس مقلوب)...")
+    shard_dir = os.path.join(SHARDS_DIR, doc_id)
+    chapters = chapter_rows([c["page"] for c in chunks], BOOK_CHAPTERS.get(doc_id))
+    if chapters: print("📑 صفوف الفصول: " + ", ".join(f"{ch}: {s}-{e}" for ch, (s, e) in chapters.items()))
+    index_dir = write_index(shard_dir, vocabulary, idf, matrix, chunks, doc_id=doc_id, analyzer_config=analyzer_config,
+                            chapters=chapters)
+    save_build_cache(pdf_path, cache_dir, analyzer_config, pages, terms, counts, df)
+    timings["write"] = time.perf_counter() - t
+    print(f"📁 {index_dir}")
+
+    if dense:
+        t = time.perf_counter()
+        print("🧭 ترميز الفقرات وبناء الفهرس الدلالي (FAISS)...")
+        build_dense_index(shard_dir, [c["text"] for c in chunks], chunks_fingerprint(index_dir))
+        timings["dense"] = time.perf_counter() - t
+
+    print("⏱️ " + " | ".join(f"{stage}: {sec:.2f}s" for stage, sec in timings.items()))
     print("🎉 تم بناء الفهرس بنجاح!")
+    return timings
+
+def build_library(books_dir=BOOKS_DIR, incremental=True, workers=MAX_WORKERS, dense=False, stem=False):
+    """بناء جزء مستقل لكل ملف PDF في books_dir."""
+    pdfs = sorted(f for f in os.listdir(books_dir) if f.lower().endswith(".pdf"))
+    if not pdfs:
+        print(f"❌ لا توجد ملفات PDF في: {books_dir}")
+        return {}
+    return {doc_id_for(f): build_index(os.path.join(books_dir, f), incremental, workers, dense=dense, stem=stem) for f in pdfs}
 
 if __name__ == "__main__":
-    build_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="بناء فهرس البحث من ملف PDF أو مجلد كتب")
+    parser.add_argument("--pdf", help="ملف PDF واحد (افتراضياً math.pdf إن لم يوجد مجلد books)")
+    parser.add_argument("--books", help="مجلد ملفات PDF، كل ملف يصبح جزءاً مستقلاً")
+    parser.add_argument("--full", action="store_true", help="تجاهل الذاكرة المؤقتة وإعادة البناء كاملاً")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--dense", action="store_true", help="بناء الفهرس الدلالي أيضاً (وضعا dense و hybrid)")
+    parser.add_argument("--stem", action="store_true", help="تفعيل التجذيع الخفيف للكلمات العربية")
+    args = parser.parse_args()
+
+    books_dir = args.books or (BOOKS_DIR if not args.pdf and os.path.isdir(BOOKS_DIR) else None)
+    if books_dir:
+        build_library(books_dir, incremental=not args.full, workers=args.workers, dense=args.dense, stem=args.stem)
+    else:
+        build_index(args.pdf or PDF_PATH, incremental=not args.full, workers=args.workers, dense=args.dense, stem=args.stem)
+
+    # جدول المفاهيم ← الفقرات لمفاهيم بنك الأسئلة على الفهرس الجديد (concept_table.py)
+    try:
+        import rag_core
+        table = rag_core.refresh_concept_table()
+        if table is not None: print(f"🗂️ جدول المفاهيم: {len(table)} صفاً")
+    except Exception as e:
+        print(f"⚠️ تعذر بناء جدول المفاهيم: {e}")
@@ -0,0 +1,101 @@
+"""
+جدول المفاهيم ← الفقرات المحسوب مسبقاً (rag_data/concept_passages).
+
+المفاهيم التي يُبحث عنها معروفة مسبقاً: عمود concept في data/questions_ch*.csv ومفاهيم
+مخزون الأسئلة المولدة. يُبحث عن كل منها في الفهرس مرة واحدة وتُحفظ أفضل الفقرات:
+  meta.json      المفتاح (بصمة قائمة الصفوف + إصدار المكتبة + وضع البحث + top_k) والصفوف:
+                 المفهوم في الكتاب كله، و"الفصل␟المفهوم" للبحث داخل شريحة فصله (book_chapters.py)
+  ids.npy        أرقام الفقرات العامة (library.chunk) int32 بأبعاد (الصفوف، top_k)، -1 للفارغ
+  scores.npy     درجات التشابه float32
+  pages.npy      أرقام صفحات الفقرات int32
+
+عند التحميل يُبنى قاموس {الصف: رقمه} فيصبح البحث عن مفهوم معروف O(1). إذا تغير بنك
+الأسئلة أو المخزون أو أُعيد بناء الفهرس يختلف المفتاح ويُعاد حساب الجدول في خيط خلفي
+(rag_core.load_concept_table)، وbuild_index.py يحسبه مباشرة بعد بناء الفهرس.
+"""
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+TABLE_DIRNAME = "concept_passages"
+
+
+def normalize_concept(concept):
+    return " ".join(str(concept).split())
+
+
+def row_key(concept, chapter=None):
+    concept = normalize_concept(concept)
+    return concept if chapter is None else f"{chapter}\x1f{concept}"
+
+
+def table_key(rows, library_version, mode, top_k):
+    h = hashlib.sha1()
+    for r in rows: h.update(r.encode("utf-8") + b"\0")
+    return f"{library_version}/{mode}/{top_k}/{h.hexdigest()[:16]}"
+
+
+class ConceptTable:
+    def __init__(self, rows, ids, scores, pages, meta):
+        self.rows = rows
+        self.ids = ids
+        self.scores = scores
+        self.pages = pages
+        self.meta = meta
+        self.key = meta["key"]
+        self.mode = meta["mode"]
+        self.top_k = meta["top_k"]
+        self._rows = {key: r for r, key in enumerate(rows)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, concept):
+        return row_key(concept) in self._rows
+
+    def lookup(self, concept, chapter=None):
+        """(scores, ids) لمفهوم معروف (في الكتاب كله أو في شريحة فصله)، أو None."""
+        r = self._rows.get(row_key(concept, chapter))
+        if r is None: return None
+        return self.scores[r], self.ids[r]
+
+    def concept_pages(self, concept, chapter=None):
+        r = self._rows.get(row_key(concept, chapter))
+        if r is None: return []
+        return [int(p) for p, i in zip(self.pages[r], self.ids[r]) if i >= 0]
+
+
+def write_table(rag_dir, rows, scores, ids, pages, key, mode, top_k):
+    """يكتب الجدول في مجلد مؤقت ثم يستبدل به القديم (كما في index_store.write_index)."""
+    final_dir = os.path.join(rag_dir, TABLE_DIRNAME)
+    tmp_dir = f"{final_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "ids.npy"), np.asarray(ids, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "scores.npy"), np.asarray(scores, dtype=np.float32))
+    np.save(os.path.join(tmp_dir, "pages.npy"), np.asarray(pages, dtype=np.int32))
+    meta = {"key": key, "mode": mode, "top_k": int(top_k), "rows": list(rows)}
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    old_dir = f"{final_dir}.old{os.getpid()}"
+    if os.path.exists(final_dir): os.rename(final_dir, old_dir)
+    os.rename(tmp_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return load_table(rag_dir, key)
+
+
+def load_table(rag_dir, key=None):
+    """الجدول المحفوظ، أو None إن لم يوجد أو كان مفتاحه غير key."""
+    table_dir = os.path.join(rag_dir, TABLE_DIRNAME)
+    try:
+        with open(os.path.join(table_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if key is not None and meta.get("key") != key: return None
+        arrays = [np.load(os.path.join(table_dir, f"{name}.npy")) for name in ("ids", "scores", "pages")]
+        return ConceptTable(meta["rows"], *arrays, meta)
+    except (OSError, ValueError, KeyError):
+        return None
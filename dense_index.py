@@ -0,0 +1,108 @@
+"""
+فهرس دلالي اختياري (Dense) لفقرات الكتاب.
+
+تُرمّز الفقرات على دفعات بنموذج sentence-transformers محلي يعمل على المعالج،
+وتُخزن المتجهات float16 مع فهرس FAISS من نوع HNSW بتكميم 8 بت (int8):
+  rag_data/shards/<doc_id>/dense/
+    dense.json              النموذج والأبعاد وبصمة الفقرات التي بُني عليها
+    dense.faiss             فهرس HNSW-SQ8 (ضرب داخلي على متجهات مطبّعة = تشابه جيب التمام)
+    embeddings_f16.npy      المتجهات الأصلية بدقة float16 (للبحث الدقيق وقياس الاستدعاء)
+"""
+import os
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+DENSE_DIRNAME = "dense"
+DEFAULT_MODEL = os.environ.get("EDURAG_EMBED_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+BATCH_SIZE = 64
+HNSW_M = 32
+EF_SEARCH = 64
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_name=DEFAULT_MODEL):
+    """نموذج الترميز (مشترك لكل الأجزاء في العملية)."""
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(model_name, device="cpu")
+        return _models[model_name]
+
+
+def encode(texts, model_name=DEFAULT_MODEL, batch_size=BATCH_SIZE):
+    model = load_model(model_name)
+    return np.asarray(model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True,
+                                   convert_to_numpy=True, show_progress_bar=False), dtype=np.float32)
+
+
+def chunks_fingerprint(index_dir):
+    """بصمة فقرات الفهرس النصي، لاكتشاف فهرس دلالي قديم بعد إعادة بناء الكتاب."""
+    h = hashlib.sha1()
+    for name in ("chunk_offsets.npy", "chunk_pages.npy"):
+        with open(os.path.join(index_dir, name), "rb") as f: h.update(f.read())
+    return h.hexdigest()
+
+
+def build_dense_index(shard_dir, texts, fingerprint, model_name=DEFAULT_MODEL, batch_size=BATCH_SIZE):
+    import faiss
+
+    embeddings = encode(texts, model_name, batch_size)
+    dim = embeddings.shape[1]
+    index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.train(embeddings)
+    index.add(embeddings)
+
+    dense_dir = os.path.join(shard_dir, DENSE_DIRNAME)
+    os.makedirs(dense_dir, exist_ok=True)
+    faiss.write_index(index, os.path.join(dense_dir, "dense.faiss"))
+    np.save(os.path.join(dense_dir, "embeddings_f16.npy"), embeddings.astype(np.float16))
+    with open(os.path.join(dense_dir, "dense.json"), "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "dim": int(dim), "n_chunks": len(texts),
+                   "quantizer": "SQ8", "hnsw_m": HNSW_M, "chunks_fingerprint": fingerprint}, f, indent=2)
+    return dense_dir
+
+
+class DenseIndex:
+    def __init__(self, index, embeddings, meta):
+        self.index = index
+        self.embeddings = embeddings
+        self.meta = meta
+
+    @classmethod
+    def load(cls, shard_dir, fingerprint=None):
+        """يعيد None إن لم يوجد فهرس دلالي أو كان مبنياً على فقرات مختلفة."""
+        dense_dir = os.path.join(shard_dir, DENSE_DIRNAME)
+        meta_path = os.path.join(dense_dir, "dense.json")
+        if not os.path.exists(meta_path): return None
+        with open(meta_path, encoding="utf-8") as f: meta = json.load(f)
+        if fingerprint and meta.get("chunks_fingerprint") != fingerprint:
+            print(f"Dense index in {dense_dir} is stale; rebuild with build_index.py --dense")
+            return None
+
+        import faiss
+        index = faiss.read_index(os.path.join(dense_dir, "dense.faiss"))
+        index.hnsw.efSearch = EF_SEARCH
+        embeddings = np.load(os.path.join(dense_dir, "embeddings_f16.npy"), mmap_mode="r")
+        return cls(index, embeddings, meta)
+
+    def encode(self, queries):
+        return encode(queries, self.meta["model"])
+
+    def search(self, query_embeddings, top_k=2):
+        """(scores, indices) بأبعاد (n, top_k) والفراغ -1، من فهرس HNSW."""
+        scores, indices = self.index.search(np.ascontiguousarray(query_embeddings, dtype=np.float32), top_k)
+        return scores.astype(np.float32), indices.astype(np.int64)
+
+    def search_exact(self, query_embeddings, top_k=2):
+        """بحث شامل على متجهات float16 (مرجع لقياس استدعاء HNSW)."""
+        sims = np.asarray(query_embeddings, dtype=np.float32) @ np.asarray(self.embeddings, dtype=np.float32).T
+        k = min(top_k, sims.shape[1])
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, part, axis=1), axis=1, kind='stable')
+        best = np.take_along_axis(part, order, axis=1)
+        return np.take_along_axis(sims, best, axis=1), best.astype(np.int64)
@@ -4,36 +4,47 @@ Script to generate MCQ questions from math.pdf using OpenAI API.
 
 Usage:
   1) Set OPENAI_API_KEY in your environment.
-  2) Adjust CHAPTER_PAGE_RANGES to match your book.
-  3) Run:  python generate_questions.py
-  4) It will create questions_chX.csv and answers_chX.csv in data/
+  2) Adjust CHAPTER_PAGE_RANGES in book_chapters.py to match your book.
+  3) Run:  python generate_questions.py [--workers 4] [--window-tokens 3000] [--chapters 1 2] [--replace]
+  4) It will create / update questions_chX.csv and answers_chX.csv in data/
+
+Pipeline:
+  - The PDF is parsed once; page text is cached in rag_data/cache/question_gen/ (keyed by file size/mtime).
+  - Each chapter is split into windows of consecutive pages of at most WINDOW_TOKENS tokens,
+    and QUESTIONS_PER_CHAPTER is spread over the windows by size.
+  - Windows are generated concurrently (bounded pool; rate limits are handled by llm_gateway).
+  - Every finished window is checkpointed to its own JSON file, so an interrupted run resumes
+    where it stopped. A window whose output cannot be parsed is retried, then reported and skipped
+    without stopping the run.
+  - Results are merged into data/ with stable ids chapter*10^7 + first page*10^3 + n
+    (bounds-checked: page < 10000, n < 1000); a regenerated window replaces all of its old rows.
 """
 
 import os
+import re
+import sys
 import json
-from typing import List, Dict
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Tuple
 
 import pandas as pd
 from PyPDF2 import PdfReader
-from openai import OpenAI
+from llm_gateway import get_gateway, BATCH, estimate_tokens
+from question_pool import validate_question
+from book_chapters import CHAPTER_PAGE_RANGES
 
 BASE_DIR = os.path.dirname(__file__)
 PDF_PATH = os.path.join(BASE_DIR, "math.pdf")
 DATA_DIR = os.path.join(BASE_DIR, "data")
+CACHE_DIR = os.path.join(BASE_DIR, "rag_data", "cache", "question_gen")
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # ---------------------------------------------------
-# 1) حدّد نطاق الصفحات لكل فصل (عدّلها حسب كتابك)
-#    الأرقام هنا مثال فقط، غيّرها بعد ما تتأكد من الفهرس
+# 1) نطاق الصفحات لكل فصل في book_chapters.py (مشترك مع فهرس البحث، عدّله حسب كتابك)
 # ---------------------------------------------------
-CHAPTER_PAGE_RANGES = {
-    1: (12, 59),   # الفصل 1 من الصفحة 1 إلى 15 (شاملة)
-    2: (62, 101),  # الفصل 2
-    3: (104, 147),  # الفصل 3
-    4: (150, 175),  # الفصل 4
-    5: (177, 223), # الفصل 5
-}
 
 # كم سؤال تبغى لكل فصل
 QUESTIONS_PER_CHAPTER = 15
@@ -41,18 +52,104 @@ QUESTIONS_PER_CHAPTER = 15
 # موديل OpenAI (غيره لو تبي)
 OPENAI_MODEL = "gpt-4o-mini"
 
+# حجم نافذة الصفحات (رموز تقريبية) وعدد الطلبات المتزامنة
+WINDOW_TOKENS = 3000
+MAX_WORKERS = 4
+PARSE_RETRIES = 2  # إعادة الطلب إن لم يكن الرد JSON صالحاً
+PROMPT_VERSION = "gen-v2"  # غيّره عند تعديل البرومبت حتى لا تُستخدم نقاط الحفظ القديمة
+
+# معرف السؤال = الفصل × 10^7 + أول صفحة في النافذة × 10^3 + ترتيبه في النافذة
+ID_PAGE_SLOTS = 10 ** 4      # أرقام الصفحات المسموحة (0..9999)
+ID_WINDOW_SLOTS = 10 ** 3    # أقصى عدد أسئلة في النافذة
+
+
+# ---------------------------------------------------
+# 2) استخراج النص (مرة واحدة لكل ملف، مع ذاكرة على القرص)
+# ---------------------------------------------------
+def _pdf_signature(pdf_path: str) -> str:
+    st = os.stat(pdf_path)
+    return f"{os.path.abspath(pdf_path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def load_page_texts(pdf_path: str, pages: List[int]) -> Dict[int, str]:
+    """
+    نص الصفحات المطلوبة (1-based). يُقرأ الملف بـ PdfReader واحد، وما استُخرج يُحفظ في
+    CACHE_DIR/pages.json فلا يُعاد استخراجه في التشغيل التالي ما لم يتغير الملف.
+    """
+    cache_path = os.path.join(CACHE_DIR, "pages.json")
+    signature = _pdf_signature(pdf_path)
+    cached: Dict[int, str] = {}
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("signature") == signature:
+            cached = {int(k): v for k, v in data["pages"].items()}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    missing = [p for p in pages if p not in cached]
+    if missing:
+        reader = PdfReader(pdf_path)
+        for p in missing:
+            # PyPDF2 يستخدم 0-based index
+            cached[p] = (reader.pages[p - 1].extract_text() or "") if 1 <= p <= len(reader.pages) else ""
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"signature": signature, "pages": cached}, f, ensure_ascii=False)
+        os.replace(tmp, cache_path)
+    return {p: cached[p] for p in pages}
+
 
 def extract_text_from_pages(pdf_path: str, start_page: int, end_page: int) -> str:
     """
     استخراج النص من نطاق صفحات (1-based inclusive).
     """
-    reader = PdfReader(pdf_path)
-    texts = []
-    # PyPDF2 يستخدم 0-based index
-    for i in range(start_page - 1, min(end_page, len(reader.pages))):
-        page = reader.pages[i]
-        texts.append(page.extract_text() or "")
-    return "\n".join(texts)
+    texts = load_page_texts(pdf_path, list(range(start_page, end_page + 1)))
+    return "\n".join(texts[p] for p in range(start_page, end_page + 1))
+
+
+# ---------------------------------------------------
+# 3) تقسيم الفصل إلى نوافذ محدودة الرموز
+# ---------------------------------------------------
+def _tokens(text: str) -> int:
+    return estimate_tokens([{"content": text}], max_tokens=0)
+
+
+def page_windows(page_texts: Dict[int, str], max_tokens: int = WINDOW_TOKENS) -> List[Tuple[int, int, str]]:
+    """
+    [(أول صفحة، آخر صفحة، النص)] لصفحات متتالية لا يتجاوز نص كل نافذة max_tokens
+    (الصفحة الأطول من الحد تصبح نافذة وحدها). الصفحات الفارغة تُتجاهل.
+    """
+    windows, current, size = [], [], 0
+    for page in sorted(page_texts):
+        text = page_texts[page].strip()
+        if not text: continue
+        n = _tokens(text)
+        if current and size + n > max_tokens:
+            windows.append(current)
+            current, size = [], 0
+        current.append((page, text))
+        size += n
+    if current: windows.append(current)
+    return [(w[0][0], w[-1][0], "\n".join(t for _, t in w)) for w in windows]
+
+
+def split_questions(total: int, windows: List[Tuple[int, int, str]]) -> List[int]:
+    """توزيع total سؤال على النوافذ بنسبة حجمها (أكبر باقٍ)، بسؤال واحد على الأقل لكل نافذة إن أمكن."""
+    if not windows: return []
+    sizes = [_tokens(text) for _, _, text in windows]
+    shares = [total * s / sum(sizes) for s in sizes]
+    counts = [max(1, int(x)) if total >= len(windows) else int(x) for x in shares]
+    order = sorted(range(len(windows)), key=lambda i: shares[i] - int(shares[i]), reverse=True)
+    i = 0
+    while sum(counts) < total:
+        counts[order[i % len(order)]] += 1
+        i += 1
+    while sum(counts) > total:
+        j = max(range(len(counts)), key=lambda k: counts[k])
+        counts[j] -= 1
+    return counts
 
 
 def build_prompt(text: str, chapter: int, pages_range: tuple, num_questions: int) -> str:
@@ -78,7 +175,6 @@ def build_prompt(text: str, chapter: int, pages_range: tuple, num_questions: int
 
 [
   {{
-    "question_id": 1,
     "question": "نص السؤال هنا",
     "option_a": "الاختيار أ",
     "option_b": "الاختيار ب",
@@ -96,115 +192,210 @@ def build_prompt(text: str, chapter: int, pages_range: tuple, num_questions: int
     """.strip()
 
 
+# ---------------------------------------------------
+# 4) الاستدعاء والتحليل
+# ---------------------------------------------------
+def parse_questions(content: str) -> List[Dict]:
+    """
+    قائمة الأسئلة من رد الموديل (يتحمل أسوار ```json والنص قبل المصفوفة أو بعدها).
+    يرفع ValueError إن لم يوجد JSON صالح.
+    """
+    content = re.sub(r"^```(?:json)?|```$", "", content.strip(), flags=re.MULTILINE).strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        start, end = content.find("["), content.rfind("]")
+        if start < 0 or end <= start: raise ValueError("no JSON array in model output")
+        data = json.loads(content[start:end + 1])  # JSONDecodeError فرع من ValueError
+    if isinstance(data, dict):
+        # لو رجع dict بدل list
+        data = data.get("questions", [data])
+    if not isinstance(data, list): raise ValueError("model output is not a JSON array")
+    return data
+
+
 def call_openai_for_questions(prompt: str) -> List[Dict]:
     """
-    استدعاء OpenAI API وإرجاع قائمة أسئلة (قواميس).
+    استدعاء OpenAI API وإرجاع قائمة أسئلة (قواميس)، مع إعادة الطلب إن لم يكن الرد JSON صالحاً.
     """
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("يرجى ضبط متغير البيئة OPENAI_API_KEY قبل التشغيل.")
 
-    client = OpenAI(api_key=api_key)
+    for attempt in range(PARSE_RETRIES + 1):
+        completion = get_gateway(api_key).chat(
+            priority=BATCH,
+            deadline_sec=120,
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": "You are a helpful AI that outputs ONLY valid JSON."},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.4,
+        )
+        content = completion.choices[0].message.content.strip()
+        try:
+            return parse_questions(content)
+        except ValueError as e:
+            print(f"Failed to parse JSON from model output (attempt {attempt + 1}): {e}")
+            if attempt == PARSE_RETRIES: raise
+
 
-    completion = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": "You are a helpful AI that outputs ONLY valid JSON."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.4,
-    )
+# ---------------------------------------------------
+# 5) نقاط الحفظ (نافذة لكل ملف)
+# ---------------------------------------------------
+def window_key(chapter: int, start: int, end: int, text: str, n: int) -> str:
+    h = hashlib.sha1(f"{PROMPT_VERSION}|{OPENAI_MODEL}|{n}|{text}".encode("utf-8")).hexdigest()[:12]
+    return f"ch{chapter}_p{start:03d}-{end:03d}_{h}"
 
-    content = completion.choices[0].message.content.strip()
 
-    # نتوقع JSON كامل
+def load_checkpoint(key: str):
     try:
-        data = json.loads(content)
-        if isinstance(data, dict):
-            # لو رجع dict بدل list
-            data = [data]
-        return data
-    except json.JSONDecodeError:
-        # في حال خرب JSON، نطبع للمراجعة
-        print("Failed to parse JSON from model output:")
-        print(content)
-        raise
+        with open(os.path.join(CACHE_DIR, "windows", f"{key}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(key: str, questions: List[Dict]):
+    path = os.path.join(CACHE_DIR, "windows", f"{key}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(questions, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)  # ملف كامل أو لا شيء، حتى لو توقف التشغيل أثناء الكتابة
+
+
+def question_id(chapter: int, start: int, i: int) -> int:
+    """معرف ثابت حسابي (لا دمج نصوص، فلا يتداخل حقلان إذا كبر أحدهما)."""
+    if not 0 <= i < ID_WINDOW_SLOTS: raise ValueError(f"question index {i} out of range for one window")
+    if not 0 <= start < ID_PAGE_SLOTS: raise ValueError(f"page {start} out of range for question ids")
+    return (int(chapter) * ID_PAGE_SLOTS + start) * ID_WINDOW_SLOTS + i
+
+
+def window_ids(chapter: int, start: int) -> set:
+    """كل المعرفات التي قد تكون لأسئلة نافذة سابقة تبدأ بهذه الصفحة (مع الصيغة النصية القديمة)."""
+    ids = {str(question_id(chapter, start, i)) for i in range(ID_WINDOW_SLOTS)}
+    if start < 1000: ids |= {f"{chapter}{start:03d}{i:02d}" for i in range(100)}  # <الفصل><الصفحة:03d><n:02d>
+    return ids
+
+
+def generate_window(chapter: int, start: int, end: int, text: str, n: int) -> List[Dict]:
+    """أسئلة نافذة واحدة (من نقطة الحفظ إن وُجدت) بمعرفات ثابتة (question_id)."""
+    key = window_key(chapter, start, end, text, n)
+    questions = load_checkpoint(key)
+    if questions is None:
+        raw = call_openai_for_questions(build_prompt(text, chapter, (start, end), n))
+        questions = []
+        for q in raw:
+            valid = validate_question(q)
+            if valid is None: continue  # تجاهل سؤال غير مضبوط
+            valid["concept"] = str(q.get("concept") or "").strip() or "مفهوم عام"
+            questions.append(valid)
+            if len(questions) == min(n, ID_WINDOW_SLOTS): break  # المعرف يتسع لـ 1000 سؤال في النافذة
+        save_checkpoint(key, questions)
+    # المعرفات تُحسب عند كل تحميل، فنقاط الحفظ القديمة (بالصيغة النصية) تأخذ الصيغة الحالية
+    for i, q in enumerate(questions): q["question_id"] = question_id(chapter, start, i)
+    return questions
 
 
-def save_questions_and_answers(chapter: int, questions: List[Dict]):
+# ---------------------------------------------------
+# 6) الدمج في data/
+# ---------------------------------------------------
+def save_questions_and_answers(chapter: int, questions: List[Dict], replace: bool = False, windows=()):
     """
-    حفظ ناتج الموديل إلى:
+    دمج ناتج الموديل في:
     - data/questions_ch{chapter}.csv
     - data/answers_ch{chapter}.csv
+    الأسئلة الموجودة تبقى كما هي (إلا مع replace=True)، عدا ذات المعرف نفسه وكل أسئلة النوافذ
+    المعاد توليدها (windows: أول صفحة لكل نافذة) فتُحذف قبل الدمج حتى لا تبقى معرفاتها القديمة.
     """
     if not questions:
-        return
-
-    # ترتيب الحقول في ملف الأسئلة
-    q_rows = []
-    a_rows = []
-
-    for q in questions:
-        qid = int(q.get("question_id", 0))
-        q_text = q.get("question", "").strip()
-        option_a = q.get("option_a", "").strip()
-        option_b = q.get("option_b", "").strip()
-        option_c = q.get("option_c", "").strip()
-        option_d = q.get("option_d", "").strip()
-        correct_option = q.get("correct_option", "").strip().lower()
-        concept = q.get("concept", "").strip()
-
-        if correct_option not in ["a", "b", "c", "d"]:
-            continue  # تجاهل سؤال غير مضبوط
-
-        q_rows.append({
-            "question_id": qid,
-            "question": q_text,
-            "option_a": option_a,
-            "option_b": option_b,
-            "option_c": option_c,
-            "option_d": option_d,
-            "concept": concept if concept else "مفهوم عام",
-        })
-
-        a_rows.append({
-            "question_id": qid,
-            "correct_option": correct_option,
-        })
-
-    if not q_rows:
         print(f"[Chapter {chapter}] لا توجد أسئلة صالحة للحفظ.")
         return
 
-    questions_df = pd.DataFrame(q_rows).sort_values("question_id")
-    answers_df = pd.DataFrame(a_rows).sort_values("question_id")
+    new = pd.DataFrame(questions)
+    new["chapter"] = chapter
+    new = new[["question_id", "question", "option_a", "option_b", "option_c", "option_d",
+               "correct_option", "concept", "chapter"]]
 
     q_path = os.path.join(DATA_DIR, f"questions_ch{chapter}.csv")
     a_path = os.path.join(DATA_DIR, f"answers_ch{chapter}.csv")
 
-    questions_df.to_csv(q_path, index=False)
-    answers_df.to_csv(a_path, index=False)
-
-    print(f"[Chapter {chapter}] Saved {len(questions_df)} questions to {q_path}")
+    questions_df, answers_df = new, new[["question_id", "correct_option"]]
+    if not replace and os.path.exists(q_path):
+        stale = set(new["question_id"].astype(str)).union(*(window_ids(chapter, start) for start in windows))
+        old_q = pd.read_csv(q_path, dtype={"question_id": str})
+        keep = ~old_q["question_id"].isin(stale)
+        questions_df = pd.concat([old_q[keep], new.astype({"question_id": str})], ignore_index=True)
+        if os.path.exists(a_path):
+            old_a = pd.read_csv(a_path, dtype={"question_id": str})
+            old_a = old_a[~old_a["question_id"].isin(stale)]
+            answers_df = pd.concat([old_a, answers_df.astype({"question_id": str})], ignore_index=True)
+
+    questions_df = questions_df.sort_values("question_id", key=lambda s: pd.to_numeric(s, errors="coerce"))
+    answers_df = answers_df.sort_values("question_id", key=lambda s: pd.to_numeric(s, errors="coerce"))
+
+    # نكتب ملفاً مؤقتاً ثم نستبدل، حتى لا يقرأ بنك الأسئلة ملفاً نصف مكتوب
+    for df, path in ((questions_df, q_path), (answers_df, a_path)):
+        df.to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    print(f"[Chapter {chapter}] Saved {len(new)} new questions ({len(questions_df)} total) to {q_path}")
     print(f"[Chapter {chapter}] Saved answers to {a_path}")
 
 
-def main():
-    if not os.path.exists(PDF_PATH):
-        raise FileNotFoundError(f"لم يتم العثور على math.pdf في: {PDF_PATH}")
+def run(chapters=None, workers: int = MAX_WORKERS, window_tokens: int = WINDOW_TOKENS,
+        per_chapter: int = QUESTIONS_PER_CHAPTER, replace: bool = False, pdf_path: str = PDF_PATH) -> int:
+    """يولد أسئلة الفصول المطلوبة ويعيد عدد النوافذ التي فشلت (تُعاد في التشغيل التالي)."""
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"لم يتم العثور على math.pdf في: {pdf_path}")
 
-    for chapter, pages_range in CHAPTER_PAGE_RANGES.items():
-        start_p, end_p = pages_range
-        print(f"\n=== معالجة الفصل {chapter} (صفحات {start_p}–{end_p}) ===")
+    ranges = {ch: r for ch, r in CHAPTER_PAGE_RANGES.items() if not chapters or ch in chapters}
+    all_pages = sorted({p for s, e in ranges.values() for p in range(s, e + 1)})
+    texts = load_page_texts(pdf_path, all_pages)
 
-        text = extract_text_from_pages(PDF_PATH, start_p, end_p)
-        if not text.strip():
+    jobs = []
+    for chapter, (start_p, end_p) in ranges.items():
+        windows = page_windows({p: texts[p] for p in range(start_p, end_p + 1)}, window_tokens)
+        if not windows:
             print(f"[Chapter {chapter}] لا يوجد نص مستخرج من هذه الصفحات، تخطي.")
             continue
+        counts = split_questions(per_chapter, windows)
+        jobs.extend((chapter, s, e, text, n) for (s, e, text), n in zip(windows, counts) if n > 0)
+        print(f"=== الفصل {chapter} (صفحات {start_p}–{end_p}): {len(windows)} نافذة ===")
+
+    results: Dict[Tuple[int, int], List[Dict]] = {}
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(generate_window, *job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            chapter, start, end = futures[future][:3]
+            try:
+                results[(chapter, start)] = future.result()
+                print(f"[{done}/{len(jobs)}] الفصل {chapter} صفحات {start}–{end}: {len(results[(chapter, start)])} سؤال")
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(jobs)}] الفصل {chapter} صفحات {start}–{end}: فشل ({e})")
+
+    for chapter in ranges:
+        starts = [start for (ch, start) in sorted(results) if ch == chapter]
+        questions = [q for start in starts for q in results[(chapter, start)]]
+        save_questions_and_answers(chapter, questions, replace, starts)
+    if failed: print(f"⚠️ {failed} نافذة فشلت؛ أعد التشغيل لاستكمالها (النوافذ المكتملة محفوظة).")
+    return failed
 
-        prompt = build_prompt(text, chapter, pages_range, QUESTIONS_PER_CHAPTER)
-        questions = call_openai_for_questions(prompt)
-        save_questions_and_answers(chapter, questions)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate chapter MCQs from the book PDF")
+    parser.add_argument("--chapters", type=int, nargs="*", help="chapters to generate (default: all)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--window-tokens", type=int, default=WINDOW_TOKENS)
+    parser.add_argument("--questions", type=int, default=QUESTIONS_PER_CHAPTER, help="questions per chapter")
+    parser.add_argument("--replace", action="store_true", help="overwrite chapter files instead of merging")
+    parser.add_argument("--pdf", default=PDF_PATH)
+    args = parser.parse_args()
+    failed = run(args.chapters, args.workers, args.window_tokens, args.questions, args.replace, args.pdf)
+    sys.exit(1 if failed else 0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""
+محرك التصحيح المتجه (NumPy) لاختبار واحد أو لدفعات كبيرة من المحاولات.
+
+نفس قاعدة grade_attempt الأصلية: الإجابة صحيحة إذا طابقت مفتاح الإجابة (مثل option_a)
+أو نص الخيار الذي يشير إليه المفتاح. الخيارات تُحوّل مرة واحدة إلى فهارس (0-3) ثم
+تُحسب الصحة والمفاهيم الضعيفة والنسبة بعمليات على المصفوفات بدلاً من iterrows.
+
+الأشكال:
+  - مصفوفة طلاب × أسئلة: grade_matrix(questions, answers) لاختبار موحد لعدة طلاب.
+  - صفوف طويلة متوازية (سؤال وإجابة في كل صف): grade_rows للتصحيح الشامل للسجلات.
+"""
+import numpy as np
+import pandas as pd
+
+OPTION_KEYS = np.array(["option_a", "option_b", "option_c", "option_d"])
+NO_ANSWER = "None"  # ما يسجله النموذج الأصلي عند عدم الإجابة (str(None))
+
+
+def _text(values):
+    return np.char.strip(np.asarray(pd.Series(values, dtype=object).astype(str).to_numpy(), dtype=str))
+
+
+def resolve_questions(questions):
+    """
+    (نصوص الخيارات (n, 4)، المفاتيح (n,)، فهرس الخيار الصحيح (n,) أو -1، نص الإجابة الصحيحة (n,)).
+    المفتاح قد يكون اسم خيار أو نص الإجابة نفسه.
+    """
+    n = len(questions)
+    options = np.stack([_text(questions[k]) if k in questions.columns else np.full(n, "nan")
+                        for k in OPTION_KEYS], axis=1) if n else np.empty((0, 4), dtype=str)
+    keys = _text(questions['correct_option']) if n else np.empty(0, dtype=str)
+    key_idx = _choice_index(options, keys)
+    # نص الإجابة الصحيحة كما يُعرض للطالب (row.get(ca, ca) في الأصل)
+    key_text = np.where(np.isin(keys, OPTION_KEYS), options[np.arange(n), np.maximum(key_idx, 0)], keys) if n else keys
+    return options, keys, key_idx, key_text
+
+
+def _choice_index(options, answers):
+    """فهرس الخيار (0-3) لكل إجابة سواء كانت اسم الخيار أو نصه، أو -1. يقبل أي أبعاد مع بث options."""
+    idx = np.full(np.shape(answers), -1, dtype=np.int8)
+    for k in range(len(OPTION_KEYS) - 1, -1, -1):  # العكس حتى يفوز أول خيار عند تكرار النص
+        hit = (answers == OPTION_KEYS[k]) | (answers == options[..., k])
+        idx = np.where(hit, k, idx)
+    return idx
+
+
+def grade_rows(options, keys, key_text, answers):
+    """(صحيحة؟، فهرس الخيار المختار) لصفوف متوازية؛ answers و keys بنفس الشكل مع بث options (…, 4)."""
+    answers = np.char.strip(np.asarray(answers, dtype=str))
+    choice = _choice_index(options, answers)
+    correct = (answers == keys) | (answers == key_text)
+    return correct, choice
+
+
+def grade_matrix(questions, answers):
+    """
+    تصحيح مصفوفة إجابات (طلاب × أسئلة) لنفس الأسئلة.
+    answers: DataFrame أعمدته question_id، أو مصفوفة بترتيب أسئلة questions، أو قائمة قواميس {question_id: إجابة}.
+    يعيد dict: correct (bool s×q)، choice (s×q)، n_correct، accuracy، concepts، concept_wrong (s×c)، weak (bool s×c).
+    """
+    qids = questions['question_id'].astype(str).tolist()
+    if isinstance(answers, pd.DataFrame):
+        answers = answers.rename(columns=str).reindex(columns=qids).fillna(NO_ANSWER).to_numpy(dtype=str)
+    elif len(answers) and isinstance(answers[0], dict):
+        answers = np.array([[str(a.get(q)) for q in qids] for a in answers], dtype=str)
+    answers = np.atleast_2d(np.asarray(answers, dtype=str))
+
+    options, keys, key_idx, key_text = resolve_questions(questions)
+    correct, choice = grade_rows(options[None, :, :], keys[None, :], key_text[None, :], answers)
+
+    concepts, codes = concept_codes(questions)
+    onehot = np.zeros((len(qids), len(concepts)), dtype=np.int32)
+    onehot[np.arange(len(qids)), codes] = 1
+    concept_wrong = (~correct).astype(np.int32) @ onehot
+    n_q = len(qids)
+    n_correct = correct.sum(axis=1)
+    return {
+        "question_ids": qids,
+        "correct": correct,
+        "choice": choice,
+        "n_correct": n_correct,
+        "accuracy": (n_correct / n_q) * 100 if n_q else np.zeros(len(answers)),
+        "concepts": concepts,
+        "concept_wrong": concept_wrong,
+        "weak": concept_wrong > 0,
+        "key_text": key_text,
+    }
+
+
+def concept_codes(questions):
+    """(أسماء المفاهيم بترتيب ظهورها، رمز المفهوم لكل سؤال)."""
+    codes, uniques = pd.factorize(questions['concept'].astype(object).where(questions['concept'].notna(), "nan"))
+    return list(uniques), codes
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Vectorized grading utilities")
+    parser.add_argument("--regrade", action="store_true",
+                        help="regrade all recorded answers with the current answer keys and update the reports")
+    args = parser.parse_args()
+    if args.regrade:
+        import rag_core
+        print(f"Regraded: {rag_core.regrade_all()} answers changed")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+قراءة سجلات المحاولات التاريخية الكبيرة على دفعات بأنواع مضغوطة: من سجل المحاولات
+(reports/attempts.sqlite، المصدر الفعلي) افتراضياً، أو من ملفات reports/*.csv بـ --from-csv.
+
+pd.read_csv/read_sql_query الافتراضيان يحمّلان الجدول كاملاً ويخزنان اسم الطالب والمفهوم
+نصاً بايثونياً في كل صف؛ لسجل سنوات هذا مئات الميغابايت لكل عملية. هنا:
+  - تُقرأ الجداول بدفعات (CHUNK_ROWS صف، بترتيب الإدخال) بأنواع صريحة: category للأسماء
+    والمفاهيم، أعداد صغيرة للفصل والمحاولة والصحيح، float32 للنسبة والزمن.
+  - كل دفعة تُطوى فوراً في تجميعات صغيرة (ملخص الطلاب، إحصاء المفاهيم، تكرار المفاهيم
+    الضعيفة) فلا يبقى في الذاكرة إلا دفعة واحدة والتجميعات.
+  - export_columnar يكتب السجل بصيغة عمودية (Parquet أو Feather) لتحميل لاحق أسرع وأصغر.
+
+التشغيل:
+  python history_loader.py --summary              (ملخص الطلاب وأصعب المفاهيم من reports/attempts.sqlite)
+  python history_loader.py --export rag_data/history --format parquet
+  python history_loader.py --summary --from-csv --reports /path/to/csv_dir
+المقارنة بالقراءة الكاملة: python -m benchmarks.history_memory
+"""
+import os
+import argparse
+
+import pandas as pd
+
+import storage
+from attempt_store import REPORTS_DIR, STORE_PATH, CSV_FILES, SUMMARY_COLUMNS, ATTEMPT_COLUMNS, CONCEPT_COLUMNS, \
+    ANSWER_COLUMNS
+
+CHUNK_ROWS = 1_000_000
+
+ATTEMPT_DTYPES = {
+    "student": "category", "chapter": "Int8", "attempt": "Int16", "total": "Int16", "correct": "Int16",
+    "accuracy": "float32", "weak_concepts": "category", "time_sec": "float32", "attempt_id": str,
+}
+CONCEPT_DTYPES = {
+    "student": "category", "chapter": "Int8", "attempt": "Int16", "concept": "category", "correct": "Int8",
+    "total": "Int8", "accuracy": "float32", "attempt_id": str,
+}
+ANSWER_DTYPES = {
+    "attempt_id": str, "student": "category", "chapter": "Int8", "attempt": "Int16", "question_id": "category",
+    "concept": "category", "answer": "category", "is_correct": "Int8",
+}
+DTYPES = {"attempts": ATTEMPT_DTYPES, "concept_history": CONCEPT_DTYPES, "answers": ANSWER_DTYPES}
+STORE_COLUMNS = {"attempts": ATTEMPT_COLUMNS, "concept_history": CONCEPT_COLUMNS, "answers": ANSWER_COLUMNS}
+
+
+def read_chunks(path, dtypes, chunksize=CHUNK_ROWS, usecols=None):
+    """دفعات DataFrame بالأنواع المضغوطة (الأعمدة غير الموجودة في الملف تُتجاهل)."""
+    if not os.path.exists(path) or not os.path.getsize(path): return
+    header = pd.read_csv(path, nrows=0).columns
+    cols = [c for c in (usecols or header) if c in header]
+    yield from pd.read_csv(path, usecols=cols, dtype={c: t for c, t in dtypes.items() if c in cols},
+                           chunksize=chunksize)
+
+
+def read_store_chunks(path, table, chunksize=CHUNK_ROWS, usecols=None):
+    """دفعات جدول من سجل المحاولات (SQLite) بترتيب الإدخال وبالأنواع المضغوطة نفسها."""
+    if not os.path.exists(path): return
+    cols = [c for c in (usecols or STORE_COLUMNS[table]) if c in STORE_COLUMNS[table]]
+    dtypes = DTYPES[table]
+    chunks = pd.read_sql_query(f"SELECT {', '.join(cols)} FROM {table} ORDER BY id", storage.connect(path),
+                               chunksize=chunksize)
+    for chunk in chunks:
+        yield chunk.astype({c: t for c, t in dtypes.items() if c in cols and t != str})
+
+
+def history_chunks(reports_dir, table, chunksize=CHUNK_ROWS, usecols=None, from_csv=False):
+    """دفعات table من reports_dir/attempts.sqlite، أو من ملف CSV المقابل مع from_csv."""
+    if from_csv:
+        return read_chunks(os.path.join(reports_dir, CSV_FILES[table]), DTYPES[table], chunksize, usecols)
+    return read_store_chunks(os.path.join(reports_dir, os.path.basename(STORE_PATH)), table, chunksize, usecols)
+
+
+class StudentSummaryFold:
+    """ملخص الطالب (كأعمدة AttemptStore.summary) من دفعات attempts بترتيب الملف."""
+
+    def __init__(self):
+        self._acc = None
+
+    def add(self, chunk):
+        g = chunk.groupby("student", observed=True, sort=False)
+        acc = g['accuracy']
+        part = pd.DataFrame({"n": g.size(), "best": acc.max(), "first": acc.first(), "last": acc.last(),
+                             "time": g['time_sec'].sum()}).astype("float64")
+        part.index = part.index.astype(str)
+        if self._acc is not None: part = pd.concat([self._acc, part])
+        self._acc = part.groupby(level=0, sort=False).agg(
+            {"n": "sum", "best": "max", "first": "first", "last": "last", "time": "sum"})
+
+    def result(self):
+        if self._acc is None: return pd.DataFrame(columns=SUMMARY_COLUMNS)
+        a = self._acc
+        return pd.DataFrame({
+            "student": a.index, "best_accuracy": a['best'].to_numpy(), "last_accuracy": a['last'].to_numpy(),
+            "improvement_pct": (a['last'] - a['first']).to_numpy(), "avg_time_sec": (a['time'] / a['n']).to_numpy(),
+        }, columns=SUMMARY_COLUMNS)
+
+
+class ConceptStatsFold:
+    """عدد الإجابات والصحيح منها لكل (مفهوم، فصل) من دفعات concept_history."""
+
+    def __init__(self):
+        self._acc = None
+
+    def add(self, chunk):
+        part = chunk.groupby(["concept", "chapter"], observed=True, sort=False)['correct'].agg(["count", "sum"])
+        part.index = part.index.set_levels(part.index.levels[0].astype(str), level=0)
+        part = part.astype("int64")
+        self._acc = part if self._acc is None else self._acc.add(part, fill_value=0).astype("int64")
+
+    def result(self, chapters=None):
+        """(concept, total_attempts, correct, success_rate %) كما في AttemptStore.concept_stats."""
+        if self._acc is None: return pd.DataFrame(columns=["concept", "total_attempts", "correct", "success_rate"])
+        acc = self._acc
+        if chapters is not None: acc = acc[acc.index.get_level_values("chapter").isin(list(chapters))]
+        df = acc.groupby(level="concept").sum().rename(columns={"count": "total_attempts", "sum": "correct"})
+        df = df.reset_index().sort_values("concept", ignore_index=True)
+        df['success_rate'] = df['correct'] * 100.0 / df['total_attempts'].where(df['total_attempts'] > 0)
+        return df
+
+
+class WeakConceptFold:
+    """كم مرة ظهر كل مفهوم في weak_concepts (النص المفصول بـ ; يُقسم مرة لكل تركيبة مختلفة)."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, chunk):
+        for combo, n in chunk['weak_concepts'].value_counts(sort=False).items():
+            if not n: continue
+            for concept in str(combo).split(";"):
+                concept = concept.strip()
+                if concept: self.counts[concept] = self.counts.get(concept, 0) + int(n)
+
+    def result(self):
+        return pd.Series(self.counts, dtype="int64", name="weak_count").sort_values(ascending=False)
+
+
+def fold_history(reports_dir=REPORTS_DIR, chunksize=CHUNK_ROWS, from_csv=False):
+    """يقرأ attempts و concept_history دفعة دفعة ويعيد {summary, concept_stats, weak_concepts}."""
+    summary, weak, concepts = StudentSummaryFold(), WeakConceptFold(), ConceptStatsFold()
+    for chunk in history_chunks(reports_dir, "attempts", chunksize,
+                                ["student", "accuracy", "time_sec", "weak_concepts"], from_csv):
+        summary.add(chunk)
+        weak.add(chunk)
+    for chunk in history_chunks(reports_dir, "concept_history", chunksize, ["concept", "chapter", "correct"],
+                                from_csv):
+        concepts.add(chunk)
+    return {"summary": summary.result(), "concept_stats": concepts.result(), "weak_concepts": weak.result()}
+
+
+# ----------------------------- التصدير العمودي ----------------------------- #
+
+def _arrow_schema(dtypes, columns, fmt):
+    import pyarrow as pa
+    types = {"Int8": pa.int8(), "Int16": pa.int16(), "float32": pa.float32()}
+    # Feather (ملف IPC) لا يقبل قاموساً مختلفاً لكل دفعة، فتُكتب الفئات فيه نصوصاً (مضغوطة) وتُستعاد عند التحميل
+    category = pa.dictionary(pa.int32(), pa.string()) if fmt == "parquet" else pa.string()
+    return pa.schema([(c, category if dtypes.get(c) == "category" else types.get(dtypes.get(c), pa.string()))
+                      for c in columns])
+
+
+def export_columnar(reports_dir=REPORTS_DIR, out_dir=None, fmt="parquet", chunksize=CHUNK_ROWS, from_csv=False):
+    """يكتب attempts و concept_history و answers بصيغة عمودية دفعة دفعة ويعيد {الجدول: المسار}."""
+    import pyarrow as pa
+    if fmt not in ("parquet", "feather"): raise ValueError(f"Unknown format: {fmt}")
+    out_dir = out_dir or os.path.join(reports_dir, "columnar")
+    os.makedirs(out_dir, exist_ok=True)
+    written = {}
+    for name, dtypes in DTYPES.items():
+        out = os.path.join(out_dir, f"{name}.{fmt}")
+        writer = None
+        try:
+            for chunk in history_chunks(reports_dir, name, chunksize, from_csv=from_csv):
+                if writer is None:
+                    schema = _arrow_schema(dtypes, list(chunk.columns), fmt)
+                    if fmt == "parquet":
+                        import pyarrow.parquet as pq
+                        writer = pq.ParquetWriter(out, schema, compression="zstd")
+                    else:
+                        writer = pa.ipc.new_file(out, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+                writer.write_table(pa.Table.from_pandas(chunk, preserve_index=False).cast(schema))
+        finally:
+            if writer is not None: writer.close()
+        if writer is not None: written[name] = out
+    return written
+
+
+def load_columnar(path, columns=None):
+    """يحمّل ملفاً صدّره export_columnar بالأنواع المضغوطة نفسها."""
+    df = pd.read_parquet(path, columns=columns) if path.endswith(".parquet") else pd.read_feather(path, columns=columns)
+    name = os.path.basename(path).rsplit(".", 1)[0]
+    dtypes = DTYPES.get(name, {})
+    return df.astype({c: t for c, t in dtypes.items() if c in df.columns and t != str})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked loader for large attempt histories")
+    parser.add_argument("--reports", default=REPORTS_DIR)
+    parser.add_argument("--summary", action="store_true", help="fold the history into summaries")
+    parser.add_argument("--export", metavar="DIR", help="write the history to a columnar format")
+    parser.add_argument("--format", choices=["parquet", "feather"], default="parquet")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--from-csv", action="store_true",
+                        help="read reports/*.csv instead of the attempt store (attempts.sqlite)")
+    args = parser.parse_args()
+
+    if args.summary:
+        result = fold_history(args.reports, args.chunk_rows, args.from_csv)
+        print(result["summary"].describe().to_string())
+        print(result["concept_stats"].sort_values("success_rate").head(10).to_string(index=False))
+    if args.export:
+        for name, path in export_columnar(args.reports, args.export, args.format, args.chunk_rows,
+                                               args.from_csv).items():
+            print(f"{name}: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    if not (args.summary or args.export): parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
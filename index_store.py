@@ -0,0 +1,307 @@
+"""
+تخزين فهرس RAG على القرص بصيغة ثنائية بلا pickle.
+
+مجلد الفهرس (rag_data/index) يحتوي:
+  meta.json                      رقم الصيغة وإصدار المحلل (analyzer.py) وإعداداته، ونطاق صفوف كل فصل
+  tfidf_{data,indices,indptr}    مصفوفة TF-IDF بصيغة CSR
+  idf.npy                        أوزان IDF لكل مصطلح
+  vocab_{offsets,blob}           المفردات كجدول نصوص مرتب (إزاحات + نص UTF-8 متصل)
+  chunk_{offsets,blob,pages}     نصوص الفقرات وأرقام صفحاتها
+  post_*                         الفهرس المقلوب (sparse_index.InvertedIndex)
+
+التحميل يتم بـ np.load(mmap_mode='r') فتتشارك عمليات student_app و teacher_app
+على نفس الجهاز ذاكرة الصفحات، ويكون الإقلاع شبه فوري.
+
+المكتبة متعددة الكتب تُخزن كأجزاء (shards) مستقلة: rag_data/shards/<doc_id>/index.
+"""
+import os
+import json
+import hashlib
+import shutil
+import pickle
+from bisect import bisect_left
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from sparse_index import InvertedIndex
+from book_chapters import BOOK_CHAPTERS, chapter_rows
+import analyzer
+
+FORMAT_VERSION = 1
+INDEX_DIRNAME = "index"
+SHARDS_DIRNAME = "shards"
+DEFAULT_DOC_ID = "math"  # الكتاب الوحيد في الفهارس السابقة للمكتبة
+
+
+# ----------------------------- جداول النصوص ----------------------------- #
+
+def _write_strings(dir_path, name, strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    np.save(os.path.join(dir_path, f"{name}_offsets.npy"), offsets)
+    with open(os.path.join(dir_path, f"{name}_blob.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+
+
+class StringTable:
+    """تسلسل نصوص للقراءة فقط فوق ملف إزاحات وملف نص متصل (كلاهما mmap)."""
+
+    def __init__(self, dir_path, name):
+        self.offsets = np.load(os.path.join(dir_path, f"{name}_offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(dir_path, f"{name}_blob.bin")
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError(i)
+        return self.raw(i).decode("utf-8")
+
+
+class _RawView:
+    """عرض بايتات الجدول لاستخدام bisect (ترتيب UTF-8 يطابق ترتيب نقاط Unicode)."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, i):
+        return self.table.raw(i)
+
+
+class ChunkStore:
+    """فقرات الكتاب كتسلسل قواميس {"text", "page"} تُقرأ عند الطلب."""
+
+    def __init__(self, dir_path):
+        self.texts = StringTable(dir_path, "chunk")
+        self.pages = np.load(os.path.join(dir_path, "chunk_pages.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, i):
+        i = int(i)
+        return {"text": self.texts[i], "page": int(self.pages[i])}
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+# ----------------------------- محول الاستعلامات ----------------------------- #
+
+class QueryVectorizer:
+    """
+    بديل خفيف لـ TfidfVectorizer.transform يعمل على المفردات و IDF المحفوظة،
+    فلا نحتاج لإعادة بناء قاموس المفردات كاملاً عند الإقلاع. يحلل الاستعلام
+    بنفس إصدار المحلل وإعداداته التي بُني بها الفهرس.
+    """
+
+    def __init__(self, vocab, idf, analyzer_config):
+        self.vocab = vocab
+        self.idf = idf
+        self.analyzer_version = analyzer_config["version"]
+        self.stem = analyzer_config.get("stem", False)
+        self._raw = _RawView(vocab)
+        self._term_ids = {}
+
+    def term_id(self, term):
+        if term not in self._term_ids:
+            key = term.encode("utf-8")
+            pos = bisect_left(self._raw, key)
+            self._term_ids[term] = pos if pos < len(self.vocab) and self.vocab.raw(pos) == key else -1
+        return self._term_ids[term]
+
+    def transform(self, texts):
+        data, indices, indptr = [], [], [0]
+        for text in texts:
+            counts = {}
+            for token in analyzer.analyze_query(str(text), self.analyzer_version, self.stem):
+                t = self.term_id(token)
+                if t >= 0: counts[t] = counts.get(t, 0) + 1
+            cols = np.array(sorted(counts), dtype=np.int32)
+            vals = np.array([counts[c] for c in cols], dtype=np.float64) * self.idf[cols] if len(cols) else np.zeros(0)
+            norm = np.sqrt((vals ** 2).sum())
+            if norm > 0: vals = vals / norm
+            indices.extend(cols.tolist()); data.extend(vals.tolist()); indptr.append(len(indices))
+        return csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr)),
+                          shape=(len(indptr) - 1, len(self.vocab)))
+
+
+# ----------------------------- الفهرس ----------------------------- #
+
+class LegacyQueryVectorizer:
+    """يغلف TfidfVectorizer من ملفات pickle القديمة ويطبق على الاستعلام تحليل الإصدار 0."""
+
+    def __init__(self, vectorizer):
+        self.vectorizer = vectorizer
+
+    def transform(self, texts):
+        return self.vectorizer.transform([" ".join(analyzer.analyze_query(str(t), analyzer.LEGACY_VERSION)) for t in texts])
+
+
+class RagIndex:
+    def __init__(self, vectorizer, matrix, chunks, postings, meta, path=None):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.chunks = chunks
+        self.postings = postings
+        self.meta = meta
+        self.doc_id = meta.get("doc_id", DEFAULT_DOC_ID)
+        self.path = path  # مجلد الفهرس الثنائي (None لملفات pickle القديمة)
+        # {الفصل: (أول صف، آخر صف + 1)}؛ الفهارس السابقة لحفظه تُشتق نطاقاتها من صفحات الفقرات
+        if "chapters" in meta:
+            self.chapters = {str(ch): tuple(rows) for ch, rows in meta["chapters"].items()}
+        else:
+            pages = chunks.pages if isinstance(chunks, ChunkStore) else [c["page"] for c in chunks]
+            self.chapters = chapter_rows(pages, BOOK_CHAPTERS.get(self.doc_id))
+
+
+def _library_version(shards):
+    """بصمة المكتبة المحمّلة: meta.json لكل كتاب ووقت كتابته (كل إعادة بناء تكتب مجلداً جديداً)."""
+    h = hashlib.sha1()
+    for doc_id, index in shards.items():
+        meta_path = os.path.join(index.path, "meta.json") if index.path else None
+        mtime = os.stat(meta_path).st_mtime_ns if meta_path and os.path.exists(meta_path) else 0
+        h.update(json.dumps([doc_id, index.meta, mtime, len(index.chunks)], ensure_ascii=False,
+                            sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class Library:
+    """
+    مجموعة أجزاء الكتب بترتيب ثابت. أرقام الفقرات عامة على مستوى المكتبة:
+    رقم الفقرة في كتابها + إزاحة الكتاب.
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+        self.doc_ids = list(shards)
+        sizes = [len(index.chunks) for index in shards.values()]
+        self.starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64) if sizes else np.zeros(0, np.int64)
+        self.offsets = dict(zip(self.doc_ids, self.starts.tolist()))
+        self.version = _library_version(shards)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def chunk(self, global_id):
+        pos = int(np.searchsorted(self.starts, global_id, side="right")) - 1
+        doc_id = self.doc_ids[pos]
+        row = int(global_id - self.starts[pos])
+        return dict(self.shards[doc_id].chunks[row], doc_id=doc_id, id=f"{doc_id}:{row}")
+
+
+def write_index(rag_dir, vocabulary, idf, matrix, chunks, postings=None, doc_id=DEFAULT_DOC_ID,
+                analyzer_config=None, chapters=None):
+    """
+    كتابة الفهرس إلى rag_dir/index (لجزء كتاب: rag_dir = rag_data/shards/<doc_id>).
+    الكتابة تتم في مجلد مؤقت ثم يُستبدل به المجلد القديم حتى لا تقرأ التطبيقات
+    العاملة فهرساً نصف مكتوب.
+    vocabulary: قائمة المصطلحات مرتبة (رقم المصطلح = موقعه).
+    chapters: {الفصل: (أول صف، آخر صف + 1)} (book_chapters.chapter_rows) إن كانت الفقرات مرتبة بالصفحة.
+    """
+    final_dir = os.path.join(rag_dir, INDEX_DIRNAME)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    matrix = csr_matrix(matrix)
+    matrix.sort_indices()
+    np.save(os.path.join(tmp_dir, "tfidf_data.npy"), matrix.data.astype(np.float32))
+    np.save(os.path.join(tmp_dir, "tfidf_indices.npy"), matrix.indices.astype(np.int32))
+    np.save(os.path.join(tmp_dir, "tfidf_indptr.npy"), matrix.indptr.astype(np.int64))
+    np.save(os.path.join(tmp_dir, "idf.npy"), np.asarray(idf, dtype=np.float64))
+    _write_strings(tmp_dir, "vocab", vocabulary)
+    _write_strings(tmp_dir, "chunk", [c["text"] for c in chunks])
+    np.save(os.path.join(tmp_dir, "chunk_pages.npy"), np.array([c["page"] for c in chunks], dtype=np.int32))
+
+    postings = postings or InvertedIndex.from_matrix(matrix)
+    for name in ("term_ptr", "doc_ids", "weights", "term_max"):
+        np.save(os.path.join(tmp_dir, f"post_{name}.npy"), getattr(postings, name))
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "doc_id": doc_id,
+        "n_chunks": int(matrix.shape[0]),
+        "n_terms": int(matrix.shape[1]),
+        "analyzer": analyzer_config or analyzer.config(),
+    }
+    if chapters: meta["chapters"] = {str(ch): [int(start), int(end)] for ch, (start, end) in chapters.items()}
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    old_dir = final_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(final_dir): os.rename(final_dir, old_dir)
+    os.rename(tmp_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return final_dir
+
+
+def load_binary_index(index_dir):
+    with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"صيغة فهرس غير مدعومة: {meta.get('format_version')}")
+
+    def arr(name):
+        return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+    matrix = csr_matrix((arr("tfidf_data"), arr("tfidf_indices"), arr("tfidf_indptr")),
+                        shape=(meta["n_chunks"], meta["n_terms"]), copy=False)
+    analyzer_config = analyzer.check_config(meta.get("analyzer"), index_dir)
+    vectorizer = QueryVectorizer(StringTable(index_dir, "vocab"), arr("idf"), analyzer_config)
+    postings = InvertedIndex(arr("post_term_ptr"), arr("post_doc_ids"), arr("post_weights"),
+                             arr("post_term_max"), meta["n_chunks"])
+    return RagIndex(vectorizer, matrix, ChunkStore(index_dir), postings, meta, index_dir)
+
+
+def load_legacy_index(rag_dir):
+    """قارئ ملفات pickle القديمة (vectorizer/tfidf_matrix/chunks) للنشرات السابقة."""
+    vec_path = os.path.join(rag_dir, "vectorizer.pkl")
+    mat_path = os.path.join(rag_dir, "tfidf_matrix.pkl")
+    chk_path = os.path.join(rag_dir, "chunks.pkl")
+    if not (os.path.exists(vec_path) and os.path.exists(mat_path)):
+        return None
+
+    with open(vec_path, 'rb') as f: vectorizer = pickle.load(f)
+    with open(mat_path, 'rb') as f: matrix = pickle.load(f)
+    with open(chk_path, 'rb') as f: chunks = pickle.load(f)
+    post_path = os.path.join(rag_dir, "postings.npz")
+    postings = InvertedIndex.load(post_path) if os.path.exists(post_path) else InvertedIndex.from_matrix(matrix)
+    return RagIndex(LegacyQueryVectorizer(vectorizer), matrix, chunks, postings, {"format_version": 0})
+
+
+def load_index(rag_dir):
+    """تحميل الفهرس الثنائي إن وُجد، وإلا ملفات pickle القديمة. يعيد None إن لم يوجد فهرس."""
+    index_dir = os.path.join(rag_dir, INDEX_DIRNAME)
+    if os.path.exists(os.path.join(index_dir, "meta.json")):
+        return load_binary_index(index_dir)
+    return load_legacy_index(rag_dir)
+
+
+def load_library(rag_dir):
+    """
+    تحميل كل أجزاء الكتب في rag_dir/shards. إن لم توجد أجزاء يُحمّل الفهرس المفرد
+    (الثنائي أو pickle القديم) ككتاب واحد.
+    """
+    shards = {}
+    shards_dir = os.path.join(rag_dir, SHARDS_DIRNAME)
+    if os.path.isdir(shards_dir):
+        for doc_id in sorted(os.listdir(shards_dir)):
+            index_dir = os.path.join(shards_dir, doc_id, INDEX_DIRNAME)
+            if os.path.exists(os.path.join(index_dir, "meta.json")):
+                shards[doc_id] = load_binary_index(index_dir)
+    if not shards:
+        index = load_index(rag_dir)
+        if index is not None: shards[index.doc_id] = index
+    return Library(shards)
@@ -0,0 +1,102 @@
+"""
+ذاكرة دائمة لردود نموذج اللغة (SQLite في rag_data/).
+
+المفتاح بصمة (النموذج، إصدار قالب البرومبت، المفهوم، الفقرات المسترجعة)، والفقرات
+تُمثل برقمها مع بصمة نصها حتى لا يُقدّم شرح قديم بعد إعادة بناء الكتاب.
+الإدخالات تنتهي بعد TTL، وعند تجاوز الحد الأقصى يُحذف الأقدم استخداماً (LRU).
+الذاكرة تحسين فقط: أي خطأ SQLite (قاعدة مقفلة، ملف تالف) يُسجل ويُعامل كغياب الإدخال،
+فيكمل المستدعي إلى استدعاء النموذج بدلاً من أن تسقط الصفحة.
+"""
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+
+import storage
+
+DEFAULT_TTL_SEC = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 20000
+EVICT_EVERY = 100         # فحص الحجم كل عدد من الإضافات بدلاً من كل إضافة
+TOUCH_GRANULARITY_SEC = 60  # لا نحدّث وقت آخر استخدام أكثر من مرة في الدقيقة لكل مفتاح
+
+
+def cache_key(model, prompt_version, concept, chunks):
+    parts = [model, prompt_version, str(concept).strip()]
+    for c in chunks:
+        parts.append(f"{c.get('id', '')}#{hashlib.sha1(c['text'].encode('utf-8')).hexdigest()[:16]}")
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path, ttl_sec=DEFAULT_TTL_SEC, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        storage.connect(path).execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                created REAL NOT NULL, last_access REAL NOT NULL
+            )""")
+        storage.connect(path).execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit: self.hits += 1
+            else: self.misses += 1
+
+    def get(self, key):
+        try:
+            return self._get(key)
+        except sqlite3.Error as e:
+            print(f"LLM Cache Error: {e}")
+            self._count(False)
+            return None
+
+    def _get(self, key):
+        conn = storage.connect(self.path)
+        now = time.time()
+        row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl_sec:
+            if row is not None: conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count(False)
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ? AND last_access < ?",
+                     (now, key, now - TOUCH_GRANULARITY_SEC))
+        self._count(True)
+        return row[0]
+
+    def put(self, key, value):
+        try:
+            self._put(key, value)
+        except sqlite3.Error as e:
+            print(f"LLM Cache Error: {e}")
+
+    def _put(self, key, value):
+        conn = storage.connect(self.path)
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO entries (key, value, created, last_access) VALUES (?, ?, ?, ?)",
+                     (key, value, now, now))
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % EVICT_EVERY == 0
+        if evict: self.evict()
+
+    def evict(self):
+        conn = storage.connect(self.path)
+        with storage.transaction(conn):
+            conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl_sec,))
+            size = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if size > self.max_entries:
+                conn.execute("DELETE FROM entries WHERE key IN "
+                             "(SELECT key FROM entries ORDER BY last_access LIMIT ?)", (size - self.max_entries,))
+
+    def stats(self):
+        size = storage.connect(self.path).execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": size,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,209 @@
+"""
+بوابة موحدة لاستدعاءات OpenAI.
+
+- عميل واحد لكل مفتاح API مع مجمع اتصالات HTTP دائم (keep-alive) بدلاً من
+  مصافحة TCP/TLS جديدة في كل استدعاء.
+- عميل AsyncOpenAI واحد أيضاً يعيش في حلقة أحداث دائمة على خيط خلفي (submit)، فلا
+  يُنشأ عميل ومجمع اتصالات جديدان مع كل صفحة نتائج.
+- حدود معدل بطريقة دلو الرموز (Token Bucket) للطلبات والرموز في الدقيقة، تُحجز مرة
+  واحدة لكل استدعاء منطقي (إعادة المحاولة لا تحجز من جديد).
+- أولوية لطلبات الطلاب التفاعلية على مهام المعلم الدفعية، مع حجز جزء من السعة لها.
+- إعادة المحاولة بتأخير أُسّي عشوائي (jitter) ومهلة نهائية لكل استدعاء.
+
+للاختبار محلياً: OPENAI_BASE_URL=http://127.0.0.1:8765/v1 مع python -m benchmarks.openai_stub
+"""
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+INTERACTIVE = 0  # طلبات الطالب (الشرح، الاختبار التعويضي)
+BATCH = 1        # مهام المعلم (الاختبار المركب، التحليل، توليد البنك)
+
+DEFAULT_RPM = int(os.environ.get("EDURAG_LLM_RPM", 3500))
+DEFAULT_TPM = int(os.environ.get("EDURAG_LLM_TPM", 90000))
+BATCH_RESERVE = 0.2           # نسبة من السعة لا تستهلكها المهام الدفعية
+DEFAULT_DEADLINE_SEC = 30.0
+MAX_RETRIES = 4
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_CAP_SEC = 8.0
+MAX_CONNECTIONS = 50
+DEFAULT_COMPLETION_TOKENS = 400  # تقدير رموز الرد عند غياب max_tokens
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                    openai.InternalServerError)
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    pass
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """تقدير تقريبي (حرفان ونصف للرمز في النص العربي) لحجز سعة TPM قبل الاستدعاء."""
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return int(chars / 2.5) + (DEFAULT_COMPLETION_TOKENS if max_tokens is None else max_tokens)
+
+
+class RateLimiter:
+    """
+    دلوان (طلبات/دقيقة ورموز/دقيقة) يُعاد ملؤهما باستمرار. المنتظرون في طابور
+    أولوية: لا يأخذ طلب دفعي سعة ما دام هناك طلب تفاعلي ينتظر.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, batch_reserve=BATCH_RESERVE):
+        self.capacity = {"requests": float(rpm), "tokens": float(tpm)}
+        self.level = dict(self.capacity)
+        self.batch_reserve = batch_reserve
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        for name, cap in self.capacity.items():
+            self.level[name] = min(cap, self.level[name] + cap * elapsed / 60.0)
+
+    def _wait_needed(self, tokens, priority):
+        """الثواني اللازمة حتى تكفي السعة (0 إن كانت متاحة الآن)."""
+        reserve = self.batch_reserve if priority == BATCH else 0.0
+        wait = 0.0
+        for name, need in (("requests", 1.0), ("tokens", float(tokens))):
+            cap = self.capacity[name]
+            need = min(need, cap * (1 - reserve))  # طلب أكبر من الدلو ينتظر امتلاءه فقط
+            missing = need + cap * reserve - self.level[name]
+            if missing > 0: wait = max(wait, missing * 60.0 / cap)
+        return wait
+
+    def acquire(self, tokens, priority=INTERACTIVE, deadline=None):
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    self._refill()
+                    wait = self._wait_needed(tokens, priority) if self._waiters[0] == entry else 0.05
+                    if self._waiters[0] == entry and wait == 0:
+                        self.level["requests"] -= 1
+                        self.level["tokens"] -= min(tokens, self.capacity["tokens"])
+                        return
+                    if deadline is not None and time.monotonic() + wait > deadline:
+                        raise LLMDeadlineExceeded("rate limit wait exceeds call deadline")
+                    self._cond.wait(timeout=min(wait, 1.0) or 0.05)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def refund(self, tokens):
+        """إرجاع الفرق بين الرموز المقدرة والمستهلكة فعلاً."""
+        with self._cond:
+            self.level["tokens"] = min(self.capacity["tokens"], self.level["tokens"] + tokens)
+            self._cond.notify_all()
+
+
+def _backoff(attempt, error=None):
+    retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        try: retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError): pass
+    if retry_after is not None: return min(retry_after, BACKOFF_CAP_SEC)
+    return random.uniform(0, min(BACKOFF_CAP_SEC, BACKOFF_BASE_SEC * 2 ** attempt))  # full jitter
+
+
+class LLMGateway:
+    def __init__(self, api_key, base_url=None, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limiter = RateLimiter(rpm, tpm)
+        self.http_client = httpx.Client(limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                            max_keepalive_connections=MAX_CONNECTIONS))
+        # إعادة المحاولة تتم هنا (مع حدود المعدل والمهلة) لا داخل مكتبة openai
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+        self._loop = None
+        self._async_client = None
+        self._loop_lock = threading.Lock()
+
+    def _prepare(self, kwargs, deadline_sec):
+        deadline = time.monotonic() + deadline_sec
+        tokens = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens"))
+        return deadline, tokens
+
+    def _settle(self, response, tokens):
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.total_tokens < tokens:
+            self.limiter.refund(tokens - usage.total_tokens)
+
+    def chat(self, priority=INTERACTIVE, deadline_sec=DEFAULT_DEADLINE_SEC, **kwargs):
+        """client.chat.completions.create مع حدود المعدل والأولوية وإعادة المحاولة والمهلة."""
+        deadline, tokens = self._prepare(kwargs, deadline_sec)
+        self.limiter.acquire(tokens, priority, deadline)  # مرة واحدة لكل استدعاء، لا لكل محاولة
+        for attempt in range(MAX_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: raise LLMDeadlineExceeded("LLM call deadline exceeded")
+            try:
+                response = self.client.chat.completions.create(timeout=remaining, **kwargs)
+                if not kwargs.get("stream"): self._settle(response, tokens)
+                return response
+            except RETRYABLE_ERRORS as e:
+                delay = _backoff(attempt, e)
+                if attempt == MAX_RETRIES or time.monotonic() + delay >= deadline: raise
+                time.sleep(delay)
+
+    def _event_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-gateway-loop", daemon=True).start()
+                self._async_client = AsyncOpenAI(
+                    api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                    http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                                      max_keepalive_connections=MAX_CONNECTIONS)))
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro):
+        """يشغّل coro في حلقة أحداث البوابة الدائمة ويعيد concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._event_loop())
+
+    def async_client(self):
+        """عميل AsyncOpenAI الدائم للبوابة؛ يُستعمل فقط داخل coroutines مُرسلة بـ submit."""
+        self._event_loop()
+        return self._async_client
+
+    async def achat(self, client, priority=INTERACTIVE, deadline_sec=DEFAULT_DEADLINE_SEC, **kwargs):
+        """نسخة async من chat؛ مع stream=True تشمل إعادة المحاولة فتح البث فقط."""
+        deadline, tokens = self._prepare(kwargs, deadline_sec)
+        await asyncio.to_thread(self.limiter.acquire, tokens, priority, deadline)
+        for attempt in range(MAX_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: raise LLMDeadlineExceeded("LLM call deadline exceeded")
+            try:
+                response = await client.chat.completions.create(timeout=remaining, **kwargs)
+                if not kwargs.get("stream"): self._settle(response, tokens)
+                return response
+            except RETRYABLE_ERRORS as e:
+                delay = _backoff(attempt, e)
+                if attempt == MAX_RETRIES or time.monotonic() + delay >= deadline: raise
+                await asyncio.sleep(delay)
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(api_key, base_url=None):
+    """بوابة واحدة (ومجمع اتصالات وحدود معدل واحدة) لكل مفتاح API في العملية."""
+    key = (api_key, base_url)
+    with _gateways_lock:
+        if key not in _gateways: _gateways[key] = LLMGateway(api_key, base_url)
+        return _gateways[key]
@@ -0,0 +1,202 @@
+"""
+بنك الأسئلة المُجمّع (SQLite في rag_data/) بدلاً من قراءة ودمج ملفات CSV في كل طلب.
+
+يُبنى من data/questions_ch*.csv و data/answers_ch*.csv مع دمج الإجابات مرة واحدة،
+ومفهرس بالفصل والمفهوم ورقم السؤال. لكل سؤال ترتيب متصل داخل فصله (rank) فيصبح
+اختيار عينة عشوائية قراءة مفهرسة لعدد الأسئلة المطلوب فقط، مهما كبر البنك.
+
+يُعاد التجميع تلقائياً عند تغير أي ملف في data/ (بمقارنة mtime والحجم)، ويحتفظ كل
+عملية بنسخة في الذاكرة من الفصول المقروءة تُمسح عند إعادة التجميع.
+"""
+import os
+import re
+import glob
+import time
+import random
+import threading
+
+import pandas as pd
+
+import storage
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+BANK_PATH = os.path.join(BASE_DIR, "rag_data", "question_bank.sqlite")
+
+CHECK_INTERVAL_SEC = 2.0  # أقل فاصل بين فحوص mtime لملفات data/
+OPTION_FIELDS = ("option_a", "option_b", "option_c", "option_d")
+COLUMNS = ("question_id", "question") + OPTION_FIELDS + ("concept", "chapter", "correct_option")
+_CHAPTER_FILE = re.compile(r"questions_ch(\w+)\.csv$")
+
+
+def source_files(data_dir=DATA_DIR):
+    """{الفصل: (ملف الأسئلة، ملف الإجابات)} للفصول التي لها الملفان معاً."""
+    files = {}
+    for q_file in sorted(glob.glob(os.path.join(data_dir, "questions_ch*.csv"))):
+        chapter = _CHAPTER_FILE.search(q_file).group(1)
+        a_file = os.path.join(data_dir, f"answers_ch{chapter}.csv")
+        if os.path.exists(a_file): files[chapter] = (q_file, a_file)
+    return files
+
+
+def signature(files):
+    """بصمة رخيصة لملفات البنك (المسار، mtime_ns، الحجم)."""
+    sig = []
+    for chapter, paths in sorted(files.items()):
+        for path in paths:
+            st = os.stat(path)
+            sig.append(f"{os.path.basename(path)}:{st.st_mtime_ns}:{st.st_size}")
+    return "|".join(sig)
+
+
+def read_chapter(q_file, a_file, chapter):
+    """نفس دمج load_qna_for_chapter الأصلي: الإجابة من ملف الإجابات، والربط برقم السؤال نصاً.
+    تُقرأ القيم نصوصاً كما في الملف (بدون تحويل الأعداد إلى 3.0 وأمثالها)."""
+    q = pd.read_csv(q_file, dtype=str)
+    a = pd.read_csv(a_file, dtype=str)
+    if 'correct_option' in q.columns: q = q.drop(columns=['correct_option'])
+    q['question_id'] = q['question_id'].astype(str)
+    a['question_id'] = a['question_id'].astype(str)
+    df = pd.merge(q, a[['question_id', 'correct_option']], on="question_id", how="inner")
+    df['chapter'] = str(chapter)
+    for col in COLUMNS:
+        if col not in df.columns: df[col] = None
+    return df[list(COLUMNS)]
+
+
+class QuestionBank:
+    def __init__(self, path=BANK_PATH, data_dir=DATA_DIR):
+        self.path = path
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked = 0.0
+        self._chapters = {}   # الفصل -> DataFrame (نسخة العملية)
+        self._counts = {}     # الفصل -> عدد الأسئلة
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = storage.connect(path)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS questions (
+                chapter TEXT NOT NULL, rank INTEGER NOT NULL, question_id TEXT NOT NULL,
+                question TEXT, {", ".join(f"{f} TEXT" for f in OPTION_FIELDS)}, concept TEXT,
+                correct_option TEXT, PRIMARY KEY (chapter, rank)
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS questions_id ON questions(chapter, question_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS questions_concept ON questions(chapter, concept)")
+
+    # ----------------------------- التجميع ----------------------------- #
+
+    def compile(self, files=None):
+        """يعيد بناء الجداول من ملفات CSV في معاملة واحدة (القراء يرون النسخة القديمة حتى الالتزام)."""
+        files = source_files(self.data_dir) if files is None else files
+        sig = signature(files)
+        frames = [read_chapter(q_file, a_file, ch) for ch, (q_file, a_file) in files.items()]
+        conn = storage.connect(self.path)
+        with storage.transaction(conn):
+            conn.execute("DELETE FROM questions")
+            for df in frames:
+                df = df.where(df.notna(), None)
+                conn.executemany(f"""
+                    INSERT OR REPLACE INTO questions (chapter, rank, {", ".join(c for c in COLUMNS if c != "chapter")})
+                    VALUES (?, ?, {", ".join("?" * (len(COLUMNS) - 1))})""",
+                    [(r.chapter, rank, *(None if v is None else str(v) for v in
+                                         (getattr(r, c) for c in COLUMNS if c != "chapter")))
+                     for rank, r in enumerate(df.itertuples(index=False))])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)", (sig,))
+        return sig
+
+    def refresh(self, force=False):
+        """يتأكد أن البنك مطابق لملفات data/ (فحص mtime كل CHECK_INTERVAL_SEC على الأكثر)."""
+        now = time.monotonic()
+        if not force and self._signature is not None and now - self._checked < CHECK_INTERVAL_SEC: return
+        with self._lock:
+            files = source_files(self.data_dir)
+            sig = signature(files)
+            self._checked = now
+            if sig == self._signature and not force: return
+            stored = storage.connect(self.path).execute(
+                "SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            if force or stored is None or stored[0] != sig:
+                t0 = time.perf_counter()
+                self.compile(files)
+                print(f"Question bank compiled ({len(files)} chapters) in {time.perf_counter() - t0:.2f}s")
+            self._signature = sig
+            self._chapters.clear()
+            self._counts = dict(storage.connect(self.path).execute(
+                "SELECT chapter, COUNT(*) FROM questions GROUP BY chapter").fetchall())
+
+    # ----------------------------- القراءة ----------------------------- #
+
+    def _frame(self, rows):
+        return pd.DataFrame(rows, columns=list(COLUMNS))
+
+    def _select(self, where, params):
+        return self._frame(storage.connect(self.path).execute(
+            f"SELECT {', '.join(COLUMNS)} FROM questions WHERE {where}", params).fetchall())
+
+    def chapters(self):
+        self.refresh()
+        return sorted(self._counts, key=lambda c: (len(c), c))
+
+    def chapter(self, chapter):
+        """كل أسئلة الفصل مع الإجابات (نسخة يمكن تعديلها)."""
+        self.refresh()
+        chapter = str(chapter)
+        df = self._chapters.get(chapter)
+        if df is None:
+            df = self._select("chapter = ? ORDER BY rank", (chapter,))
+            with self._lock: self._chapters[chapter] = df
+        return df.copy()
+
+    def sample(self, chapter, n=5):
+        """n أسئلة عشوائية من الفصل عبر مفتاح (chapter, rank) دون قراءة الفصل كاملاً."""
+        self.refresh()
+        chapter = str(chapter)
+        count = self._counts.get(chapter, 0)
+        if count == 0: return self._frame([])
+        ranks = random.sample(range(count), min(n, count))
+        rows = storage.connect(self.path).execute(
+            f"SELECT rank, {', '.join(COLUMNS)} FROM questions "
+            f"WHERE chapter = ? AND rank IN ({','.join('?' * len(ranks))})", (chapter, *ranks)).fetchall()
+        order = {r: i for i, r in enumerate(ranks)}
+        return self._frame([r[1:] for r in sorted(rows, key=lambda r: order[r[0]])])
+
+    def question(self, chapter, question_id):
+        self.refresh()
+        df = self._select("chapter = ? AND question_id = ?", (str(chapter), str(question_id)))
+        return df.iloc[0].to_dict() if len(df) else None
+
+    def concepts(self, chapters=None):
+        """أسماء المفاهيم (بدون تكرار) في الفصول المحددة أو في البنك كله."""
+        return list(dict.fromkeys(c for _, c in self.concept_pairs(chapters)))
+
+    def concept_pairs(self, chapters=None):
+        """[(الفصل، المفهوم)] بترتيب ظهورها في البنك."""
+        self.refresh()
+        conn = storage.connect(self.path)
+        chapters = [str(c) for c in (chapters if chapters is not None else self.chapters())]
+        pairs = []
+        for ch in chapters:
+            pairs.extend(conn.execute("""
+                SELECT chapter, concept FROM questions WHERE chapter = ? AND concept IS NOT NULL AND concept != ''
+                GROUP BY concept ORDER BY MIN(rank)""", (ch,)).fetchall())
+        return [(ch, c.strip()) for ch, c in pairs if c.strip()]
+
+
+_banks = {}
+_banks_lock = threading.Lock()
+
+
+def get_bank(path=BANK_PATH, data_dir=DATA_DIR):
+    """بنك واحد لكل ملف في العملية (مع نسخه المحفوظة في الذاكرة)."""
+    with _banks_lock:
+        if path not in _banks: _banks[path] = QuestionBank(path, data_dir)
+        return _banks[path]
+
+
+if __name__ == "__main__":
+    bank = get_bank()
+    bank.refresh(force=True)
+    for ch in bank.chapters():
+        print(f"Chapter {ch}: {bank._counts[ch]} questions, {len(bank.concepts([ch]))} concepts")
@@ -0,0 +1,251 @@
+"""
+مخزون أسئلة الاختبار التعويضي المولدة مسبقاً (SQLite في rag_data/).
+
+بدلاً من انتظار نموذج اللغة عند الضغط على "بدء الاختبار التعويضي"، تُولّد الأسئلة
+مسبقاً لكل مفهوم في data/questions_ch*.csv وتُتحقق صحتها وتُخزن مفهرسة بالفصل والمفهوم.
+الاختبار التعويضي يصبح استعلاماً محلياً: عينة من أسئلة المفاهيم الضعيفة لم يرها الطالب،
+وعندما يقل المتاح لمفهوم يُعاد ملؤه في الخلفية.
+
+التعبئة الأولى: python question_pool.py --fill [--target 20] [--workers 4]
+(تقرأ OPENAI_API_KEY من البيئة)
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import storage
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+POOL_PATH = os.path.join(BASE_DIR, "rag_data", "question_pool.sqlite")
+
+GEN_MODEL = "gpt-3.5-turbo"
+TARGET_PER_CONCEPT = 20   # حجم المخزون لكل مفهوم بعد التعبئة
+LOW_WATER = 5             # إعادة الملء عندما يقل ما لم يره الطالب عن هذا
+MAX_PER_CONCEPT = 200     # لا يكبر المخزون بلا حد مع كثرة الطلاب
+REFILL_BATCH = 10
+OPTION_FIELDS = ("option_a", "option_b", "option_c", "option_d")
+QUESTION_FIELDS = ("question",) + OPTION_FIELDS + ("correct_option",)
+
+
+def validate_question(q):
+    """سؤال بصيغة موحدة أو None إن كان ناقصاً أو مفتاح الإجابة غير صالح أو الخيارات مكررة."""
+    if not isinstance(q, dict): return None
+    out = {f: str(q.get(f) or "").strip() for f in QUESTION_FIELDS}
+    if not all(out.values()): return None
+    correct = out["correct_option"].lower()
+    if correct in ("a", "b", "c", "d"): correct = f"option_{correct}"
+    if correct not in OPTION_FIELDS:
+        # بعض الردود تضع نص الإجابة بدلاً من اسم الخيار
+        matches = [f for f in OPTION_FIELDS if out[f] == out["correct_option"]]
+        if len(matches) != 1: return None
+        correct = matches[0]
+    if len({out[f] for f in OPTION_FIELDS}) < len(OPTION_FIELDS): return None
+    out["correct_option"] = correct
+    return out
+
+
+def bank_concepts(bank=None):
+    """[(الفصل، المفهوم)] لكل مفهوم في بنك الأسئلة (bank، أو البنك الافتراضي في data/)."""
+    if bank is None:
+        from question_bank import get_bank
+        bank = get_bank()
+    return bank.concept_pairs()
+
+
+def generation_prompt(chapter, concept, n):
+    return f"""
+    Create {n} simple math MCQs (Arabic) for Chapter {chapter}.
+    Focus on: {concept}.
+    Each question must be different and have exactly one correct option.
+    OUTPUT FORMAT: JSON Array ONLY.
+    Fields: "question", "option_a", "option_b", "option_c", "option_d", "correct_option" (e.g. "option_a"), "concept".
+    """
+
+
+class QuestionPool:
+    def __init__(self, path=POOL_PATH, bank=None):
+        self.path = path
+        self.bank = bank  # بنك الأسئلة الذي تُملأ مفاهيمه (None: البنك الافتراضي في data/)
+        self._refills = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = storage.connect(path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY, chapter TEXT NOT NULL, concept TEXT NOT NULL,
+                question TEXT NOT NULL, option_a TEXT NOT NULL, option_b TEXT NOT NULL,
+                option_c TEXT NOT NULL, option_d TEXT NOT NULL, correct_option TEXT NOT NULL,
+                created REAL NOT NULL, UNIQUE (chapter, concept, question)
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS questions_concept ON questions(chapter, concept)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen (
+                student TEXT NOT NULL, question_id INTEGER NOT NULL, seen_at REAL NOT NULL,
+                PRIMARY KEY (student, question_id)
+            ) WITHOUT ROWID""")
+
+    # ----------------------------- القراءة ----------------------------- #
+
+    def available(self, chapter, concept, student=None):
+        """عدد أسئلة المفهوم التي لم يرها الطالب (أو كل أسئلته إن لم يُحدد طالب)."""
+        conn = storage.connect(self.path)
+        if student is None:
+            return conn.execute("SELECT COUNT(*) FROM questions WHERE chapter = ? AND concept = ?",
+                                (str(chapter), concept)).fetchone()[0]
+        return conn.execute("""
+            SELECT COUNT(*) FROM questions q
+            WHERE q.chapter = ? AND q.concept = ?
+              AND NOT EXISTS (SELECT 1 FROM seen s WHERE s.student = ? AND s.question_id = q.id)
+            """, (str(chapter), concept, student)).fetchone()[0]
+
+    def _unseen(self, conn, chapter, concepts, student, limit, exclude):
+        placeholders = ",".join("?" * len(concepts))
+        skip = ",".join("?" * len(exclude))
+        return conn.execute(f"""
+            SELECT id, concept, question, option_a, option_b, option_c, option_d, correct_option
+            FROM questions q
+            WHERE q.chapter = ? AND q.concept IN ({placeholders}) AND q.id NOT IN ({skip})
+              AND NOT EXISTS (SELECT 1 FROM seen s WHERE s.student = ? AND s.question_id = q.id)
+            ORDER BY random() LIMIT ?""", (str(chapter), *concepts, *exclude, student or "", limit)).fetchall()
+
+    def sample(self, student, chapter, concepts, n=5):
+        """
+        n أسئلة موزعة على المفاهيم الضعيفة بالتناوب، مما لم يره الطالب، ثم من باقي مفاهيم
+        الفصل إن لم تكفِ. الأسئلة المختارة تُسجل كمرئية لهذا الطالب.
+        """
+        conn = storage.connect(self.path)
+        concepts = [c for c in dict.fromkeys(concepts or []) if c]
+        per_concept = {c: self._unseen(conn, chapter, [c], student, n, ()) for c in concepts}
+        rows = []
+        while len(rows) < n and any(per_concept.values()):
+            for c in concepts:
+                if per_concept[c] and len(rows) < n: rows.append(per_concept[c].pop(0))
+        if len(rows) < n:
+            others = [r[0] for r in conn.execute("SELECT DISTINCT concept FROM questions WHERE chapter = ?",
+                                                  (str(chapter),)) if r[0] not in concepts]
+            if others: rows += self._unseen(conn, chapter, others, student, n - len(rows), [r[0] for r in rows])
+        if not rows: return pd.DataFrame()
+
+        if student:
+            now = time.time()
+            with storage.transaction(conn):
+                conn.executemany("INSERT OR IGNORE INTO seen (student, question_id, seen_at) VALUES (?, ?, ?)",
+                                 [(student, r[0], now) for r in rows])
+        df = pd.DataFrame(rows, columns=["id", "concept", *QUESTION_FIELDS])
+        df["question_id"] = "POOL_" + df.pop("id").astype(str)
+        return df[[*QUESTION_FIELDS, "concept", "question_id"]]
+
+    def concept_pairs(self):
+        """[(الفصل، المفهوم)] بدون تكرار لما في المخزون."""
+        rows = storage.connect(self.path).execute("SELECT DISTINCT chapter, concept FROM questions").fetchall()
+        return [(ch, c.strip()) for ch, c in rows if c and c.strip()]
+
+    def stats(self):
+        conn = storage.connect(self.path)
+        rows = conn.execute("SELECT chapter, concept, COUNT(*) FROM questions GROUP BY chapter, concept").fetchall()
+        return pd.DataFrame(rows, columns=["chapter", "concept", "questions"])
+
+    # ----------------------------- الكتابة والتوليد ----------------------------- #
+
+    def add(self, chapter, concept, questions):
+        """يضيف الأسئلة الصالحة فقط (المكرر يُتجاهل) ويعيد عدد ما أُضيف."""
+        rows = [v for v in (validate_question(q) for q in questions) if v]
+        if not rows: return 0
+        conn = storage.connect(self.path)
+        now = time.time()
+        with storage.transaction(conn):
+            before = conn.total_changes
+            conn.executemany(f"""
+                INSERT OR IGNORE INTO questions (chapter, concept, {", ".join(QUESTION_FIELDS)}, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(str(chapter), concept, *(r[f] for f in QUESTION_FIELDS), now) for r in rows])
+            return conn.total_changes - before
+
+    def generate(self, api_key, chapter, concept, n=REFILL_BATCH):
+        """يولد n أسئلة لمفهوم واحد (أولوية دفعية في llm_gateway) ويضيف الصالح منها."""
+        from llm_gateway import get_gateway, BATCH
+        from rag_core import clean_and_parse_json
+
+        response = get_gateway(api_key).chat(
+            priority=BATCH,
+            deadline_sec=120,
+            model=GEN_MODEL,
+            messages=[{"role": "system", "content": "JSON only."},
+                      {"role": "user", "content": generation_prompt(chapter, concept, n)}]
+        )
+        data = clean_and_parse_json(response.choices[0].message.content) or []
+        return self.add(chapter, concept, data)
+
+    def fill(self, api_key, target=TARGET_PER_CONCEPT, workers=4, concepts=None):
+        """يملأ كل مفاهيم البنك حتى target سؤالاً (بالتوازي)؛ يعيد عدد الأسئلة المضافة."""
+        todo = [(ch, c, target - self.available(ch, c)) for ch, c in (concepts or bank_concepts(self.bank))]
+        todo = [t for t in todo if t[2] > 0]
+
+        def run(item):
+            chapter, concept, missing = item
+            added = 0
+            for _ in range(3):  # الأسئلة المكررة أو غير الصالحة تُسقط، فنحاول حتى 3 مرات
+                try:
+                    added += self.generate(api_key, chapter, concept, min(missing - added, REFILL_BATCH))
+                except Exception as e:
+                    print(f"Question pool error ({chapter}/{concept}): {e}")
+                if added >= missing: break
+            print(f"[Chapter {chapter}] {concept}: +{added}")
+            return added
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            return sum(ex.map(run, todo))
+
+    def request_refill(self, api_key, chapter, concepts, student=None):
+        """يضع في طابور الخلفية المفاهيم التي قل ما تبقى منها لهذا الطالب (لا ينتظر التوليد)."""
+        if not api_key: return
+        for concept in dict.fromkeys(concepts or []):
+            if self.available(chapter, concept, student) >= LOW_WATER: continue
+            if self.available(chapter, concept) >= MAX_PER_CONCEPT: continue
+            key = (str(chapter), concept)
+            with self._lock:
+                if key in self._pending: continue
+                self._pending.add(key)
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._refill_loop, name="question-pool-refill",
+                                                    daemon=True)
+                    self._worker.start()
+            self._refills.put((api_key, key))
+
+    def _refill_loop(self):
+        while True:
+            api_key, (chapter, concept) = self._refills.get()
+            try:
+                self.generate(api_key, chapter, concept)
+            except Exception as e:
+                print(f"Question pool refill error ({chapter}/{concept}): {e}")
+            finally:
+                with self._lock: self._pending.discard((chapter, concept))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate remedial questions for every bank concept")
+    parser.add_argument("--fill", action="store_true", help="generate questions up to --target per concept")
+    parser.add_argument("--target", type=int, default=TARGET_PER_CONCEPT)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    pool = QuestionPool()
+    if args.fill:
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key: raise RuntimeError("يرجى ضبط متغير البيئة OPENAI_API_KEY قبل التشغيل.")
+        t0 = time.perf_counter()
+        added = pool.fill(api_key, args.target, args.workers)
+        print(f"Added {added} questions in {time.perf_counter() - t0:.1f}s")
+    print(pool.stats().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,93 +1,640 @@
 import os
-import pickle
+import re
 import pandas as pd
 import numpy as np
-import re
 import json
+import time
+import queue
+import asyncio
+import threading
 import streamlit as st
-from sklearn.metrics.pairwise import linear_kernel
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from index_store import load_library
+from dense_index import DenseIndex, chunks_fingerprint
+from llm_cache import LLMCache, cache_key
+from retrieval_cache import RetrievalCache
+import concept_table
+import book_chapters
+from llm_gateway import get_gateway, estimate_tokens, INTERACTIVE, BATCH
+from question_pool import QuestionPool
+from question_bank import QuestionBank
+from grading import grade_matrix, grade_rows, resolve_questions
+from attempt_store import AttemptStore
+import analyzer
+import risk_rules
 
 # ----------------------------- إعداد المسارات ----------------------------- #
+# يمكن توجيهها لمجلدات أخرى بمتغيرات البيئة (مثلاً بيانات صناعية في benchmarks.student_flow)
 BASE_DIR = os.path.dirname(__file__)
-DATA_DIR = os.path.join(BASE_DIR, "data")
-REPORTS_DIR = os.path.join(BASE_DIR, "reports")
-RAG_DIR = os.path.join(BASE_DIR, "rag_data")
+DATA_DIR = os.environ.get("EDURAG_DATA_DIR", os.path.join(BASE_DIR, "data"))
+REPORTS_DIR = os.environ.get("EDURAG_REPORTS_DIR", os.path.join(BASE_DIR, "reports"))
+RAG_DIR = os.environ.get("EDURAG_RAG_DIR", os.path.join(BASE_DIR, "rag_data"))
 
 # التأكد من وجود المجلدات
 os.makedirs(REPORTS_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(RAG_DIR, exist_ok=True)
 
-ATTEMPTS_CSV = os.path.join(REPORTS_DIR, "attempts.csv")
-SUMMARY_CSV = os.path.join(REPORTS_DIR, "students_summary.csv")
-CONCEPT_HISTORY_CSV = os.path.join(REPORTS_DIR, "concept_history.csv")
+# سجلات الطلاب في SQLite؛ ملفات reports/*.csv تُستورد مرة واحدة وتُصدّر للتدقيق فقط (attempt_store.py)
+ATTEMPT_STORE_PATH = os.path.join(REPORTS_DIR, "attempts.sqlite")
+
+@st.cache_resource
+def load_attempt_store():
+    """سجل المحاولات المشترك (يستورد ملفات reports/*.csv تلقائياً عند أول تشغيل)."""
+    return AttemptStore(ATTEMPT_STORE_PATH, migrate_from=REPORTS_DIR)
 
 # ----------------------------- 1. دوال RAG والبحث ----------------------------- #
 
+SEARCH_WORKERS = 4  # عدد الكتب التي يُبحث فيها بالتوازي
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="rag-search")
+
 @st.cache_resource
-def load_rag_resources():
+def load_rag_library():
+    """كل أجزاء الكتب (mmap)، أو الفهرس المفرد/ملفات pickle القديمة ككتاب واحد."""
     try:
-        vec_path = os.path.join(RAG_DIR, "vectorizer.pkl")
-        mat_path = os.path.join(RAG_DIR, "tfidf_matrix.pkl")
-        chk_path = os.path.join(RAG_DIR, "chunks.pkl")
-        
-        if not (os.path.exists(vec_path) and os.path.exists(mat_path)):
-            return None, None, None
-
-        with open(vec_path, 'rb') as f: vectorizer = pickle.load(f)
-        with open(mat_path, 'rb') as f: matrix = pickle.load(f)
-        with open(chk_path, 'rb') as f: chunks = pickle.load(f)
-        return vectorizer, matrix, chunks
-    except Exception:
-        return None, None, None
+        return load_library(RAG_DIR)
+    except Exception as e:
+        print(f"Index Load Error: {e}")
+        return None
 
-def search_concept_in_book(query, top_k=2):
-    vectorizer, matrix, chunks = load_rag_resources()
-    if not vectorizer: return []
+@st.cache_resource
+def load_dense_library():
+    """الفهارس الدلالية المتاحة {doc_id: DenseIndex} (تُبنى بـ build_index.py --dense)."""
+    library = load_rag_library()
+    dense = {}
+    for doc_id, index in (library.shards.items() if library else []):
+        if not index.path: continue
+        try:
+            d = DenseIndex.load(os.path.dirname(index.path), chunks_fingerprint(index.path))
+            if d is not None: dense[doc_id] = d
+        except Exception as e:
+            print(f"Dense Index Load Error ({doc_id}): {e}")
+    return dense
+
+SEARCH_MODES = ("tfidf", "dense", "hybrid")
+SEARCH_MODE = os.environ.get("EDURAG_SEARCH_MODE", "tfidf")
+MIN_SCORE = 0.01  # أقل تشابه يعتبر تطابقاً مع نص الكتاب
+MIN_SCORES = {"tfidf": MIN_SCORE, "dense": 0.3, "hybrid": 0.0}  # الهجين يرشّح كل مكوّن قبل الدمج
+RRF_K = 60  # ثابت الدمج بالرتبة المتبادلة (Reciprocal Rank Fusion)
+
+def _top_k_rows(sims, top_k):
+    """أفضل top_k لكل صف من مصفوفة تشابه متفرقة باختيار جزئي (argpartition)."""
+    n = sims.shape[0]
+    scores = np.zeros((n, top_k), dtype=np.float32)
+    indices = np.full((n, top_k), -1, dtype=np.int64)
+    for r in range(n):
+        start, end = sims.indptr[r], sims.indptr[r + 1]
+        row_scores, row_idx = sims.data[start:end], sims.indices[start:end]
+        k = min(top_k, len(row_scores))
+        if k == 0: continue
+        part = np.argpartition(-row_scores, k - 1)[:k]
+        order = part[np.argsort(-row_scores[part], kind='stable')]
+        scores[r, :k] = row_scores[order]
+        indices[r, :k] = row_idx[order]
+    return scores, indices
+
+def _search_shard(index, queries, top_k, rows=None):
+    """rows: [(أول صف، آخر صف + 1)] لفصول الكتاب المطلوبة؛ تُحسب درجات هذه الشرائح فقط."""
+    query_vecs = index.vectorizer.transform(queries)
+    if rows is None:
+        if index.postings is not None:
+            # تكلفة كل استعلام تتناسب مع عدد عناصر القوائم التي يلمسها لا مع حجم الكتاب
+            return index.postings.search_batch(query_vecs, top_k)
+        return _top_k_rows((query_vecs @ index.matrix.T).tocsr(), top_k)
+    parts = []
+    for start, end in rows:
+        if index.postings is not None:
+            parts.append(index.postings.search_batch(query_vecs, top_k, (start, end)))
+        else:
+            s, i = _top_k_rows((query_vecs @ index.matrix[start:end].T).tocsr(), top_k)
+            parts.append((s, np.where(i >= 0, i + start, -1)))
+    return _merge_top_k(parts, top_k)
+
+def _within_rows(scores, indices, rows, top_k):
+    """أفضل top_k من نتائج مرتبة تقع داخل الشرائح rows (للبحث الدلالي الذي لا يُقصر على شريحة)."""
+    inside = np.zeros(indices.shape, dtype=bool)
+    for start, end in rows: inside |= (indices >= start) & (indices < end)
+    order = np.argsort(~inside, axis=1, kind='stable')[:, :top_k]
+    keep = np.take_along_axis(inside, order, axis=1)
+    return (np.where(keep, np.take_along_axis(scores, order, axis=1), 0).astype(np.float32),
+            np.where(keep, np.take_along_axis(indices, order, axis=1), -1))
+
+def _merge_top_k(parts, top_k):
+    """دمج نتائج عدة كتب (بأرقام فقرات عامة) واختيار أفضل top_k لكل استعلام حسب الدرجة."""
+    scores = np.concatenate([s for s, _ in parts], axis=1)
+    indices = np.concatenate([i for _, i in parts], axis=1)
+    if len(parts) == 1: return scores, indices
+    ranked = np.where(indices >= 0, scores, -np.inf)
+    part = np.argpartition(-ranked, top_k - 1, axis=1)[:, :top_k]
+    order = np.argsort(-np.take_along_axis(ranked, part, axis=1), axis=1, kind='stable')
+    best = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(scores, best, axis=1), np.take_along_axis(indices, best, axis=1)
+
+def _empty_results(n, top_k):
+    return np.zeros((n, top_k), dtype=np.float32), np.full((n, top_k), -1, dtype=np.int64)
+
+def _fan_out(library, targets, run, top_k):
+    """تشغيل run(doc_id) على كل كتاب (بالتوازي عند التعدد) ودمج النتائج بأرقام فقرات عامة."""
+    def run_global(doc_id):
+        s, i = run(doc_id)
+        return s, np.where(i >= 0, i + library.offsets[doc_id], -1)
+
+    parts = [run_global(targets[0])] if len(targets) == 1 else list(_search_pool.map(run_global, targets))
+    return _merge_top_k(parts, top_k)
+
+def _rrf_fuse(runs, top_k):
+    """دمج عدة قوائم مرتبة بـ RRF: درجة الفقرة = مجموع 1 / (RRF_K + رتبتها) في كل قائمة."""
+    scores, indices = _empty_results(runs[0][1].shape[0], top_k)
+    for r in range(len(scores)):
+        fused = {}
+        for _, ids in runs:
+            for rank, i in enumerate(ids[r]):
+                if i >= 0: fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank + 1)
+        best = sorted(fused.items(), key=lambda kv: -kv[1])[:top_k]
+        for j, (i, score) in enumerate(best):
+            scores[r, j], indices[r, j] = score, i
+    return scores, indices
+
+DENSE_SCOPE_DEPTH = 10  # البحث الدلالي في فصل: يُطلب top_k × هذا ثم يُرشّح بنطاق الفصل
+
+def _search_library(library, targets, queries, top_k, mode, scope=None):
+    if mode == "dense":
+        dense = load_dense_library()
+        targets = [d for d in targets if d in dense]
+        if not targets: return _empty_results(len(queries), top_k)
+        embeddings = {}  # ترميز الاستعلامات مرة واحدة لكل نموذج (قد تُبنى الكتب بنماذج مختلفة)
+        for d in targets:
+            model = dense[d].meta["model"]
+            if model not in embeddings: embeddings[model] = dense[d].encode(queries)
+        encoded = lambda d: embeddings[dense[d].meta["model"]]
+        if scope:
+            return _fan_out(library, targets, lambda d: _within_rows(
+                *dense[d].search(encoded(d), top_k * DENSE_SCOPE_DEPTH), scope[d], top_k), top_k)
+        return _fan_out(library, targets, lambda d: dense[d].search(encoded(d), top_k), top_k)
+    return _fan_out(library, targets,
+                    lambda d: _search_shard(library.shards[d], queries, top_k, scope[d] if scope else None), top_k)
+
+def _search_modes(library, targets, queries, top_k, mode, scope=None):
+    if mode != "hybrid":
+        return _search_library(library, targets, queries, top_k, mode, scope)
+
+    depth = max(top_k * 5, 10)  # عمق القوائم المدموجة
+    runs = []
+    for component in ("tfidf", "dense"):
+        s, i = _search_library(library, targets, queries, depth, component, scope)
+        runs.append((s, np.where(s > MIN_SCORES[component], i, -1)))
+    return _rrf_fuse(runs, top_k)
+
+def _chapter_scope(library, targets, chapters):
+    """{doc_id: [(أول صف، آخر صف + 1)]} للكتب التي تعرف نطاقات الفصول المطلوبة (book_chapters.py)."""
+    scope = {}
+    for d in targets:
+        rows = [library.shards[d].chapters[str(ch)] for ch in chapters if str(ch) in library.shards[d].chapters]
+        if rows: scope[d] = rows
+    return scope
+
+def library_chapters():
+    """الفصول التي لها نطاق صفوف في أي كتاب من المكتبة."""
+    library = load_rag_library()
+    return sorted({ch for index in (library.shards.values() if library else []) for ch in index.chapters},
+                  key=lambda c: (len(c), c))
+
+# ذاكرة LRU لنتائج الاستعلامات المتكررة (retrieval_cache.py)؛ تُفرغ تلقائياً عند تغير إصدار المكتبة المحمّلة
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("EDURAG_RETRIEVAL_CACHE_SIZE", 20_000))  # 0 يعطلها
+_retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_SIZE)
+
+def _retrieval_keys(library, targets, queries, mode, prefix):
+    """
+    مفاتيح الذاكرة: prefix (الوضع، top_k، الكتب، الفصول) + مصطلحات الاستعلام كما يحللها كل كتاب،
+    فالاستعلامات التي تعطي المتجه نفسه تتشارك إدخالاً واحداً. البحث الدلالي يرمّز النص الخام
+    فيبقى مفتاحه النص نفسه.
+    """
+    if mode != "tfidf": return [prefix + " ".join(q.split()) for q in queries]
+    configs = sorted({(getattr(v, "analyzer_version", analyzer.LEGACY_VERSION), getattr(v, "stem", False))
+                      for v in (library.shards[d].vectorizer for d in targets)})
+    return [prefix + "|".join(" ".join(analyzer.analyze_query(q, v, stem)) for v, stem in configs) for q in queries]
+
+def _search_cached(library, targets, queries, top_k, mode, scope, prefix):
+    keys = _retrieval_keys(library, targets, queries, mode, prefix)
+    cached = _retrieval_cache.get_many(library.version, keys)
+    scores, indices = _empty_results(len(queries), top_k)
+    missing = {}  # مفتاح ← أول استعلام به (المكرر داخل الدفعة يُبحث مرة واحدة)
+    for r, (key, hit) in enumerate(zip(keys, cached)):
+        if hit is not None: scores[r], indices[r] = hit
+        else: missing.setdefault(key, r)
+    if missing:
+        s, i = _search_modes(library, targets, [queries[r] for r in missing.values()], top_k, mode, scope)
+        _retrieval_cache.put_many(library.version, list(missing), s, i)
+        pos = {key: j for j, key in enumerate(missing)}
+        for r, (key, hit) in enumerate(zip(keys, cached)):
+            if hit is None: scores[r], indices[r] = s[pos[key]], i[pos[key]]
+    return scores, indices
+
+def _search_live(library, targets, queries, top_k, mode, scope, prefix):
+    if _retrieval_cache.max_entries <= 0:
+        return _search_modes(library, targets, queries, top_k, mode, scope)
+    return _search_cached(library, targets, queries, top_k, mode, scope, prefix)
+
+# جدول المفاهيم المعروفة (بنك الأسئلة + المخزون) ← أفضل الفقرات، محسوب مرة واحدة (concept_table.py)
+CONCEPT_TABLE_TOP_K = 2             # top_k الافتراضي في search_concept_in_book
+CONCEPT_TABLE_CHECK_SEC = 2.0       # أقل فاصل بين فحوص تغير البنك أو المخزون أو الفهرس
+_concept_table = {"table": None, "checked": 0.0}
+_concept_table_lock = threading.Lock()
+
+def known_concepts():
+    """
+    [(الفصل، المفهوم)] من بنك الأسئلة ثم من المخزون المولد (بدون تكرار). كل مفهوم يُحسب
+    للكتاب كله، ولفصله أيضاً إن كانت للفصل شريحة في الفهرس.
+    """
+    pairs = []
+    for source in (load_question_bank(), load_question_pool()):
+        if source is None: continue
+        try: pairs.extend(source.concept_pairs())
+        except Exception as e: print(f"Concept Table Error: {e}")
+    return list(dict.fromkeys((str(ch), concept_table.normalize_concept(c)) for ch, c in pairs))
+
+def refresh_concept_table(force=False):
+    """يعيد الجدول المطابق للمفاهيم والفهرس الحاليين، ويحسبه إن لم يكن محفوظاً بنفس المفتاح."""
+    library = load_rag_library()
+    if not library: return None
+    pairs = known_concepts()
+    concepts = list(dict.fromkeys(c for _, c in pairs))
+    by_chapter = {}
+    for ch, c in pairs:
+        if _chapter_scope(library, library.doc_ids, [ch]): by_chapter.setdefault(ch, []).append(c)
+    rows = [concept_table.row_key(c) for c in concepts]
+    rows += [concept_table.row_key(c, ch) for ch, cs in by_chapter.items() for c in cs]
+    key = concept_table.table_key(rows, library.version, SEARCH_MODE, CONCEPT_TABLE_TOP_K)
+    table = _concept_table["table"]
+    if force or table is None or table.key != key:
+        table = None if force else concept_table.load_table(RAG_DIR, key)
+    if table is None:
+        t0 = time.perf_counter()
+        parts = [_search_modes(library, library.doc_ids, concepts, CONCEPT_TABLE_TOP_K, SEARCH_MODE)] if concepts else []
+        for ch, cs in by_chapter.items():
+            scope = _chapter_scope(library, library.doc_ids, [ch])
+            parts.append(_search_modes(library, list(scope), cs, CONCEPT_TABLE_TOP_K, SEARCH_MODE, scope))
+        scores, ids = (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])) if parts \
+            else _empty_results(0, CONCEPT_TABLE_TOP_K)
+        pages = np.array([[library.chunk(i)['page'] if i >= 0 else -1 for i in row] for row in ids], dtype=np.int32)
+        table = concept_table.write_table(RAG_DIR, rows, scores, ids, pages.reshape(ids.shape), key,
+                                          SEARCH_MODE, CONCEPT_TABLE_TOP_K)
+        print(f"Concept table built ({len(concepts)} concepts, {len(rows) - len(concepts)} chapter rows) "
+              f"in {time.perf_counter() - t0:.2f}s")
+    _concept_table["table"] = table
+    return table
+
+def _refresh_concept_table_async():
+    """يفحص الجدول ويعيد حسابه إن لزم في خيط خلفي؛ لا يبدأ خيطاً إن كان هناك فحص جارٍ."""
+    if not _concept_table_lock.acquire(blocking=False): return
+    def run():
+        try: refresh_concept_table()
+        except Exception as e: print(f"Concept Table Error: {e}")
+        finally: _concept_table_lock.release()
+    threading.Thread(target=run, name="concept-table-refresh", daemon=True).start()
+
+def load_concept_table():
+    """
+    الجدول الحالي إن كان محسوباً لإصدار المكتبة المحمّلة، وإلا None (بحث مباشر).
+    فحص تغير البنك أو المخزون أو الفهرس (refresh_concept_table) يجري في خيط خلفي كل
+    CONCEPT_TABLE_CHECK_SEC، فمسار الطلب لا يقرأ البنك ولا يعيد حساب الجدول؛ المفاهيم
+    الجديدة قبل انتهاء الحساب تُبحث مباشرة.
+    """
+    library = load_rag_library()
+    if library is None: return None
+    now = time.monotonic()
+    if now - _concept_table["checked"] >= CONCEPT_TABLE_CHECK_SEC:
+        _concept_table["checked"] = now
+        _refresh_concept_table_async()
+    table = _concept_table["table"]
+    return table if table is not None and table.key.startswith(library.version + "/") else None
+
+def retrieval_cache_stats():
+    """إحصاءات ذاكرة الاسترجاع: hits/misses/hit_rate/size/bytes/evictions/invalidations."""
+    return _retrieval_cache.stats()
+
+def search_concepts_batch(queries, top_k=2, doc_ids=None, mode=None, chapters=None):
+    """
+    البحث عن عدة مفاهيم دفعة واحدة في كتب المكتبة (أو في doc_ids فقط).
+    mode: "tfidf" (الفهرس المقلوب)، "dense" (FAISS)، أو "hybrid" (دمج الاثنين بـ RRF).
+    chapters: يقصر البحث على شرائح هذه الفصول في الكتب التي تعرف نطاقاتها (book_chapters.py)؛
+    إن لم يعرفها أي كتاب يُبحث في الكتاب كله.
+    عند تعدد الكتب يُبحث فيها بالتوازي ثم تُدمج أفضل النتائج حسب الدرجة.
+    المفاهيم المعروفة تُقرأ من جدول محسوب مسبقاً (load_concept_table)، والباقي يُحفظ
+    في ذاكرة LRU حسب الاستعلام بعد التحليل وإصدار المكتبة.
+    يعيد (scores, indices) بأبعاد (len(queries), top_k)؛ indices أرقام فقرات عامة
+    (library.chunk) والخانات الفارغة فهرسها -1.
+    """
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES: raise ValueError(f"Unknown search mode: {mode}")
+    library = load_rag_library()
+    n = len(queries)
+    targets = [d for d in (doc_ids or (library.doc_ids if library else [])) if library and d in library.shards]
+    if not targets or n == 0 or top_k <= 0: return _empty_results(n, max(top_k, 0))
+
+    chapters = [str(ch) for ch in chapters] if chapters is not None else []
+    scope = _chapter_scope(library, targets, chapters) if chapters else None
+    if scope: targets = [d for d in targets if d in scope]
+    prefix = f"{mode}/{top_k}/{','.join(targets) if doc_ids else '*'}/{','.join(chapters) if scope else '*'}/"
+
+    queries = [str(q) for q in queries]  # التطبيع يتم في المحلل المشترك (analyzer.py) حسب إصدار الفهرس
+    use_table = doc_ids is None and top_k == CONCEPT_TABLE_TOP_K and (not scope or len(chapters) == 1)
+    table = load_concept_table() if use_table else None
+    if table is None or table.mode != mode:
+        return _search_live(library, targets, queries, top_k, mode, scope, prefix)
+
+    chapter = chapters[0] if scope else None
+    scores, indices = _empty_results(n, top_k)
+    unseen = []
+    for r, q in enumerate(queries):
+        hit = table.lookup(q, chapter)
+        if hit is None: unseen.append(r)
+        else: scores[r], indices[r] = hit
+    if unseen:
+        scores[unseen], indices[unseen] = _search_live(library, targets, [queries[r] for r in unseen], top_k, mode,
+                                                       scope, prefix)
+    return scores, indices
+
+CHAPTER_WIDEN_SCORE = 0.1  # أفضل درجة في الفصل أقل من هذا: يُوسّع البحث للفصلين المجاورين
+
+def search_concepts_in_book(queries, top_k=2, doc_ids=None, mode=None, chapter=None, widen_below=None):
+    """
+    نسخة الدفعة من search_concept_in_book: قائمة فقرات لكل مفهوم بنفس الترتيب.
+    chapter يقصر البحث على شريحة الفصل؛ ومع widen_below يُعاد البحث في الفصل والفصلين
+    المجاورين للمفاهيم التي أفضل درجة لها في الفصل أقل منه، وتُعتمد النتيجة الأعلى.
+    وضع بحث أو فصل غير معروف خطأ من المستدعي (ValueError)؛ أخطاء قراءة الفهرس أو تحميل
+    النموذج الدلالي فقط تُسجل ويعاد لها [] لكل مفهوم.
+    """
+    library = load_rag_library()
+    if not library: return [[] for _ in queries]
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES: raise ValueError(f"Unknown search mode: {mode}")
+    known = library_chapters()
+    if chapter is not None and known and str(chapter) not in known:
+        raise ValueError(f"Unknown chapter: {chapter} (known: {', '.join(known)})")
+
+    queries = list(queries)
+    try:
+        scores, indices = search_concepts_batch(queries, top_k, doc_ids, mode, None if chapter is None else [chapter])
+        if chapter is not None and widen_below is not None and len(queries) and top_k > 0:
+            weak = np.flatnonzero(scores[:, 0] < widen_below)
+            wide = book_chapters.neighbours(chapter, library_chapters())
+            if len(weak) and len(wide) > 1:
+                s, i = search_concepts_batch([queries[r] for r in weak], top_k, doc_ids, mode, wide)
+                better = s[:, 0] > scores[weak, 0]
+                scores[weak[better]], indices[weak[better]] = s[better], i[better]
+        return [
+            [library.chunk(i) for s, i in zip(row_s, row_i) if i >= 0 and s > MIN_SCORES[mode]]
+            for row_s, row_i in zip(scores, indices)
+        ]
+    except (OSError, ImportError) as e:  # ملفات الفهرس (mmap) أو مكتبة/نموذج البحث الدلالي
+        print(f"Search Error: {e}")
+        return [[] for _ in queries]
+
+def search_concept_in_book(query, top_k=2, doc_ids=None, mode=None, chapter=None, widen_below=None):
+    return search_concepts_in_book([query], top_k, doc_ids, mode, chapter, widen_below)[0]
+
+# ----------------------------- تعبئة السياق بميزانية رموز ----------------------------- #
+# بدلاً من أول 800 (أو 200) حرف من الفقرات: تُقسم الفقرات جملاً، وتُرتب حسب تشابهها مع المفهوم
+# بمتجه TF-IDF نفسه الذي بُني به الكتاب، وتُختار الأعلى قيمة غير المكررة حتى تمتلئ الميزانية.
+
+CONTEXT_TOKEN_BUDGET = 200   # رموز سياق الشرح في البرومبت
+QUOTE_TOKEN_BUDGET = 60      # الاقتباس المعروض للطالب عند غياب المفتاح
+REDUNDANCY_MAX_SIM = 0.8     # جملة تشابهها مع جملة مختارة أعلى من هذا تُعد تكراراً
+SENTENCE_MAX_WORDS = 40      # النص بلا علامات ترقيم يُقطّع إلى مقاطع بهذا الطول
+
+_SENTENCE_END = re.compile(r'(?<=[.!?؟؛])\s+')
+
+def _sentences(text):
+    """جمل الفقرة (أسطر PDF المكسورة تُدمج أولاً)، والجملة الطويلة جداً تُقطّع بعدد الكلمات."""
+    out = []
+    for s in _SENTENCE_END.split(re.sub(r'\s+', ' ', str(text)).strip()):
+        words = s.split()
+        for i in range(0, len(words), SENTENCE_MAX_WORDS):
+            piece = " ".join(words[i:i + SENTENCE_MAX_WORDS])
+            if len(piece) > 10: out.append(piece)
+    return out
+
+def _count_tokens(text):
+    return estimate_tokens([{"content": text}], max_tokens=0)
+
+def _sentence_scores(concept, sentences, doc_id):
+    """(تشابه كل جملة مع المفهوم، مصفوفة تشابه الجمل ببعضها) بمتجه الكتاب، أو بتداخل الكلمات دونه."""
+    library = load_rag_library()
+    index = library.shards.get(doc_id) if library else None
+    if index is not None:
+        try:
+            vecs = index.vectorizer.transform(sentences)
+            scores = (vecs @ index.vectorizer.transform([concept]).T).toarray().ravel()
+            return scores, (vecs @ vecs.T).toarray()
+        except Exception as e:
+            print(f"Context Packing Error: {e}")
+    sets = [set(analyzer.tokenize(s)) for s in sentences]
+    query = set(analyzer.tokenize(concept))
+    jaccard = lambda a, b: len(a & b) / len(a | b) if a | b else 0.0
+    return (np.array([jaccard(query, s) for s in sets]),
+            np.array([[jaccard(a, b) for b in sets] for a in sets]))
+
+def pack_context(concept, context_list, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    نص سياق لا يتجاوز token_budget رمزاً تقريباً: أعلى الجمل صلة بالمفهوم بلا تكرار،
+    بترتيبها الأصلي في الكتاب، وكل مجموعة منها مسبوقة بصفحتها ([ص 12] أو [كتاب: ص 12]).
+    """
+    items = [(rank, pos, c, s) for rank, c in enumerate(context_list or [])
+             for pos, s in enumerate(_sentences(c.get('text', '')))]
+    if not items or token_budget <= 0: return ""
+
+    scores = np.zeros(len(items))
+    sims = np.zeros((len(items), len(items)))
+    by_doc = {}
+    for i, (_, _, c, _) in enumerate(items): by_doc.setdefault(c.get('doc_id'), []).append(i)
+    for doc_id, idx in by_doc.items():
+        doc_scores, doc_sims = _sentence_scores(concept, [items[i][3] for i in idx], doc_id)
+        scores[idx] = doc_scores
+        sims[np.ix_(idx, idx)] = doc_sims  # التشابه بين كتابين مختلفين غير معرّف (مفردات مختلفة)
+
+    # الأعلى صلة أولاً؛ وإن لم تطابق أي جملة المفهوم فبترتيب الاسترجاع كما كان القص القديم
+    order = sorted(range(len(items)), key=lambda i: (-scores[i], items[i][0], items[i][1]))
+    chosen, used, seen = [], 0, set()
+    for i in order:
+        if scores[i] <= 0 and chosen and scores[chosen[0]] > 0: break
+        text = items[i][3]
+        if text in seen or any(sims[i, j] > REDUNDANCY_MAX_SIM for j in chosen): continue
+        cost = _count_tokens(text)
+        if used + cost > token_budget:
+            if chosen: continue
+            text = " ".join(text.split()[:max(1, int(len(text.split()) * token_budget / cost))])  # جملة أطول من الميزانية كلها
+            items[i] = items[i][:3] + (text,)
+            cost = _count_tokens(text)
+        chosen.append(i)
+        seen.add(text)
+        used += cost
+
+    multi_doc = len(by_doc) > 1
+    lines, current = [], None
+    for i in sorted(chosen, key=lambda i: (items[i][0], items[i][1])):
+        c = items[i][2]
+        label = f"[{c.get('doc_id')}: ص {c.get('page')}]" if multi_doc else f"[ص {c.get('page')}]"
+        if label != current:
+            lines.append(label)
+            current = label
+        lines[-1] += " " + items[i][3]
+    return "\n".join(lines)
+
+EXPLAIN_MODEL = "gpt-3.5-turbo"
+EXPLAIN_PROMPT_VERSION = "explain-v2"  # غيّره عند تعديل قالب البرومبت ليُهمل ما في الذاكرة
+LLM_CACHE_PATH = os.path.join(RAG_DIR, "llm_cache.sqlite")
 
+@st.cache_resource
+def load_llm_cache():
+    """ذاكرة الشروحات المشتركة بين الطلاب والجلسات وإعادات تشغيل الصفحة."""
     try:
-        query = re.sub(r'[^\w\s]', '', str(query)) 
-        query_vec = vectorizer.transform([query])
-        cosine_similarities = linear_kernel(query_vec, matrix).flatten()
-        related_docs_indices = cosine_similarities.argsort()[:-top_k:-1]
-        
-        results = []
-        for i in related_docs_indices:
-            if cosine_similarities[i] > 0.01: 
-                results.append(chunks[i])
-        return results
+        return LLMCache(LLM_CACHE_PATH)
     except Exception as e:
-        print(f"Search Error: {e}")
-        return []
+        print(f"LLM Cache Error: {e}")
+        return None
 
-def get_explanation_and_page(api_key, concept):
-    context_list = search_concept_in_book(concept)
-    if not context_list:
-        return "المفهوم غير موجود في الفهرس بدقة.", "-"
-    
-    pages = sorted(list(set([c['page'] for c in context_list])))
-    pages_str = ", ".join(map(str, pages))
-    context_text = "\n".join([c['text'] for c in context_list])
+def _explanation_inputs(concept, context_list):
+    """(الفقرات، نص الصفحات، نص السياق) لمفهوم؛ الفقرات فارغة إن لم يوجد في الفهرس."""
+    if context_list is None: context_list = search_concept_in_book(concept)
+    if not context_list: return [], "-", ""
 
-    if not api_key:
-        return f"راجع الصفحات: {pages_str}\nنص مقتبس: {context_text[:200]}...", pages_str
+    if len({c.get('doc_id') for c in context_list}) > 1:
+        pages = sorted(set((c['doc_id'], c['page']) for c in context_list))
+        pages_str = ", ".join(f"{doc}: {page}" for doc, page in pages)
+    else:
+        pages = sorted(list(set([c['page'] for c in context_list])))
+        pages_str = ", ".join(map(str, pages))
+    return context_list, pages_str, pack_context(concept, context_list)
 
-    try:
-        client = OpenAI(api_key=api_key)
-        prompt = f"""
+def _explanation_prompt(concept, context_text):
+    return f"""
         اشرح للطالب مفهوم "{concept}" بشكل مبسط جداً (سطرين) بناءً على النص التالي:
-        {context_text[:800]}
+        {context_text}
         """
-        res = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
+
+def _explanation_without_llm(api_key, concept, context_list, pages_str, context_text):
+    """الشرح الذي لا يحتاج استدعاء النموذج (غير موجود، بلا مفتاح، أو من الذاكرة)؛ None إن لزم الاستدعاء."""
+    if not context_list: return "المفهوم غير موجود في الفهرس بدقة."
+    if not api_key: return f"راجع الصفحات: {pages_str}\nنص مقتبس: {pack_context(concept, context_list, QUOTE_TOKEN_BUDGET)}..."
+    cache = load_llm_cache()
+    return cache.get(_explanation_key(concept, context_list)) if cache else None
+
+def _explanation_key(concept, context_list):
+    # الميزانية جزء من البرومبت، فتغييرها يغير المفتاح
+    return cache_key(EXPLAIN_MODEL, f"{EXPLAIN_PROMPT_VERSION}/{CONTEXT_TOKEN_BUDGET}", concept, context_list)
+
+def _remember_explanation(concept, context_list, explanation):
+    cache = load_llm_cache()
+    if cache and explanation:
+        cache.put(_explanation_key(concept, context_list), explanation)
+
+def get_explanation_and_page(api_key, concept, context_list=None):
+    context_list, pages_str, context_text = _explanation_inputs(concept, context_list)
+    ready = _explanation_without_llm(api_key, concept, context_list, pages_str, context_text)
+    if ready is not None: return ready, pages_str
+
+    try:
+        res = get_gateway(api_key).chat(
+            priority=INTERACTIVE,
+            model=EXPLAIN_MODEL,
+            messages=[{"role": "user", "content": _explanation_prompt(concept, context_text)}],
             temperature=0.7
         )
-        return res.choices[0].message.content, pages_str
+        explanation = res.choices[0].message.content
+        _remember_explanation(concept, context_list, explanation)
+        return explanation, pages_str
     except Exception as e:
         return f"خطأ في الاتصال: {e}", pages_str
 
+EXPLAIN_CONCURRENCY = 4     # أقصى عدد استدعاءات متزامنة للنموذج لكل صفحة نتائج
+STREAM_UPDATE_SEC = 0.05    # أقل فاصل بين تحديثات الواجهة أثناء البث
+
+async def _stream_explanation(gateway, client, semaphore, concept, context_list, pages_str, context_text, on_update):
+    text, last_update = "", 0.0
+    try:
+        async with semaphore:
+            stream = await gateway.achat(
+                client,
+                priority=INTERACTIVE,
+                model=EXPLAIN_MODEL,
+                messages=[{"role": "user", "content": _explanation_prompt(concept, context_text)}],
+                temperature=0.7,
+                stream=True
+            )
+            async for chunk in stream:
+                if not chunk.choices: continue
+                text += chunk.choices[0].delta.content or ""
+                now = time.monotonic()
+                if on_update and now - last_update >= STREAM_UPDATE_SEC:
+                    on_update(concept, text, pages_str, False)
+                    last_update = now
+        _remember_explanation(concept, context_list, text)
+    except Exception as e:
+        text = f"خطأ في الاتصال: {e}"
+    if on_update: on_update(concept, text, pages_str, True)
+    return concept, (text, pages_str)
+
+def _pending_explanations(api_key, concepts, contexts, on_update):
+    """الشروحات الجاهزة (بلا مفتاح أو من الذاكرة) ومدخلات ما يحتاج استدعاء النموذج."""
+    contexts = contexts or {}
+    concepts = list(dict.fromkeys(concepts))
+    missing = [c for c in concepts if c not in contexts]
+    if missing: contexts = dict(contexts, **dict(zip(missing, search_concepts_in_book(missing))))
+
+    results, pending = {}, []
+    for concept in concepts:
+        context_list, pages_str, context_text = _explanation_inputs(concept, contexts[concept])
+        ready = _explanation_without_llm(api_key, concept, context_list, pages_str, context_text)
+        if ready is not None:
+            results[concept] = (ready, pages_str)
+            if on_update: on_update(concept, ready, pages_str, True)
+        else:
+            pending.append((concept, context_list, pages_str, context_text))
+    return results, pending
+
+async def _stream_pending(gateway, pending, on_update, max_concurrency):
+    """يعمل في حلقة أحداث البوابة (gateway.submit) بعميلها الدائم."""
+    client = gateway.async_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return dict(await asyncio.gather(*[
+        _stream_explanation(gateway, client, semaphore, *args, on_update) for args in pending
+    ]))
+
+async def get_explanations_async(api_key, concepts, contexts=None, on_update=None, max_concurrency=EXPLAIN_CONCURRENCY):
+    """
+    جلب شروحات كل المفاهيم معاً بعميل AsyncOpenAI الدائم للبوابة (llm_gateway) وحد أقصى للتزامن.
+    الاستدعاءات تعمل في حلقة أحداث البوابة، وon_update(concept, text, pages, done) يُستدعى
+    في حلقة المستدعي مع وصول الرموز، فيظهر أول محتوى بعد رحلة واحدة ويكون الزمن الكلي
+    قريباً من أبطأ استدعاء.
+    يعيد {concept: (explanation, pages)}.
+    """
+    results, pending = _pending_explanations(api_key, concepts, contexts, on_update)
+    if not pending: return results
+    loop = asyncio.get_running_loop()
+    notify = (lambda *args: loop.call_soon_threadsafe(on_update, *args)) if on_update else None
+    gateway = get_gateway(api_key)
+    results.update(await asyncio.wrap_future(gateway.submit(_stream_pending(gateway, pending, notify, max_concurrency))))
+    return results
+
+def get_explanations_streaming(api_key, concepts, contexts=None, on_update=None):
+    """
+    نسخة متزامنة لـ get_explanations_async لاستدعائها من سكربت Streamlit: البث يعمل في حلقة
+    البوابة، وتحديثات الواجهة تُنفذ في خيط السكربت نفسه (عناصر st لا تُحدّث من خيط آخر).
+    """
+    results, pending = _pending_explanations(api_key, concepts, contexts, on_update)
+    if not pending: return results
+    updates = queue.SimpleQueue()
+    gateway = get_gateway(api_key)
+    future = gateway.submit(_stream_pending(gateway, pending, (lambda *args: updates.put(args)) if on_update else None,
+                                            EXPLAIN_CONCURRENCY))
+    while True:
+        try: on_update(*updates.get(timeout=STREAM_UPDATE_SEC))
+        except queue.Empty:
+            if future.done(): break
+    results.update(future.result())
+    return results
+
 # ----------------------------- 2. دوال التوليد والتحليل (AI & Analytics) ----------------------------- #
 
 def clean_and_parse_json(content):
@@ -101,52 +648,80 @@ def clean_and_parse_json(content):
     except:
         return None
 
-def prepare_second_attempt_quiz(api_key, chapter, weak_concepts, total_q=5):
-    if not api_key: return pd.DataFrame()
+QUESTION_POOL_PATH = os.path.join(RAG_DIR, "question_pool.sqlite")
 
+@st.cache_resource
+def load_question_pool():
+    """مخزون الأسئلة التعويضية المولدة مسبقاً (python question_pool.py --fill)."""
+    try:
+        return QuestionPool(QUESTION_POOL_PATH, bank=load_question_bank())
+    except Exception as e:
+        print(f"Question Pool Error: {e}")
+        return None
+
+def prepare_second_attempt_quiz(api_key, chapter, weak_concepts, total_q=5, student=None):
+    """
+    الاختبار التعويضي من المخزون المولد مسبقاً (استعلام محلي)، مع طلب إعادة ملء في الخلفية
+    للمفاهيم التي قل المتاح منها. إن لم يكفِ المخزون يُطلب الباقي فقط من نموذج اللغة ويُضاف
+    إلى أسئلة المخزون (التي سُجلت مرئية للطالب فيجب أن تُعرض عليه).
+    """
+    quiz, pool = pd.DataFrame(), load_question_pool()
+    if pool:
+        try:
+            quiz = pool.sample(student, chapter, weak_concepts, total_q)
+            pool.request_refill(api_key, chapter, weak_concepts, student)
+            if len(quiz) >= total_q: return quiz
+        except Exception as e:
+            print(f"Question Pool Error: {e}")
+
+    if not api_key: return quiz
+
+    missing = total_q - len(quiz)
     target_concepts = weak_concepts[:3] if weak_concepts else ["مفاهيم عامة"]
-    while len(target_concepts) < total_q:
+    while len(target_concepts) < missing:
         target_concepts.append("أسئلة مراجعة عامة")
 
-    client = OpenAI(api_key=api_key)
     prompt = f"""
-    Create {total_q} simple math MCQs (Arabic) for Chapter {chapter}.
+    Create {missing} simple math MCQs (Arabic) for Chapter {chapter}.
     Focus on: {', '.join(target_concepts)}.
     OUTPUT FORMAT: JSON Array ONLY.
     Fields: "question", "option_a", "option_b", "option_c", "option_d", "correct_option" (e.g. "option_a"), "concept".
     """
     try:
-        response = client.chat.completions.create(
+        response = get_gateway(api_key).chat(
+            priority=INTERACTIVE,
             model="gpt-3.5-turbo",
             messages=[{"role": "system", "content": "JSON only."}, {"role": "user", "content": prompt}]
         )
         data = clean_and_parse_json(response.choices[0].message.content)
         if data:
+            data = data[:missing]
+            by_concept = {}
+            for q in data:
+                q['concept'] = q.get('concept') or target_concepts[0]
+                by_concept.setdefault(q['concept'], []).append(q)
+            if pool:
+                for concept, questions in by_concept.items(): pool.add(chapter, concept, questions)
             for q in data: q['question_id'] = f"AI_{np.random.randint(10000, 99999)}"
-            return pd.DataFrame(data)
-    except: pass
-    return pd.DataFrame()
+            return pd.concat([quiz, pd.DataFrame(data)], ignore_index=True)
+    except Exception as e: print(f"LLM Error (remedial quiz): {e}")
+    return quiz
 
 def generate_mixed_quiz(api_key, selected_chapters, num_questions=5):
     """توليد اختبار مركب من عدة فصول"""
     if not api_key: return pd.DataFrame()
     
-    # 1. جمع المفاهيم
+    # 1. جمع المفاهيم (من البنك المجمّع بدلاً من قراءة ملفات الفصول)
     all_concepts = []
-    for ch in selected_chapters:
-        q_file = os.path.join(DATA_DIR, f"questions_ch{ch}.csv")
-        if os.path.exists(q_file):
-            try:
-                df = pd.read_csv(q_file)
-                if 'concept' in df.columns:
-                    all_concepts.extend(df['concept'].dropna().unique().tolist())
-            except: pass
+    bank = load_question_bank()
+    if bank:
+        try: all_concepts = bank.concepts(selected_chapters)
+        except Exception as e: print(f"Question Bank Error: {e}")
     
     if not all_concepts: return pd.DataFrame()
 
     chosen_concepts = np.random.choice(all_concepts, min(len(all_concepts), num_questions), replace=False)
     
-    client = OpenAI(api_key=api_key)
     prompt = f"""
     Create a mixed math quiz of {num_questions} questions covering Chapters {selected_chapters}.
     Target Concepts: {', '.join(chosen_concepts)}.
@@ -155,7 +730,8 @@ def generate_mixed_quiz(api_key, selected_chapters, num_questions=5):
     Language: Arabic.
     """
     try:
-        response = client.chat.completions.create(
+        response = get_gateway(api_key).chat(
+            priority=BATCH,
             model="gpt-3.5-turbo",
             messages=[{"role": "system", "content": "JSON array output only."}, {"role": "user", "content": prompt}]
         )
@@ -163,12 +739,11 @@ def generate_mixed_quiz(api_key, selected_chapters, num_questions=5):
         if data:
             for q in data: q['question_id'] = f"MIX_{np.random.randint(10000,99999)}"
             return pd.DataFrame(data)
-    except: pass
+    except Exception as e: print(f"LLM Error (mixed quiz): {e}")
     return pd.DataFrame()
 
 def generate_ai_summary(api_key, context_type="general", data=None):
     if not api_key: return "الرجاء إدخال مفتاح API."
-    client = OpenAI(api_key=api_key)
     
     if context_type == "general":
         prompt = f"حلل أداء الفصل: متوسط {data.get('avg',0):.1f}%، عدد المتعثرين {data.get('risk_count',0)}. أعط 3 نصائح للمعلم."
@@ -176,146 +751,190 @@ def generate_ai_summary(api_key, context_type="general", data=None):
         prompt = "لخص أداء الطالب."
         
     try:
-        res = client.chat.completions.create(model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}])
+        res = get_gateway(api_key).chat(priority=BATCH, model="gpt-3.5-turbo",
+                                        messages=[{"role": "user", "content": prompt}])
         return res.choices[0].message.content
     except Exception as e: return f"خطأ: {e}"
 
-def detect_concepts_to_reteach(threshold=50):
-    if not os.path.exists(CONCEPT_HISTORY_CSV): return pd.DataFrame()
-    df = pd.read_csv(CONCEPT_HISTORY_CSV)
-    if df.empty: return pd.DataFrame()
+def get_concept_stats(chapters=None, student=None):
+    """نسبة النجاح لكل مفهوم من جداول الإحصاء المحدثة مع كل تسليم (بدون قراءة السجل كاملاً)."""
+    key = ("concept_stats", None if chapters is None else tuple(chapters), student)
+    return cached_by_data_version(key, lambda: load_attempt_store().concept_stats(chapters, student))
 
-    stats = df.groupby('concept').agg(
-        total_attempts=('correct', 'count'),
-        success_rate=('correct', 'mean')
-    ).reset_index()
-    stats['success_rate'] = stats['success_rate'] * 100
+def detect_concepts_to_reteach(threshold=50, chapters=None):
+    stats = get_concept_stats(chapters)
+    if stats.empty: return pd.DataFrame()
+    stats = stats[['concept', 'total_attempts', 'success_rate']]
     return stats[stats['success_rate'] < threshold].sort_values('success_rate')
 
+RISK_RULES = risk_rules.DEFAULT_RULES
+
 def get_strict_risk_students():
-    if not os.path.exists(SUMMARY_CSV): return pd.DataFrame()
-    df = pd.read_csv(SUMMARY_CSV)
-    risk_list = []
-    for _, row in df.iterrows():
-        reasons = []
-        score = row.get('last_accuracy', 0)
-        imp = row.get('improvement_pct', 0)
-        if score < 50: reasons.append("مستوى حرج")
-        elif score < 65 and imp < 0: reasons.append("تراجع مستمر")
-        
-        if reasons:
-            risk_list.append({
-                "الطالب": row['student'],
-                "درجة الخطورة": "عالية",
-                "الأسباب": ", ".join(reasons),
-                "آخر درجة": score
-            })
-    return pd.DataFrame(risk_list)
+    """الطلاب المتعثرون حسب RISK_RULES؛ تُحسب مرة لكل إصدار بيانات ويتشاركها كل من يستدعيها."""
+    result = cached_by_data_version("risk_students", lambda: risk_rules.evaluate(load_student_summary(), RISK_RULES))
+    return result.copy()
 
 # ----------------------------- 3. دوال تحميل البيانات (بما فيها الدالة المفقودة) ----------------------------- #
 
+# ذاكرة مؤقتة للبيانات المقروءة والمشتقة مفتاحها إصدار البيانات: عداد meta.version في سجل
+# المحاولات يزيد داخل معاملة كل كتابة (تسليم، إعادة تصحيح، إعادة حساب) من أي عملية. العداد
+# نفسه يُقرأ مرة كل DATA_VERSION_TTL_SEC على الأكثر، فإعادة رسم اللوحة بلا بيانات جديدة (عدة
+# استدعاءات متتالية) لا تلمس القاعدة إطلاقاً؛ كتابات هذه العملية تُرى فوراً (invalidate_data_cache)
+# وكتابات العمليات الأخرى بعد DATA_VERSION_TTL_SEC على الأكثر.
+DATA_VERSION_TTL_SEC = float(os.environ.get("EDURAG_DATA_VERSION_TTL_SEC", 1.0))
+_data_cache = {}
+_data_cache_lock = threading.Lock()
+_data_version = {"value": None, "checked": 0.0}
+
+def data_version():
+    now = time.monotonic()
+    if _data_version["value"] is None or now - _data_version["checked"] >= DATA_VERSION_TTL_SEC:
+        _data_version["value"], _data_version["checked"] = load_attempt_store().version(), now
+    return _data_version["value"]
+
+def invalidate_data_cache():
+    """يُستدعى بعد كل كتابة في هذه العملية: يفرغ الذاكرة ويجبر إعادة قراءة الإصدار."""
+    with _data_cache_lock:
+        _data_cache.clear()
+        _data_version["value"] = None
+
+def cached_by_data_version(key, compute):
+    """
+    قيمة compute() محفوظة حتى يتغير إصدار البيانات (القيمة مشتركة؛ لا تعدّلها في مكانها).
+    تُحفظ بالإصدار المقروء قبل الحساب: إن تغيرت البيانات أثناءه يختلف الإصدار التالي فيُعاد الحساب.
+    """
+    version = data_version()
+    entry = _data_cache.get(key)
+    if entry is not None and entry[0] == version: return entry[1]
+    value = compute()
+    with _data_cache_lock:
+        _data_cache[key] = (version, value)
+    return value
+
 def load_concept_history():
     """الدالة التي كانت مفقودة وتسبب الخطأ"""
-    if os.path.exists(CONCEPT_HISTORY_CSV):
-        return pd.read_csv(CONCEPT_HISTORY_CSV)
-    return pd.DataFrame()
+    return cached_by_data_version("concept_history", lambda: load_attempt_store().concept_history())
 
-def load_all_data():
-    sum_df = pd.read_csv(SUMMARY_CSV) if os.path.exists(SUMMARY_CSV) else pd.DataFrame()
-    att_df = pd.read_csv(ATTEMPTS_CSV) if os.path.exists(ATTEMPTS_CSV) else pd.DataFrame()
-    con_df = load_concept_history() # استخدام الدالة لضمان الاتساق
-    return sum_df, att_df, con_df
+def load_student_summary():
+    """ملخص الطلاب (جدول summary المحدث مع كل تسليم) بدون قراءة سجل المحاولات."""
+    return cached_by_data_version("summary", load_attempt_store().summary)
 
-def load_qna_for_chapter(chapter):
+def query_student_records(search="", chapters=None, sort_by="last_accuracy", ascending=False, page=1, page_size=25):
+    """
+    صفحة واحدة من سجلات الطلاب: (DataFrame الصفحة، عدد المطابقين، رقم الصفحة بعد الضبط).
+    البحث بجزء من الاسم عبر فهرس المقاطع، والفلترة بالفصول والترتيب والتقطيع داخل قاعدة البيانات.
+    """
+    store = load_attempt_store()
+    chapters = None if chapters is None else tuple(chapters)
+    page_size = max(1, int(page_size))
+
+    def run(page):
+        return store.student_records(search, chapters, sort_by, ascending, (page - 1) * page_size, page_size)
+
+    key = ("records", search, chapters, sort_by, ascending, page_size)
+    page = max(1, int(page))
+    page_df, total = cached_by_data_version(key + (page,), lambda: run(page))
+    last_page = max(1, -(-total // page_size))
+    if page > last_page:  # البحث أو الفلتر قلّص النتائج إلى ما قبل الصفحة الحالية
+        page = last_page
+        page_df, total = cached_by_data_version(key + (page,), lambda: run(page))
+    return page_df.copy(), total, page
+
+QUESTION_BANK_PATH = os.path.join(RAG_DIR, "question_bank.sqlite")
+
+@st.cache_resource
+def load_question_bank():
+    """بنك الأسئلة المجمّع من data/ (يُعاد تجميعه تلقائياً عند تغير الملفات)."""
     try:
-        q_file = os.path.join(DATA_DIR, f"questions_ch{chapter}.csv")
-        a_file = os.path.join(DATA_DIR, f"answers_ch{chapter}.csv")
-        if os.path.exists(q_file) and os.path.exists(a_file):
-            q = pd.read_csv(q_file)
-            a = pd.read_csv(a_file)
-            if 'correct_option' in q.columns: q = q.drop(columns=['correct_option'])
-            q['question_id'] = q['question_id'].astype(str)
-            a['question_id'] = a['question_id'].astype(str)
-            return pd.merge(q, a, on="question_id", how="inner")
-    except: pass
+        return QuestionBank(QUESTION_BANK_PATH, DATA_DIR)
+    except Exception as e:
+        print(f"Question Bank Error: {e}")
+        return None
+
+def load_qna_for_chapter(chapter):
+    bank = load_question_bank()
+    if bank:
+        try: return bank.chapter(chapter)
+        except Exception as e: print(f"Question Bank Error: {e}")
+    return pd.DataFrame()
+
+def sample_chapter_questions(chapter, n=5):
+    """n أسئلة عشوائية من الفصل (قراءة مفهرسة لا تعتمد على حجم البنك)."""
+    bank = load_question_bank()
+    if bank:
+        try: return bank.sample(chapter, n)
+        except Exception as e: print(f"Question Bank Error: {e}")
     return pd.DataFrame()
 
 # ----------------------------- 4. دوال التصحيح والحفظ ----------------------------- #
 
 def grade_attempt(questions, user_answers):
-    correct = 0
-    weak_concepts = []
-    details = []
-    
     if 'correct_option' not in questions.columns:
         return {"total": 0, "correct": 0, "accuracy": 0, "weak_concepts": [], "details": []}
 
-    for _, row in questions.iterrows():
-        qid = str(row['question_id'])
-        ua = str(user_answers.get(qid, "None")).strip()
-        ca = str(row['correct_option']).strip()
-        correct_text = str(row.get(ca, ca)) # للحصول على النص
-        
-        is_correct = (ua == ca)
-        if not is_correct and str(row.get(ca, "")).strip() == ua: is_correct = True
-            
-        if is_correct: correct += 1
-        else: weak_concepts.append(row['concept'])
-        
-        details.append({
-            "question": row['question'],
-            "user_ans": ua,
-            "correct_ans": correct_text,
-            "is_correct": is_correct,
-            "concept": row['concept']
-        })
+    g = grade_matrix(questions, [user_answers])
+    is_correct = g['correct'][0]
+    # نص الإجابة الصحيحة المعروض كما في الأصل (row.get(ca, ca)): قيمة العمود دون تقليم
+    keys = questions['correct_option'].astype(str).str.strip()
+    shown = [str(questions[k].iat[i]) if k in questions.columns else k for i, k in enumerate(keys)]
+    details = [{
+        "question_id": qid,
+        "question": q,
+        "user_ans": str(user_answers.get(qid, "None")).strip(),
+        "correct_ans": ca,
+        "is_correct": bool(ok),
+        "concept": concept
+    } for qid, q, ca, ok, concept in zip(g['question_ids'], questions['question'], shown,
+                                         is_correct, questions['concept'])]
 
     return {
         "total": len(questions),
-        "correct": correct,
-        "accuracy": (correct/len(questions))*100 if len(questions) > 0 else 0,
-        "weak_concepts": list(set(weak_concepts)),
+        "correct": int(g['n_correct'][0]),
+        "accuracy": float(g['accuracy'][0]),
+        "weak_concepts": [c for c, weak in zip(g['concepts'], g['weak'][0]) if weak],
         "details": details
     }
 
 def save_attempt_data(student, chapter, attempt, summary, time_sec):
-    row = {
-        "student": student, "chapter": chapter, "attempt": attempt,
-        "total": summary['total'], "correct": summary['correct'],
-        "accuracy": summary['accuracy'], "weak_concepts": ";".join(summary['weak_concepts']),
-        "time_sec": time_sec
-    }
-    df = pd.DataFrame([row])
-    hdr = not os.path.exists(ATTEMPTS_CSV)
-    df.to_csv(ATTEMPTS_CSV, mode='a', header=hdr, index=False)
-    update_student_summary(student)
-    
-    c_rows = []
-    for d in summary['details']:
-        c_rows.append({
-            "student": student, "chapter": chapter, "attempt": attempt,
-            "concept": d['concept'], "correct": 1 if d['is_correct'] else 0,
-            "total": 1, "accuracy": 100 if d['is_correct'] else 0
-        })
-    if c_rows:
-        c_df = pd.DataFrame(c_rows)
-        c_hdr = not os.path.exists(CONCEPT_HISTORY_CSV)
-        c_df.to_csv(CONCEPT_HISTORY_CSV, mode='a', header=c_hdr, index=False)
+    """تسجيل المحاولة وصفوف المفاهيم والإجابات وتحديث الملخص في معاملة واحدة."""
+    try:
+        return load_attempt_store().record_attempt(student, chapter, attempt, summary, time_sec)
+    finally:
+        invalidate_data_cache()
 
 def update_student_summary(student):
-    if not os.path.exists(ATTEMPTS_CSV): return
-    df = pd.read_csv(ATTEMPTS_CSV)
-    s_df = df[df['student'] == student]
-    if s_df.empty: return
-    
-    summ_row = {
-        "student": student, 
-        "best_accuracy": s_df['accuracy'].max(), 
-        "last_accuracy": s_df.iloc[-1]['accuracy'], 
-        "improvement_pct": s_df.iloc[-1]['accuracy'] - s_df.iloc[0]['accuracy'], 
-        "avg_time_sec": s_df['time_sec'].mean()
-    }
-    
-    full_sum = pd.read_csv(SUMMARY_CSV) if os.path.exists(SUMMARY_CSV) else pd.DataFrame()
-    if not full_sum.empty: full_sum = full_sum[full_sum['student'] != student]
-    pd.concat([full_sum, pd.DataFrame([summ_row])]).to_csv(SUMMARY_CSV, index=False)
\ No newline at end of file
+    """إعادة حساب ملخص الطالب من محاولاته (الحفظ العادي يحدّثه تزايدياً)."""
+    load_attempt_store().rebuild_summary(student)
+    invalidate_data_cache()
+
+def regrade_all():
+    """
+    إعادة تصحيح كل الإجابات المسجلة بمفاتيح الإجابة الحالية في بنك الأسئلة (دفعة واحدة متجهة)،
+    ثم تحديث المحاولات وتاريخ المفاهيم وملخص الطلاب في معاملة واحدة.
+    الأسئلة غير الموجودة في البنك (المولدة بالذكاء الاصطناعي) تحتفظ بتصحيحها الأصلي،
+    والمحاولات القديمة بلا إجابات مسجلة لا تُمس. يعيد عدد الإجابات التي تغير تصحيحها.
+    """
+    store, bank = load_attempt_store(), load_question_bank()
+    log = store.answers(with_row_id=True)
+    if log.empty or not bank: return 0
+
+    log['chapter'] = log['chapter'].astype(str)
+    keys = pd.concat([bank.chapter(ch) for ch in bank.chapters()], ignore_index=True)
+    keys = keys.drop(columns=['concept', 'question'])
+    m = log.merge(keys, on=['chapter', 'question_id'], how='left')
+    in_bank = m['correct_option'].notna().to_numpy()
+    old = log['is_correct'].astype(bool).to_numpy()
+    new = old.copy()
+    if in_bank.any():
+        options, k, _, key_text = resolve_questions(m[in_bank])
+        new[in_bank], _ = grade_rows(options, k, key_text, m.loc[in_bank, 'answer'].fillna("None").to_numpy(dtype=str))
+    log['is_correct'] = new.astype(int)
+
+    per = log.groupby('attempt_id', sort=False).agg(correct=('is_correct', 'sum'), total=('is_correct', 'size'))
+    wrong = log[log['is_correct'] == 0]
+    weak = wrong.groupby('attempt_id', sort=False)['concept'].agg(lambda c: ";".join(dict.fromkeys(c.astype(str))))
+    per['weak_concepts'] = weak.reindex(per.index).fillna("")
+    per['accuracy'] = per['correct'] * 100.0 / per['total']
+    store.apply_regrade(log, per)
+    invalidate_data_cache()
+    return int((new != old).sum())
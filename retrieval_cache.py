@@ -0,0 +1,103 @@
+"""
+ذاكرة LRU داخل العملية لنتائج البحث في الكتاب: الاستعلام بعد التحليل ← (أرقام الفقرات، الدرجات).
+
+مفردات المفاهيم صغيرة ومتكررة (كل طلاب الفصل يخطئون في المفاهيم نفسها، وStreamlit يعيد
+تشغيل الصفحة مع كل تفاعل)، فلا داعي لإعادة التحويل إلى متجه وحساب التشابه في كل مرة.
+
+  - المفتاح نص الاستعلام بعد التحليل (مع وضع البحث وعدد النتائج والكتب)، فـ"الكسور"
+    و"الْكُسُور" إدخال واحد. يُخزن بصمةً من 16 بايت (blake2b) بدل النص العربي.
+  - القيمة bytes متصلة: أرقام الفقرات int32 ثم الدرجات float32 (8 بايت لكل نتيجة).
+    الإدخال كاملاً نحو 200 بايت، فـ 20 ألف استعلام ≈ 4 ميغابايت.
+  - كل إدخال مرتبط بإصدار المكتبة المحمّلة (index_store.Library.version)؛ عند تغيره
+    (إعادة بناء الفهرس وإعادة تحميله) تُفرغ الذاكرة كلها.
+"""
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 20_000
+ENTRY_OVERHEAD_BYTES = 105  # مدخل القاموس وعقدة OrderedDict لكل مفتاح (مقيس بـ tracemalloc)
+
+
+def digest(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def pack(scores, indices):
+    return np.asarray(indices, dtype=np.int32).tobytes() + np.asarray(scores, dtype=np.float32).tobytes()
+
+
+def unpack(value):
+    k = len(value) // 8
+    return (np.frombuffer(value, dtype=np.float32, count=k, offset=4 * k),
+            np.frombuffer(value, dtype=np.int32, count=k).astype(np.int64))
+
+
+class RetrievalCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_bytes(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD_BYTES
+
+    def _check_version(self, version):
+        if version == self.version: return
+        if self.version is not None: self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        self.version = version
+
+    def get_many(self, version, keys):
+        """(scores, indices) لكل مفتاح موجود، و None للمفقود."""
+        out = []
+        with self._lock:
+            self._check_version(version)
+            for key in map(digest, keys):
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    out.append(unpack(value))
+        return out
+
+    def put_many(self, version, keys, scores, indices):
+        if self.max_entries <= 0: return
+        with self._lock:
+            if version != self.version: return  # المكتبة تغيرت أثناء البحث
+            for key, row_s, row_i in zip(map(digest, keys), scores, indices):
+                value = pack(row_s, row_i)
+                old = self._entries.pop(key, None)
+                if old is not None: self._bytes -= self._entry_bytes(key, old)
+                self._entries[key] = value
+                self._bytes += self._entry_bytes(key, value)
+            while len(self._entries) > self.max_entries:
+                key, value = self._entries.popitem(last=False)
+                self._bytes -= self._entry_bytes(key, value)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                "max_entries": self.max_entries, "hit_rate": self.hits / total if total else 0.0,
+                "bytes": self._bytes, "evictions": self.evictions, "invalidations": self.invalidations,
+                "version": self.version}
@@ -0,0 +1,65 @@
+"""
+قواعد رصد الطلاب المتعثرين كأقنعة منطقية على أعمدة ملخص الطلاب (بدون حلقات على الصفوف).
+
+كل قاعدة: اسم، سبب يظهر للمعلم، ودالة تأخذ DataFrame الملخص وتعيد قناعاً منطقياً
+بطول الجدول. نتائج القواعد تُرمّز لكل طالب في عدد واحد (بت لكل قاعدة)، ويُبنى نص
+الأسباب مرة لكل تركيبة مختلفة فقط ثم يُوزع بالفهرسة، فتبقى التكلفة عمليات NumPy
+حتى لمئات آلاف الطلاب.
+
+لإضافة قاعدة: evaluate(df, DEFAULT_RULES + [time_outlier_rule()]) أو قاعدة جديدة بنفس الشكل.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+RiskRule = namedtuple("RiskRule", ["name", "reason", "mask"])
+
+RESULT_COLUMNS = ["الطالب", "درجة الخطورة", "الأسباب", "آخر درجة"]
+
+
+def _col(df, name, default=0):
+    return df[name] if name in df.columns else pd.Series(default, index=df.index)
+
+
+DEFAULT_RULES = [
+    RiskRule("critical", "مستوى حرج",
+             lambda df: _col(df, 'last_accuracy') < 50),
+    # "تراجع مستمر" فقط لمن لم يصنف حرجاً (كما في elif الأصلية)
+    RiskRule("declining", "تراجع مستمر",
+             lambda df: (_col(df, 'last_accuracy') >= 50) & (_col(df, 'last_accuracy') < 65)
+                        & (_col(df, 'improvement_pct') < 0)),
+]
+
+
+def time_outlier_rule(k=3.0, reason="زمن غير معتاد"):
+    """متوسط زمن بعيد عن الوسيط بأكثر من k × MAD (تسرع شديد أو بطء شديد)."""
+    def mask(df):
+        t = _col(df, 'avg_time_sec', np.nan).astype(float)
+        med = t.median()
+        mad = (t - med).abs().median()
+        if not mad or np.isnan(mad): return pd.Series(False, index=df.index)
+        return (t - med).abs() > k * 1.4826 * mad
+    return RiskRule("time_outlier", reason, mask)
+
+
+def evaluate(df, rules=DEFAULT_RULES):
+    """الطلاب الذين تنطبق عليهم قاعدة واحدة على الأقل، بأعمدة get_strict_risk_students."""
+    if df is None or df.empty: return pd.DataFrame()
+    codes = np.zeros(len(df), dtype=np.int64)
+    for bit, rule in enumerate(rules):
+        codes |= np.asarray(rule.mask(df), dtype=bool).astype(np.int64) << bit
+    flagged = codes > 0
+    if not flagged.any(): return pd.DataFrame()
+
+    combos, inverse = np.unique(codes[flagged], return_inverse=True)
+    labels = np.array([", ".join(r.reason for bit, r in enumerate(rules) if c >> bit & 1) for c in combos],
+                      dtype=object)
+    reasons = labels[inverse]
+
+    return pd.DataFrame({
+        "الطالب": _col(df, 'student', "").to_numpy()[flagged],
+        "درجة الخطورة": "عالية",
+        "الأسباب": reasons,
+        "آخر درجة": _col(df, 'last_accuracy').to_numpy()[flagged],
+    }, columns=RESULT_COLUMNS)
@@ -0,0 +1,111 @@
+"""
+فهرس مقلوب (Inverted Index) لمصفوفة TF-IDF.
+
+لكل مصطلح قائمة (رقم الفقرة، الوزن) مخزنة في مصفوفات NumPy متراصة، فيقتصر
+حساب الاستعلام على الفقرات التي تشاركه مصطلحاً واحداً على الأقل، مع إيقاف
+مبكر على طريقة MaxScore لاختيار أفضل top_k دون المرور على كل القوائم.
+البحث داخل شريحة صفوف (فصل من الكتاب) يقص كل قائمة بالبحث الثنائي لأنها مرتبة.
+"""
+import numpy as np
+
+
+class InvertedIndex:
+    def __init__(self, term_ptr, doc_ids, weights, term_max, n_docs):
+        self.term_ptr = term_ptr    # بداية قائمة كل مصطلح (طولها عدد المصطلحات + 1)
+        self.doc_ids = doc_ids      # أرقام الفقرات مرتبة تصاعدياً داخل كل قائمة
+        self.weights = weights      # وزن TF-IDF للمصطلح في الفقرة
+        self.term_max = term_max    # أعلى وزن في كل قائمة (الحد الأعلى لمساهمة المصطلح)
+        self.n_docs = int(n_docs)
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """بناء الفهرس من مصفوفة TF-IDF (فقرات × مصطلحات)."""
+        csc = matrix.tocsc()
+        csc.sort_indices()
+        term_ptr = csc.indptr.astype(np.int64)
+        weights = csc.data.astype(np.float32)
+        term_max = np.zeros(csc.shape[1], dtype=np.float32)
+        non_empty = np.diff(term_ptr) > 0
+        if non_empty.any():
+            term_max[non_empty] = np.maximum.reduceat(weights, term_ptr[:-1][non_empty])
+        return cls(term_ptr, csc.indices.astype(np.int32), weights, term_max, csc.shape[0])
+
+    def save(self, path):
+        np.savez(path, term_ptr=self.term_ptr, doc_ids=self.doc_ids, weights=self.weights,
+                 term_max=self.term_max, n_docs=np.int64(self.n_docs))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls(z['term_ptr'], z['doc_ids'], z['weights'], z['term_max'], z['n_docs'])
+
+    def postings(self, term, rows=None):
+        start, end = self.term_ptr[term], self.term_ptr[term + 1]
+        ids, w = self.doc_ids[start:end], self.weights[start:end]
+        if rows is None: return ids, w
+        lo, hi = np.searchsorted(ids, rows)
+        return ids[lo:hi], w[lo:hi]
+
+    def search(self, terms, query_weights, top_k=2, rows=None):
+        """
+        أفضل top_k فقرة لاستعلام ممثل بأرقام مصطلحاته وأوزانها.
+        rows=(start, end) يقصر البحث على الفقرات start <= id < end.
+        يعيد (scores, ids) مرتبة تنازلياً؛ قد يكون طولها أقل من top_k.
+        """
+        empty = (np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64))
+        if top_k <= 0 or len(terms) == 0: return empty
+
+        terms = np.asarray(terms, dtype=np.int64)
+        query_weights = np.asarray(query_weights, dtype=np.float32)
+        bounds = query_weights * self.term_max[terms]
+        order = np.argsort(-bounds, kind='stable')
+        terms, query_weights, bounds = terms[order], query_weights[order], bounds[order]
+        # remaining[j] = مجموع الحدود العليا للمصطلحات التي لم تُعالج بعد المصطلح j
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1][1:], [0.0]]).astype(np.float32)
+
+        cand_ids = np.zeros(0, dtype=np.int32)
+        cand_scores = np.zeros(0, dtype=np.float32)
+        essential = True
+        for j, term in enumerate(terms):
+            ids, w = self.postings(term, rows)
+            if len(ids) == 0: continue
+            contrib = w * query_weights[j]
+
+            if essential:
+                # مصطلح أساسي: أي فقرة في قائمته قد تدخل النتائج
+                all_ids = np.concatenate([cand_ids, ids])
+                all_scores = np.concatenate([cand_scores, contrib])
+                cand_ids, inverse = np.unique(all_ids, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=all_scores).astype(np.float32)
+            else:
+                # مصطلح غير أساسي: نحدّث المرشحين الحاليين فقط بالبحث الثنائي في القائمة
+                pos = np.searchsorted(ids, cand_ids)
+                pos_clipped = np.minimum(pos, len(ids) - 1)
+                hit = (pos < len(ids)) & (ids[pos_clipped] == cand_ids)
+                cand_scores[hit] += contrib[pos_clipped[hit]]
+
+            if len(cand_scores) >= top_k:
+                threshold = np.partition(cand_scores, len(cand_scores) - top_k)[len(cand_scores) - top_k]
+                # فقرة لم تظهر بعد لا يتجاوز مجموعها remaining[j]، فلا تنافس العتبة
+                if remaining[j] <= threshold: essential = False
+                keep = cand_scores + remaining[j] >= threshold
+                cand_ids, cand_scores = cand_ids[keep], cand_scores[keep]
+
+        k = min(top_k, len(cand_scores))
+        if k == 0: return empty
+        part = np.argpartition(-cand_scores, k - 1)[:k]
+        best = part[np.argsort(-cand_scores[part], kind='stable')]
+        return cand_scores[best], cand_ids[best].astype(np.int64)
+
+    def search_batch(self, query_vecs, top_k=2, rows=None):
+        """البحث لكل صف من مصفوفة استعلامات متفرقة؛ يعيد (scores, indices) بأبعاد (n, top_k) والفراغ -1."""
+        query_vecs = query_vecs.tocsr()
+        n = query_vecs.shape[0]
+        scores = np.zeros((n, top_k), dtype=np.float32)
+        indices = np.full((n, top_k), -1, dtype=np.int64)
+        for r in range(n):
+            start, end = query_vecs.indptr[r], query_vecs.indptr[r + 1]
+            s, ids = self.search(query_vecs.indices[start:end], query_vecs.data[start:end], top_k, rows)
+            scores[r, :len(s)] = s
+            indices[r, :len(ids)] = ids
+        return scores, indices
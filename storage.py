@@ -0,0 +1,37 @@
+"""
+اتصالات SQLite المشتركة لملفات التخزين المحلية (ذاكرة LLM، بنوك الأسئلة، سجلات المحاولات).
+
+كل خيط يحصل على اتصاله الخاص لكل ملف (Streamlit يشغل كل جلسة في خيط)، بوضع WAL
+حتى لا يحجب القراء الكاتب، والمعاملات صريحة عبر transaction().
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+BUSY_TIMEOUT_MS = 30000
+
+_local = threading.local()
+
+
+def connect(path):
+    conns = getattr(_local, "conns", None)
+    if conns is None: conns = _local.conns = {}
+    if path not in conns:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conns[path] = conn
+    return conns[path]
+
+
+@contextmanager
+def transaction(conn):
+    """معاملة كتابة واحدة (BEGIN IMMEDIATE يحجز القفل من البداية فلا تتعارض الكتابات)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -2,11 +2,14 @@ import time
 import pandas as pd
 import streamlit as st
 from rag_core import (
-    load_qna_for_chapter,
+    sample_chapter_questions,
     grade_attempt,
     save_attempt_data,
-    get_explanation_and_page,
-    prepare_second_attempt_quiz
+    get_explanations_streaming,
+    search_concepts_in_book,
+    library_chapters,
+    prepare_second_attempt_quiz,
+    CHAPTER_WIDEN_SCORE
 )
 
 # إعداد الصفحة بعنوان رسمي وتصميم بسيط
@@ -66,10 +69,10 @@ elif st.session_state.step == 'select_chapter':
     chapter = st.selectbox("اختر الفصل الدراسي:", [1, 2, 3, 4, 5])
     
     if st.button("بدء التقييم الأساسي"):
-        df = load_qna_for_chapter(chapter)
+        df = sample_chapter_questions(chapter, 5)
         if not df.empty:
             st.session_state.chapter = chapter
-            st.session_state.questions = df.sample(5).reset_index(drop=True)
+            st.session_state.questions = df
             st.session_state.attempt_num = 1
             st.session_state.start_time = time.time()
             st.session_state.step = 'quiz'
@@ -122,6 +125,16 @@ elif st.session_state.step == 'results':
     
     st.markdown("### التحليل التفصيلي للإجابات")
     
+    # استرجاع فقرات الكتاب لكل المفاهيم الخاطئة بتمريرة بحث واحدة داخل فصل الاختبار
+    # (والفصلين المجاورين للمفهوم الذي لا يطابق نص فصله جيداً)؛ فصل بلا شريحة في الفهرس يُبحث في الكتاب كله
+    wrong_concepts = list(dict.fromkeys(d['concept'] for d in summary['details'] if not d['is_correct']))
+    known = library_chapters()
+    search_chapter = st.session_state.chapter if not known or str(st.session_state.chapter) in known else None
+    contexts = dict(zip(wrong_concepts, search_concepts_in_book(
+        wrong_concepts, chapter=search_chapter, widen_below=CHAPTER_WIDEN_SCORE)))
+    
+    # أماكن الشرح تُحجز أولاً ثم تُملأ بالتوازي مع وصول ردود النموذج
+    explanation_slots = {}
     for detail in summary['details']:
         status_color = "green" if detail['is_correct'] else "red"
         with st.expander(f"سؤال: {detail['concept']}", expanded=not detail['is_correct']):
@@ -132,9 +145,15 @@ elif st.session_state.step == 'results':
             if not detail['is_correct']:
                 st.markdown("---")
                 st.markdown("**التوجيه الأكاديمي (AI):**")
-                explanation, pages = get_explanation_and_page(st.session_state.api_key, detail['concept'])
-                st.info(f"المرجع المنهجي: صفحة {pages}")
-                st.write(explanation)
+                explanation_slots.setdefault(detail['concept'], []).append((st.empty(), st.empty()))
+
+    def show_explanation(concept, text, pages, done):
+        for pages_slot, text_slot in explanation_slots.get(concept, []):
+            pages_slot.info(f"المرجع المنهجي: صفحة {pages}")
+            text_slot.write(text if done else text + " ▌")
+
+    if wrong_concepts:
+        get_explanations_streaming(st.session_state.api_key, wrong_concepts, contexts, show_explanation)
 
     if st.session_state.attempt_num == 1:
         st.markdown("---")
@@ -142,24 +161,24 @@ elif st.session_state.step == 'results':
         st.info("يمكنك إجراء اختبار تعويضي يركز على نقاط الضعف المحددة في التقرير أعلاه.")
         
         if st.button("بدء الاختبار التعويضي"):
-            if not st.session_state.api_key:
-                st.error("يتطلب الاختبار التعويضي مفتاح API نشط.")
-            else:
-                with st.spinner("جاري إعداد نموذج اختبار مخصص..."):
-                    new_quiz = prepare_second_attempt_quiz(
-                        st.session_state.api_key,
-                        st.session_state.chapter,
-                        summary['weak_concepts']
-                    )
-                    
-                    if not new_quiz.empty:
-                        st.session_state.questions = new_quiz
-                        st.session_state.attempt_num = 2
-                        st.session_state.start_time = time.time()
-                        st.session_state.step = 'quiz'
-                        st.rerun()
-                    else:
-                        st.error("تعذر إنشاء الاختبار في الوقت الحالي. يرجى المحاولة لاحقاً.")
+            with st.spinner("جاري إعداد نموذج اختبار مخصص..."):
+                new_quiz = prepare_second_attempt_quiz(
+                    st.session_state.api_key,
+                    st.session_state.chapter,
+                    summary['weak_concepts'],
+                    student=st.session_state.student_name
+                )
+                
+                if not new_quiz.empty:
+                    st.session_state.questions = new_quiz
+                    st.session_state.attempt_num = 2
+                    st.session_state.start_time = time.time()
+                    st.session_state.step = 'quiz'
+                    st.rerun()
+                elif not st.session_state.api_key:
+                    st.error("يتطلب الاختبار التعويضي مفتاح API نشط.")
+                else:
+                    st.error("تعذر إنشاء الاختبار في الوقت الحالي. يرجى المحاولة لاحقاً.")
     
     if st.button("العودة للصفحة الرئيسية"):
         st.session_state.step = 'select_chapter'
@@ -2,12 +2,13 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 from rag_core import (
-    load_all_data, 
+    load_student_summary,
     detect_concepts_to_reteach, 
     get_strict_risk_students, 
     generate_ai_summary,
     generate_mixed_quiz,
-    load_concept_history # تأكد من وجود دالة تحميل المفاهيم
+    get_concept_stats,
+    query_student_records
 )
 
 st.set_page_config(page_title="بوابة المعلم - EduRAG Pro", layout="wide")
@@ -30,7 +31,7 @@ with st.sidebar:
     )
 
 # تحميل البيانات
-sum_df, att_df, con_df = load_all_data()
+sum_df = load_student_summary()
 
 st.title("لوحة المعلومات الأكاديمية")
 
@@ -86,10 +87,10 @@ with tab_overview:
 with tab_concepts:
     st.subheader("مصفوفة صعوبة المفاهيم")
     
-    if not con_df.empty:
-        # تجميع البيانات لحساب نسبة النجاح لكل مفهوم
-        concept_stats = con_df.groupby('concept')['correct'].mean().reset_index()
-        concept_stats['accuracy'] = concept_stats['correct'] * 100
+    # نسبة النجاح لكل مفهوم ضمن الفصول المختارة (إحصاء مجمّع مسبقاً)
+    concept_stats = get_concept_stats(selected_chapters_filter)
+    if not concept_stats.empty:
+        concept_stats = concept_stats.rename(columns={'success_rate': 'accuracy'})
         concept_stats = concept_stats.sort_values('accuracy') # الأقل دقة أولاً (الأصعب)
 
         # رسم بياني شريطي أفقي (أفضل لقراءة أسماء المفاهيم الطويلة)
@@ -119,22 +120,45 @@ with tab_students:
     
     search_term = st.text_input("البحث عن طالب:", "")
     
+    sort_options = {
+        'الدرجة النهائية': 'last_accuracy',
+        'نسبة التحسن': 'improvement_pct',
+        'متوسط الزمن (ث)': 'avg_time_sec',
+        'اسم الطالب': 'student'
+    }
+    c_sort, c_order, c_size = st.columns(3)
+    sort_label = c_sort.selectbox("الترتيب حسب:", list(sort_options))
+    ascending = c_order.radio("الاتجاه:", ["تنازلي", "تصاعدي"], horizontal=True) == "تصاعدي"
+    page_size = c_size.selectbox("عدد الصفوف في الصفحة:", [25, 50, 100])
+    
+    # الاستعلام يعيد الصفحة المعروضة فقط (البحث والفلترة والترتيب في قاعدة البيانات)
+    page_df, total, page = query_student_records(
+        search_term, selected_chapters_filter, sort_by=sort_options[sort_label], ascending=ascending,
+        page=st.session_state.get("records_page", 1), page_size=page_size
+    )
+    
     # تحضير الجدول للعرض
-    display_df = sum_df.copy()
-    display_df = display_df.rename(columns={
+    display_df = page_df.rename(columns={
         'student': 'اسم الطالب',
         'last_accuracy': 'الدرجة النهائية',
         'improvement_pct': 'نسبة التحسن',
         'avg_time_sec': 'متوسط الزمن (ث)'
     })
     
-    if search_term:
-        display_df = display_df[display_df['اسم الطالب'].str.contains(search_term)]
-        
-    st.dataframe(
-        display_df[['اسم الطالب', 'الدرجة النهائية', 'نسبة التحسن', 'متوسط الزمن (ث)']].style.background_gradient(subset=['الدرجة النهائية'], cmap='RdYlGn'),
-        use_container_width=True
-    )
+    if total == 0:
+        st.info("لا يوجد طلاب مطابقون للبحث في الفصول المحددة.")
+    else:
+        st.dataframe(
+            display_df[['اسم الطالب', 'الدرجة النهائية', 'نسبة التحسن', 'متوسط الزمن (ث)']].style.background_gradient(subset=['الدرجة النهائية'], cmap='RdYlGn'),
+            use_container_width=True
+        )
+        n_pages = -(-total // page_size)
+        c_page, c_info = st.columns([1, 3])
+        if st.session_state.get("records_page", 1) != page:
+            st.session_state.records_page = page
+        c_page.number_input("الصفحة:", min_value=1, max_value=n_pages, key="records_page")
+        first = (page - 1) * page_size + 1
+        c_info.caption(f"عرض {first}–{first + len(page_df) - 1} من {total} طالب")
 
 # 4. تبويب إنشاء الاختبارات
 with tab_exam:
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path: sys.path.insert(0, ROOT_DIR)
+
+# rag_core يقرأ هذه المسارات عند الاستيراد؛ الاختبارات لا تلمس reports/ و rag_data/ الحقيقية
+_TMP = tempfile.mkdtemp(prefix="edurag_tests_")
+for name in ("EDURAG_REPORTS_DIR", "EDURAG_RAG_DIR"):
+    os.environ.setdefault(name, os.path.join(_TMP, name.split("_")[1].lower()))
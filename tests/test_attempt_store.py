@@ -0,0 +1,74 @@
+"""ملخص الطلاب المحدَّث تراكمياً في AttemptStore مقابل update_student_summary الأصلية."""
+import numpy as np
+import pandas as pd
+
+from attempt_store import AttemptStore
+
+SUMMARY_COLUMNS = ["student", "best_accuracy", "last_accuracy", "improvement_pct", "avg_time_sec"]
+
+
+def baseline_summary(attempts):
+    """update_student_summary كما كانت (من المحاولات بترتيب التسجيل) لكل طالب."""
+    rows = []
+    for student in attempts['student'].unique():
+        s_df = attempts[attempts['student'] == student]
+        rows.append({
+            "student": student,
+            "best_accuracy": s_df['accuracy'].max(),
+            "last_accuracy": s_df.iloc[-1]['accuracy'],
+            "improvement_pct": s_df.iloc[-1]['accuracy'] - s_df.iloc[0]['accuracy'],
+            "avg_time_sec": s_df['time_sec'].mean()
+        })
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+def make_summary(rng, n_questions=5):
+    concepts = ["جمع الكسور", "ضرب الكسور", "الأعداد", "الهندسة"]
+    details = []
+    for i in range(n_questions):
+        ok = bool(rng.random() < 0.6)
+        details.append({"question": f"س{i}", "question_id": str(100 + i), "user_ans": "option_a",
+                        "correct_ans": "option_a", "is_correct": ok, "concept": concepts[rng.integers(len(concepts))]})
+    correct = sum(d['is_correct'] for d in details)
+    return {"total": n_questions, "correct": correct, "accuracy": (correct / n_questions) * 100,
+            "weak_concepts": list({d['concept'] for d in details if not d['is_correct']}), "details": details}
+
+
+def by_student(df):
+    return df[SUMMARY_COLUMNS].sort_values("student").reset_index(drop=True)
+
+
+def test_summary_matches_baseline(tmp_path):
+    store = AttemptStore(str(tmp_path / "attempts.sqlite"), migrate_from=str(tmp_path))
+    rng = np.random.default_rng(1)
+    students = ["أحمد علي", "سارة محمد", "يوسف", "مريم خالد"]
+    recorded = []
+    for k in range(40):
+        student = students[rng.integers(len(students))]
+        summary = make_summary(rng)
+        time_sec = float(rng.uniform(20, 400))
+        store.record_attempt(student, int(rng.integers(1, 6)), 1 + k % 2, summary, time_sec)
+        recorded.append({"student": student, "accuracy": summary['accuracy'], "time_sec": time_sec})
+
+    want = by_student(baseline_summary(pd.DataFrame(recorded)))
+    pd.testing.assert_frame_equal(by_student(store.summary()), want, check_dtype=False)
+
+    # إعادة الحساب الكاملة من جدول المحاولات تعطي الملخص نفسه
+    store.rebuild_summary()
+    pd.testing.assert_frame_equal(by_student(store.summary()), want, check_dtype=False)
+
+
+def test_concept_stats_match_groupby(tmp_path):
+    store = AttemptStore(str(tmp_path / "attempts.sqlite"), migrate_from=str(tmp_path))
+    rng = np.random.default_rng(2)
+    rows = []
+    for k in range(20):
+        summary = make_summary(rng)
+        store.record_attempt(f"s{k % 3}", 1, 1, summary, 60.0)
+        rows += [{"concept": d['concept'], "accuracy": 100 if d['is_correct'] else 0} for d in summary['details']]
+
+    want = pd.DataFrame(rows).groupby("concept")['accuracy'].agg(['count', 'mean']).reset_index()
+    got = store.concept_stats()
+    assert list(got['concept']) == list(want['concept'])
+    assert list(got['total_attempts']) == list(want['count'])
+    np.testing.assert_allclose(got['success_rate'], want['mean'])
@@ -0,0 +1,80 @@
+"""تصحيح المحاولة بالمصفوفات (grading.py) مقابل حلقة iterrows الأصلية في rag_core."""
+import pandas as pd
+
+import rag_core
+
+
+def baseline_grade_attempt(questions, user_answers):
+    """grade_attempt كما كانت قبل التصحيح بالمصفوفات."""
+    correct = 0
+    weak_concepts = []
+    details = []
+
+    if 'correct_option' not in questions.columns:
+        return {"total": 0, "correct": 0, "accuracy": 0, "weak_concepts": [], "details": []}
+
+    for _, row in questions.iterrows():
+        qid = str(row['question_id'])
+        ua = str(user_answers.get(qid, "None")).strip()
+        ca = str(row['correct_option']).strip()
+        correct_text = str(row.get(ca, ca))
+
+        is_correct = (ua == ca)
+        if not is_correct and str(row.get(ca, "")).strip() == ua: is_correct = True
+
+        if is_correct: correct += 1
+        else: weak_concepts.append(row['concept'])
+
+        details.append({
+            "question": row['question'],
+            "user_ans": ua,
+            "correct_ans": correct_text,
+            "is_correct": is_correct,
+            "concept": row['concept']
+        })
+
+    return {
+        "total": len(questions),
+        "correct": correct,
+        "accuracy": (correct/len(questions))*100 if len(questions) > 0 else 0,
+        "weak_concepts": list(set(weak_concepts)),
+        "details": details
+    }
+
+
+QUESTIONS = pd.DataFrame({
+    "question_id": ["101", "102", "103", "104", "105", "106"],
+    "question": ["س1", "س2", "س3", "س4", "س5", "س6"],
+    "option_a": ["3/4", "1/2", "5", " 7 ", "أ", "0"],
+    "option_b": ["1/4", "6/12", "6", "8", "ب", "1"],
+    "option_c": ["1/2", "5/7", "7", "9", "ج", "2"],
+    "option_d": ["1", "1/4", "8", "10", "د", "3"],
+    "correct_option": ["option_a", "option_b", " option_c", "option_a", "option_d", "option_b"],
+    "concept": ["جمع الكسور", "ضرب الكسور", "جمع الكسور", "الأعداد", "الهندسة", "الأعداد"],
+})
+
+ANSWER_SHEETS = [
+    {},                                                        # لم يُجب عن شيء
+    {"101": "option_a", "102": "option_b", "103": "option_c", "104": "option_a", "105": "option_d",
+     "106": "option_b"},                                       # كلها صحيحة باسم الخيار
+    {"101": "3/4", "102": " 6/12 ", "103": "7", "104": "7", "105": "أ", "106": "2"},  # نص الإجابة
+    {"101": "option_b", "103": "option_c ", "105": None, "106": 1},  # خاطئة وناقصة وأنواع أخرى
+]
+
+
+def test_grade_attempt_matches_iterrows_baseline():
+    for answers in ANSWER_SHEETS:
+        got = rag_core.grade_attempt(QUESTIONS, answers)
+        want = baseline_grade_attempt(QUESTIONS, answers)
+        assert got["total"] == want["total"]
+        assert got["correct"] == want["correct"]
+        assert got["accuracy"] == want["accuracy"]
+        assert set(got["weak_concepts"]) == set(want["weak_concepts"])
+        assert len(got["weak_concepts"]) == len(want["weak_concepts"])
+        for g, w in zip(got["details"], want["details"]):
+            assert {k: g[k] for k in w} == w
+
+
+def test_grade_attempt_without_answer_key():
+    questions = QUESTIONS.drop(columns=["correct_option"])
+    assert rag_core.grade_attempt(questions, {}) == baseline_grade_attempt(questions, {})
@@ -0,0 +1,60 @@
+"""risk_rules.evaluate بالأقنعة المنطقية مقابل حلقة iterrows/elif الأصلية في get_strict_risk_students."""
+import numpy as np
+import pandas as pd
+
+import risk_rules
+
+
+def baseline_risk_students(df):
+    """get_strict_risk_students كما كانت قبل القواعد المتجهة (على DataFrame الملخص بدل CSV)."""
+    risk_list = []
+    for _, row in df.iterrows():
+        reasons = []
+        score = row.get('last_accuracy', 0)
+        imp = row.get('improvement_pct', 0)
+        if score < 50: reasons.append("مستوى حرج")
+        elif score < 65 and imp < 0: reasons.append("تراجع مستمر")
+
+        if reasons:
+            risk_list.append({
+                "الطالب": row['student'],
+                "درجة الخطورة": "عالية",
+                "الأسباب": ", ".join(reasons),
+                "آخر درجة": score
+            })
+    return pd.DataFrame(risk_list)
+
+
+def assert_same(got, want):
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), want.reset_index(drop=True), check_dtype=False)
+
+
+def test_boundaries_match_elif_baseline():
+    # الحدود 50 و65 والتحسن صفر وقيم مفقودة
+    df = pd.DataFrame({
+        "student": [f"طالب {i}" for i in range(10)],
+        "best_accuracy": 100.0,
+        "last_accuracy": [49.9, 50.0, 50.0, 64.9, 65.0, 60.0, np.nan, 55.0, 0.0, 100.0],
+        "improvement_pct": [10.0, -0.1, 0.0, -20.0, -20.0, np.nan, -5.0, -40.0, -100.0, -5.0],
+        "avg_time_sec": 60.0,
+    })
+    assert_same(risk_rules.evaluate(df), baseline_risk_students(df))
+
+
+def test_random_summary_matches_elif_baseline():
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame({
+        "student": [f"s{i}" for i in range(n)],
+        "best_accuracy": 100.0,
+        "last_accuracy": rng.choice([0, 20, 40, 50, 60, 64.9, 65, 80, 100], n).astype(float),
+        "improvement_pct": rng.choice([-60, -20, -1, 0, 20, 60], n).astype(float),
+        "avg_time_sec": rng.uniform(10, 300, n),
+    })
+    assert_same(risk_rules.evaluate(df), baseline_risk_students(df))
+
+
+def test_nobody_at_risk():
+    df = pd.DataFrame({"student": ["أ", "ب"], "last_accuracy": [90.0, 70.0], "improvement_pct": [-10.0, 5.0]})
+    assert risk_rules.evaluate(df).empty and baseline_risk_students(df).empty
+    assert risk_rules.evaluate(pd.DataFrame()).empty
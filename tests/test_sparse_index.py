@@ -0,0 +1,53 @@
+"""بحث MaxScore في InvertedIndex مقابل top-k بجيب التمام الكامل (matrix @ q.T)."""
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from sparse_index import InvertedIndex
+
+
+def random_tfidf(rng, n_rows, n_terms, density):
+    m = sparse.random(n_rows, n_terms, density=density, format="csr", random_state=rng, dtype=np.float64)
+    return normalize(m)  # صفوف بطول 1 كما يخرجها TfidfVectorizer
+
+
+def assert_matches_brute_force(matrix, queries, top_k, rows=None):
+    start, end = rows if rows is not None else (0, matrix.shape[0])
+    index = InvertedIndex.from_matrix(matrix)
+    scores, indices = index.search_batch(queries, top_k, rows)
+    full = (matrix @ queries.T).toarray().T  # (استعلامات × فقرات)
+    for r in range(queries.shape[0]):
+        sims = full[r, start:end]
+        positive = np.sort(sims[sims > 0])[::-1][:top_k]
+        found = indices[r] >= 0
+        # عدد النتائج = عدد الفقرات المشتركة بمصطلح (بحد top_k)، والدرجات هي أعلى درجات جيب التمام
+        assert found.sum() == len(positive)
+        np.testing.assert_allclose(scores[r, found], positive, rtol=1e-5, atol=1e-6)
+        # كل فقرة معادة داخل الشريحة ودرجتها هي جيب تمامها فعلاً
+        ids = indices[r, found]
+        assert ((ids >= start) & (ids < end)).all()
+        np.testing.assert_allclose(full[r, ids], scores[r, found], rtol=1e-5, atol=1e-6)
+        assert (np.diff(scores[r, found]) <= 0).all()
+
+
+def test_maxscore_matches_brute_force_top_k():
+    rng = np.random.default_rng(3)
+    matrix = random_tfidf(rng, 400, 300, 0.03)
+    queries = random_tfidf(rng, 30, 300, 0.02)
+    for top_k in (1, 2, 5, 20):
+        assert_matches_brute_force(matrix, queries, top_k)
+
+
+def test_maxscore_within_row_slice():
+    rng = np.random.default_rng(4)
+    matrix = random_tfidf(rng, 400, 300, 0.03)
+    queries = random_tfidf(rng, 30, 300, 0.02)
+    for rows in ((0, 50), (120, 260), (399, 400)):
+        assert_matches_brute_force(matrix, queries, 3, rows)
+
+
+def test_empty_query_returns_no_results():
+    rng = np.random.default_rng(5)
+    index = InvertedIndex.from_matrix(random_tfidf(rng, 50, 40, 0.1))
+    scores, indices = index.search_batch(sparse.csr_matrix((2, 40)), top_k=3)
+    assert (indices == -1).all() and (scores == 0).all()